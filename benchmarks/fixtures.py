@@ -0,0 +1,102 @@
+"""Synthetic inputs and stand-in clients for the offline benchmarks"""
+import io
+import random
+from types import SimpleNamespace
+from typing import Dict, List
+
+_WORDS = (
+    "account billing call customer plan support number agent refund order delivery "
+    "invoice upgrade minutes voice message policy contract device network service "
+    "schedule hours office team product feature price discount renewal warranty"
+).split()
+
+
+def synthetic_text(size: int, seed: int = 7) -> str:
+    """Deterministic prose of exactly `size` characters, in 6-24 word sentences"""
+    rng = random.Random(seed)
+    sentences = []
+    length = 0
+    while length < size:
+        words = rng.choices(_WORDS, k=rng.randint(6, 24))
+        sentence = " ".join(words).capitalize() + rng.choice([".", ".", ".", "?", "!"])
+        sentences.append(sentence)
+        length += len(sentence) + 1
+    return " ".join(sentences)[:size]
+
+
+def _pdf_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def synthetic_pdf(pages: int, chars_per_page: int = 3000, seed: int = 7) -> bytes:
+    """A minimal text PDF with `pages` pages of synthetic prose"""
+    text = synthetic_text(pages * chars_per_page, seed)
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_ids = []
+    for page in range(pages):
+        page_text = text[page * chars_per_page:(page + 1) * chars_per_page]
+        lines = [page_text[i:i + 90] for i in range(0, len(page_text), 90)]
+        stream = "BT /F1 9 Tf 11 TL 40 800 Td " + " ".join(f"({_pdf_escape(line)}) '" for line in lines) + " ET"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        content_id = len(objects)
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {content_id} 0 R >>"
+        )
+        page_ids.append(len(objects))
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(f'{i} 0 R' for i in page_ids)}] /Count {pages} >>"
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1"))
+    xref = out.tell()
+    out.write(f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("latin-1"))
+    for offset in offsets:
+        out.write(f"{offset:010d} 00000 n \n".encode("latin-1"))
+    out.write(f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("latin-1"))
+    return out.getvalue()
+
+
+def search_hits(count: int, chunk_size: int = 1000, overlap: int = 200, seed: int = 7) -> List[SimpleNamespace]:
+    """Vector store hits shaped like Qdrant's ScoredPoint, best first
+
+    Hits come from consecutive chunks of one document so that context
+    assembly has real chunking overlap and adjacency to deal with.
+    """
+    from vectordb_files.pre_pocess import chunk_text
+    chunks = chunk_text(synthetic_text(count * chunk_size, seed), chunk_size=chunk_size, overlap=overlap)
+    rng = random.Random(seed)
+    scores = sorted((rng.uniform(0.75, 0.92) for _ in chunks), reverse=True)
+    return [
+        SimpleNamespace(id=f"point-{i}", score=score, payload={
+            "text": chunk, "username": "bench", "filename": "bench.pdf",
+            "document_id": "bench-doc", "chunk_index": i, "created_at": "2025-01-01T00:00:00"
+        })
+        for i, (chunk, score) in enumerate(zip(chunks, scores))
+    ]
+
+
+class StubVectorStore:
+    """Returns canned hits instantly, so only our own formatting is timed"""
+
+    def __init__(self, hits: List[SimpleNamespace]):
+        self.hits = hits
+
+    async def search(self, query_embedding, username=None, limit=5, score_threshold=None):
+        return self.hits[:limit]
+
+
+class StubRequest:
+    """The parts of a Starlette request the TwiML handlers use"""
+
+    def __init__(self, form: Dict[str, str]):
+        self._form = form
+
+    async def form(self):
+        return self._form
+
+    def url_for(self, name: str, **params) -> str:
+        return f"https://bench.example.com/api/voice/{name}"
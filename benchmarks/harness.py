@@ -0,0 +1,147 @@
+"""Timing, baseline files and regression comparison for the benchmark suite"""
+import gc
+import json
+import time
+import asyncio
+import inspect
+import platform
+import statistics
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+BASELINE_VERSION = 1
+
+
+@dataclass(slots=True)
+class Benchmark:
+    name: str
+    func: Callable[[], Any]
+    group: str
+
+
+_registry: List[Benchmark] = []
+
+
+def benchmark(name: str, group: str):
+    """Register a zero-argument function (sync or async) as a benchmark"""
+    def register(func):
+        _registry.append(Benchmark(name=name, func=func, group=group))
+        return func
+    return register
+
+
+def registered(pattern: Optional[str] = None) -> List[Benchmark]:
+    return [b for b in _registry if not pattern or pattern in b.name]
+
+
+async def _call(func: Callable[[], Any]):
+    result = func()
+    if inspect.isawaitable(result):
+        await result
+
+
+async def _time_round(func: Callable[[], Any], iterations: int) -> float:
+    started = time.perf_counter()
+    for _ in range(iterations):
+        await _call(func)
+    return (time.perf_counter() - started) / iterations
+
+
+async def _measure(bench: Benchmark, rounds: int, round_seconds: float) -> Dict[str, Any]:
+    # One untimed call to warm caches and lazy imports, then size rounds to round_seconds
+    started = time.perf_counter()
+    await _call(bench.func)
+    estimate = max(time.perf_counter() - started, 1e-7)
+    iterations = max(1, int(round_seconds / estimate))
+    await _time_round(bench.func, iterations)
+
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        samples = [await _time_round(bench.func, iterations) for _ in range(rounds)]
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    return {
+        "group": bench.group,
+        "median_seconds": statistics.median(samples),
+        "min_seconds": min(samples),
+        "stdev_seconds": statistics.stdev(samples) if len(samples) > 1 else 0.0,
+        "rounds": rounds,
+        "iterations": iterations
+    }
+
+
+def run_benchmarks(benchmarks: List[Benchmark], rounds: int, round_seconds: float,
+                   on_result: Callable[[str, Dict[str, Any]], None] = None) -> Dict[str, Dict[str, Any]]:
+    """Time each benchmark: per-call seconds over `rounds` rounds of auto-sized iterations"""
+    async def run_all():
+        results = {}
+        for bench in benchmarks:
+            results[bench.name] = await _measure(bench, rounds, round_seconds)
+            if on_result:
+                on_result(bench.name, results[bench.name])
+        return results
+    return asyncio.run(run_all())
+
+
+def environment(extra: Dict[str, Any] = None) -> Dict[str, Any]:
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "machine": platform.machine(),
+        "system": platform.system(),
+        "processor": platform.processor(),
+        **(extra or {})
+    }
+
+
+def save_baseline(path: str, results: Dict[str, Dict[str, Any]], env: Dict[str, Any]):
+    with open(path, "w") as f:
+        json.dump({
+            "version": BASELINE_VERSION,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "environment": env,
+            "results": results
+        }, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def load_baseline(path: str) -> Dict[str, Any]:
+    with open(path) as f:
+        baseline = json.load(f)
+    if baseline.get("version") != BASELINE_VERSION:
+        raise ValueError(f"{path}: unsupported baseline version {baseline.get('version')}")
+    return baseline
+
+
+def compare(baseline: Dict[str, Dict[str, Any]], current: Dict[str, Dict[str, Any]], threshold_percent: float) -> List[Dict[str, Any]]:
+    """Compare median per-call times; a change beyond the threshold is a regression or improvement"""
+    rows = []
+    for name in sorted(set(baseline) | set(current)):
+        if name not in current:
+            rows.append({"name": name, "status": "missing"})
+            continue
+        if name not in baseline:
+            rows.append({"name": name, "status": "new", "current_seconds": current[name]["median_seconds"]})
+            continue
+        before = baseline[name]["median_seconds"]
+        after = current[name]["median_seconds"]
+        change = (after - before) / before * 100 if before else 0.0
+        if change > threshold_percent:
+            status = "regressed"
+        elif change < -threshold_percent:
+            status = "improved"
+        else:
+            status = "ok"
+        rows.append({"name": name, "status": status, "baseline_seconds": before,
+                     "current_seconds": after, "change_percent": round(change, 1)})
+    return rows
+
+
+def format_seconds(seconds: float) -> str:
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.2f}{unit}"
+    return f"{seconds / 1e-9:.0f}ns"
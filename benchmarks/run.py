@@ -0,0 +1,97 @@
+"""Run the offline benchmark suite, save a baseline, or gate on regressions
+
+    python -m benchmarks.run                       # print timings
+    python -m benchmarks.run --save                # write benchmarks/baseline.json
+    python -m benchmarks.run --compare --threshold 15
+    python -m benchmarks.run -k chunk_text --compare other.json
+
+--compare exits with status 1 if any benchmark's median per-call time grew
+by more than --threshold percent. Baselines are only comparable on the same
+machine and Python version; record one before a change and compare after.
+"""
+import os
+import sys
+import json
+import logging
+import argparse
+import tempfile
+from pathlib import Path
+
+# Everything runs in-process: no API keys, vector store or on-disk caches needed
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark-offline")
+os.environ.setdefault("CALL_STATE_BACKEND", "memory")
+os.environ.setdefault("VECTOR_STORE_BACKEND", "local")
+os.environ.setdefault("LOCAL_VECTOR_STORE_PATH", tempfile.mkdtemp(prefix="bench-vectors-"))
+os.environ.setdefault("TTS_CACHE_DIR", tempfile.mkdtemp(prefix="bench-tts-"))
+
+DEFAULT_BASELINE = str(Path(__file__).parent / "baseline.json")
+DEFAULT_THRESHOLD = float(os.getenv("BENCH_REGRESSION_THRESHOLD", "10"))
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Offline microbenchmarks for the voice bot hot paths")
+    parser.add_argument("-k", "--filter", default=None, help="Only run benchmarks whose name contains this")
+    parser.add_argument("--rounds", type=int, default=7, help="Timed rounds per benchmark (median is reported)")
+    parser.add_argument("--round-seconds", type=float, default=0.2, help="Target duration of one round")
+    parser.add_argument("--save", nargs="?", const=DEFAULT_BASELINE, default=None, metavar="PATH",
+                        help=f"Write results as a baseline (default {DEFAULT_BASELINE})")
+    parser.add_argument("--compare", nargs="?", const=DEFAULT_BASELINE, default=None, metavar="PATH",
+                        help="Compare against a baseline and fail on regressions")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Allowed slowdown in percent before --compare fails")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON instead of a table")
+    args = parser.parse_args(argv)
+
+    # Handlers log every call at INFO; keep that I/O out of the timings
+    logging.disable(logging.INFO)
+
+    from benchmarks import suite  # noqa: F401  registers the benchmarks
+    from benchmarks.harness import (
+        registered, run_benchmarks, environment, save_baseline, load_baseline, compare, format_seconds
+    )
+    from services.tokens import get_encoding
+
+    benchmarks = registered(args.filter)
+    if not benchmarks:
+        print(f"No benchmarks match {args.filter!r}", file=sys.stderr)
+        return 2
+
+    baseline = load_baseline(args.compare) if args.compare else None
+    # Token counts fall back to an estimate without the tiktoken encoding, which changes timings
+    env = environment({"tokenizer": "tiktoken" if get_encoding() is not None else "estimate"})
+    if baseline and baseline.get("environment", {}) != env:
+        print(f"warning: baseline was recorded in a different environment: {baseline.get('environment')}", file=sys.stderr)
+
+    def report(name, result):
+        if not args.json:
+            print(f"{name:<36} {format_seconds(result['median_seconds']):>10} median "
+                  f"{format_seconds(result['min_seconds']):>10} min  x{result['iterations']}")
+
+    results = run_benchmarks(benchmarks, args.rounds, args.round_seconds, on_result=report)
+    if args.json:
+        print(json.dumps(results, indent=2, sort_keys=True))
+
+    if args.save:
+        save_baseline(args.save, results, env)
+        print(f"Saved baseline to {args.save}")
+
+    if baseline is None:
+        return 0
+    # Only benchmarks that ran are compared, so -k can gate a subset
+    rows = compare({k: v for k, v in baseline["results"].items() if k in results}, results, args.threshold)
+    print(f"\nCompared with {args.compare} (threshold {args.threshold:g}%)")
+    for row in rows:
+        if "change_percent" in row:
+            print(f"{row['name']:<36} {format_seconds(row['baseline_seconds']):>10} -> "
+                  f"{format_seconds(row['current_seconds']):>10} {row['change_percent']:+7.1f}%  {row['status']}")
+        else:
+            print(f"{row['name']:<36} {row['status']}")
+    regressed = [row["name"] for row in rows if row["status"] == "regressed"]
+    if regressed:
+        print(f"\n{len(regressed)} benchmark(s) regressed by more than {args.threshold:g}%: {', '.join(regressed)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,126 @@
+"""Benchmarks for the hot paths of a call turn and of ingestion
+
+Network clients are replaced with in-process stand-ins, so only our own code
+is timed: chunking, PDF text extraction, TwiML construction in the webhook
+handlers, search result formatting and RAG context assembly.
+"""
+import io
+from benchmarks.fixtures import StubRequest, StubVectorStore, search_hits, synthetic_pdf, synthetic_text
+from benchmarks.harness import benchmark
+from services import call_logic
+from vectordb_files import pre_pocess
+
+QUERY_EMBEDDING = [0.01] * 1536
+
+CALL_FORM = {"CallSid": "CAbench", "From": "+15550000001", "To": "+15550000002", "Direction": "inbound"}
+
+
+class _NoAnswerCache:
+    def generation(self, tenant):
+        return 0
+
+    def lookup(self, tenant, embedding):
+        return None
+
+    def store(self, *args, **kwargs):
+        pass
+
+
+class _TwilioClient:
+    username = "ACbench"
+    password = "bench"
+
+
+async def _stub_download(recording_url, auth):
+    return io.BytesIO(b"RIFF")
+
+
+async def _stub_transcribe(audio_file, call_sid=None, direction=None):
+    return "What are your support hours on weekends?"
+
+
+async def _stub_answer(message_text, tenant=None, timings=None):
+    return "Our support team is available from nine to five on Saturdays and Sundays."
+
+
+async def _stub_embed(query):
+    return QUERY_EMBEDDING
+
+
+async def _stub_generate(messages, model=None, temperature=None):
+    return "Our support team is available from nine to five on weekends.", {}
+
+
+def install_stubs():
+    """Swap network clients for canned responses"""
+    pre_pocess.vector_store = StubVectorStore(search_hits(20))
+    pre_pocess.embed_query_cached = _stub_embed
+    pre_pocess.generate_text = _stub_generate
+    pre_pocess.answer_cache = _NoAnswerCache()
+    call_logic.download_recording = _stub_download
+    call_logic.transcribe_audio = _stub_transcribe
+    call_logic.get_response_for_message = _stub_answer
+    call_logic.get_twilio_client = lambda: _TwilioClient()
+
+
+install_stubs()
+
+
+# chunk_text on documents of increasing size
+for _size, _label in ((10_000, "10KB"), (100_000, "100KB"), (1_000_000, "1MB")):
+    def _chunk(text=synthetic_text(_size)):
+        pre_pocess.chunk_text(text, chunk_size=1000, overlap=200)
+    benchmark(f"chunk_text[{_label}]", group="ingestion")(_chunk)
+
+
+# extract_text_from_pdf on generated PDFs
+for _pages in (5, 50):
+    def _extract(pdf=synthetic_pdf(_pages)):
+        pre_pocess.extract_text_from_pdf(pdf)
+    benchmark(f"extract_text_from_pdf[{_pages}p]", group="ingestion")(_extract)
+
+
+# TwiML construction in the webhook handlers
+@benchmark("twiml.incoming", group="twiml")
+async def _incoming():
+    await call_logic.handle_incoming_call_logic(StubRequest(CALL_FORM))
+
+
+@benchmark("twiml.outbound", group="twiml")
+async def _outbound():
+    await call_logic.handle_outbound_call_logic(StubRequest({**CALL_FORM, "Direction": "outbound-api"}))
+
+
+@benchmark("twiml.continue", group="twiml")
+async def _continue():
+    await call_logic.handle_continue_logic(StubRequest({**CALL_FORM, "Digits": "1"}))
+
+
+@benchmark("twiml.process_recording", group="twiml")
+async def _process_recording():
+    await call_logic.process_recording_logic(StubRequest({
+        **CALL_FORM, "RecordingUrl": "https://api.twilio.com/recording", "RecordingDuration": "4"
+    }))
+
+
+# Result formatting in search_document_vector_db
+for _limit in (5, 20):
+    async def _search(limit=_limit):
+        await pre_pocess.search_document_vector_db(
+            "support hours", "bench", limit, 0.2, query_embedding=QUERY_EMBEDDING
+        )
+    benchmark(f"search_document_vector_db[{_limit}]", group="rag")(_search)
+
+
+# Context assembly in rag_qna_chatbot: select, dedupe and pack retrieved chunks
+@benchmark("rag_context", group="rag")
+async def _rag_context():
+    await pre_pocess._prepare_rag_context(
+        "support hours", "bench", pre_pocess.RAG_MAX_CHUNKS, 0.2, pre_pocess.RAG_CONTEXT_MAX_TOKENS,
+        query_embedding=QUERY_EMBEDDING
+    )
+
+
+@benchmark("rag_qna_chatbot", group="rag")
+async def _rag_qna_chatbot():
+    await pre_pocess.rag_qna_chatbot("What are your support hours?", username="bench")
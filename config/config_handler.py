@@ -1,16 +1,9 @@
-import json
-import os
-
-CONFIG_PATH = "twilio_config.json"
+from config.twilio_config_handler import load_twilio_config, save_twilio_config
 
 def load_config() -> dict:
-    """Load credentials from the JSON file"""
-    if os.path.exists(CONFIG_PATH):
-        with open(CONFIG_PATH, "r") as f:
-            return json.load(f)
-    return {}
+    """Load credentials from the shared in-memory config"""
+    return load_twilio_config()
 
 def save_config(data: dict):
     """Save credentials to the JSON file"""
-    with open(CONFIG_PATH, "w") as f:
-        json.dump(data, f, indent=4)
+    save_twilio_config(data)
@@ -1,16 +1,87 @@
+import os
 import json
+import time
+import tempfile
+import threading
 from pathlib import Path
 
 # CONFIG_PATH = 'C:\\python\\task\\twillo\\twilio_config.json' #Path(__file__).parent / "twilio_config.json"
 CONFIG_PATH = Path(__file__).parent.parent / "twilio_config.json"
+# Minimum seconds between checks of the file's mtime for edits made outside the app
+CONFIG_RELOAD_CHECK_SECONDS = float(os.getenv("CONFIG_RELOAD_CHECK_SECONDS", "1"))
+
+
+class ConfigProvider:
+    """In-memory copy of a JSON config file, reloaded when the file changes
+
+    Reads are served from memory; the file is only re-parsed when its mtime
+    or size differs from the last load. `version` increases on every change
+    so dependents (e.g. the Twilio client) can tell when to rebuild.
+    """
+
+    def __init__(self, path: Path, check_interval: float = CONFIG_RELOAD_CHECK_SECONDS):
+        self.path = Path(path)
+        self.check_interval = check_interval
+        self.version = 0
+        self._config: dict = {}
+        self._signature = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def _file_signature(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _reload_if_changed(self):
+        now = time.monotonic()
+        if self.version and now - self._checked_at < self.check_interval:
+            return
+        with self._lock:
+            self._checked_at = now
+            signature = self._file_signature()
+            if self.version and signature == self._signature:
+                return
+            config = {}
+            if signature is not None:
+                with open(self.path, "r") as f:
+                    config = json.load(f)
+            self._config = config
+            self._signature = signature
+            self.version += 1
+
+    def get(self) -> dict:
+        """Return a copy of the current config"""
+        self._reload_if_changed()
+        return dict(self._config)
+
+    def save(self, config: dict):
+        """Write the config atomically and make it current immediately"""
+        with self._lock:
+            fd, tmp_path = tempfile.mkstemp(dir=self.path.parent, prefix=f".{self.path.name}.", suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w") as f:
+                    json.dump(config, f, indent=4)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.path)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+            self._config = dict(config)
+            self._signature = self._file_signature()
+            self._checked_at = time.monotonic()
+            self.version += 1
+
+
+twilio_config_provider = ConfigProvider(CONFIG_PATH)
 
 
 def load_twilio_config() -> dict:
-    # if CONFIG_PATH.exists():
-    with open(CONFIG_PATH, "r") as f:
-        return json.load(f)
-    return {}
+    return twilio_config_provider.get()
 
 def save_twilio_config(config: dict) -> None:
-    with open(CONFIG_PATH, "w") as f:
-        json.dump(config, f, indent=4)
+    twilio_config_provider.save(config)
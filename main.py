@@ -1,6 +1,14 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse
 from routes.twilo_talk import router as api_router
 from routes.config_twilio import config_router as config_router
+from vectordb_files.ingestion import shutdown_process_pool
+from vectordb_files.pre_pocess import vector_store
+from services.http_client import close_http_client
+from services.twilio_client import close_twilio_client
+from services.warmup import warm_up, warm_prompt_audio, readiness, is_ready
 
 
 tags_metadata = [
@@ -13,11 +21,28 @@ tags_metadata = [
         "description": "Test APIs related to Twilio functionality",
     },
 ]
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Set up the vector store and warm connections once, in the background;
+    # /ready reports 503 until this has finished
+    warmup_task = asyncio.create_task(warm_up())
+    prompt_audio_task = asyncio.create_task(warm_prompt_audio())
+    yield
+    warmup_task.cancel()
+    prompt_audio_task.cancel()
+    # Stop PDF worker processes and close pooled connections with the app
+    shutdown_process_pool()
+    await close_http_client()
+    await close_twilio_client()
+    await vector_store.close()
+
 # Initialize FastAPI app
 app = FastAPI(
     title="Twilio Voice Bot API",
     description="A Twilio voice bot with RAG integration",
-    openapi_tags=tags_metadata
+    openapi_tags=tags_metadata,
+    lifespan=lifespan
 )
 
 # Include the routes
@@ -28,6 +53,11 @@ app.include_router(config_router, prefix="/config")
 def root():
     return {"message": "Welcome to the main FastAPI app"}
 
+@app.get("/ready")
+def ready():
+    """Readiness probe: 200 once warm-up has finished, 503 while still cold"""
+    return JSONResponse(status_code=200 if is_ready() else 503, content=readiness)
+
 
 if __name__ == "__main__":
     import uvicorn
@@ -3,6 +3,7 @@ from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
 from twilio.rest import Client
 from config.config_handler import load_config, save_config
+from services.twilio_client import TwilioHttpxClient
 from fastapi import APIRouter
 from fastapi import Form
 from fastapi import Request
@@ -16,25 +17,25 @@ logger = logging.getLogger(__name__)
 
 config_router = APIRouter()
 
-# Load current config
-current_config = load_config()
-
 templates = Jinja2Templates(directory=os.path.join(os.path.dirname(__file__), '..', 'templates'))
 
-def validate_twilio_credentials(account_sid: str, auth_token: str) -> str:
+async def validate_twilio_credentials(account_sid: str, auth_token: str) -> str:
     """Check if Twilio credentials are valid by fetching account info"""
+    http_client = TwilioHttpxClient()
     try:
-        client = Client(account_sid, auth_token)
-        account = client.api.accounts(account_sid).fetch()
+        client = Client(account_sid, auth_token, http_client=http_client)
+        account = await client.api.accounts(account_sid).fetch_async()
         return account.friendly_name
     except Exception as e:
         logger.error(f"Twilio credential validation failed: {e}")
         raise HTTPException(status_code=400, detail="Invalid Twilio credentials.")
+    finally:
+        await http_client.close()
 
 @config_router.get("/twilio-config", tags=["Config twilio Credentials"])
 def get_config():
     """Return the currently stored Twilio configuration (safe fields only)"""
-    safe_config = {k: v for k, v in current_config.items() if "TOKEN" not in k}
+    safe_config = {k: v for k, v in load_config().items() if "TOKEN" not in k}
     return safe_config
 
 @config_router.get("/twilio-config-form", response_class=HTMLResponse)
@@ -43,7 +44,7 @@ def twilio_config_form(request: Request, message: str = None, error: str = None)
         "request": request,
         "message": message,
         "error": error,
-        "config": current_config
+        "config": load_config()
     })
 
 @config_router.post("/twilio-config-form", response_class=HTMLResponse)
@@ -55,9 +56,11 @@ async def twilio_config_form_post(
     webhook_url: str = Form(...)
 ):
     try:
-        friendly_name = validate_twilio_credentials(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
-        global current_config
+        friendly_name = await validate_twilio_credentials(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
+        # Keep settings the form doesn't edit, such as the number -> tenant map;
+        # the Twilio client is rebuilt with the new credentials on its next use
         current_config = {
+            **load_config(),
             "TWILIO_ACCOUNT_SID": TWILIO_ACCOUNT_SID,
             "TWILIO_AUTH_TOKEN": TWILIO_AUTH_TOKEN,
             "TWILIO_PHONE_NUMBER": TWILIO_PHONE_NUMBER,
@@ -76,5 +79,5 @@ async def twilio_config_form_post(
             "request": request,
             "message": None,
             "error": e.detail,
-            "config": current_config
+            "config": load_config()
         })
\ No newline at end of file
@@ -1,5 +1,6 @@
 import os
 import io
+import time
 import logging
 from fastapi import Request, HTTPException, Form
 from fastapi.responses import Response, HTMLResponse
@@ -8,7 +9,6 @@ from twilio.rest import Client
 from twilio.twiml.voice_response import VoiceResponse
 from openai import OpenAI
 from langchain_openai import OpenAIEmbeddings
-from qdrant_client import QdrantClient
 import requests
 import logging
 from dotenv import load_dotenv
@@ -18,7 +18,9 @@ from fastapi import HTTPException
 from twilio.rest import Client
 from config.config_handler import load_config
 from vectordb_files.utils import text_to_speech , get_response_for_message
-from vectordb_files.pre_pocess import rag_qna_chatbot,extract_text_from_pdf, chunk_text,initialize_qdrant,store_chunks_in_qdrant,search_document_vector_db,TTS_response
+from vectordb_files.pre_pocess import rag_qna_chatbot,extract_text_from_pdf, chunk_text,initialize_qdrant,store_chunks_in_qdrant,search_document_vector_db,vector_store_health,query_embedding_cache
+from vectordb_files.ingestion import spool_upload_to_tempfile, stream_pdf_chunks, extract_pages_in_pool, chunk_pages_in_thread
+from vectordb_files.chunker import CHUNK_UNITS
 from fastapi import FastAPI, Request, HTTPException, File, UploadFile, Form
 
 
@@ -38,28 +40,28 @@ embedding_model = OpenAIEmbeddings(model='text-embedding-ada-002', api_key=opena
 QDRANT_HOST = os.getenv("QDRANT_HOST", "localhost")
 QDRANT_PORT = int(os.getenv("QDRANT_PORT", "6333"))
 COLLECTION_NAME = "task_pdf_documents"
-qdrant_client = QdrantClient(host=QDRANT_HOST, port=QDRANT_PORT)
-
-# Load config from JSON
-twilio_config = load_twilio_config()
-
-TWILIO_ACCOUNT_SID = twilio_config.get("TWILIO_ACCOUNT_SID")
-TWILIO_AUTH_TOKEN = twilio_config.get("TWILIO_AUTH_TOKEN")
-TWILIO_PHONE_NUMBER = twilio_config.get("TWILIO_PHONE_NUMBER")
-webhook_url =  twilio_config.get("webhook_url")
 
 # [Refactored: All business logic, setup, and utility functions have been moved to the 'services' package.]
 # Only FastAPI route definitions and request/response handling remain here, importing from services.
 
-from fastapi import APIRouter, Request, HTTPException, Form
-from fastapi.responses import Response, HTMLResponse
+from fastapi import APIRouter, Request, HTTPException, Form, WebSocket
+from fastapi.responses import Response, HTMLResponse, FileResponse
 from fastapi.templating import Jinja2Templates
 from services.twilio_client import (
-    twilio_client, TWILIO_PHONE_NUMBER, validate_twilio_credentials, list_phone_numbers_service, setup_webhook_service, get_webhook_info_service, test_twilio_auth_service
+    get_twilio_client, get_twilio_phone_number, validate_twilio_credentials, list_phone_numbers_service, setup_webhook_service, get_webhook_info_service, test_twilio_auth_service, get_twilio_api_stats
 )
 from services.openai_client import openai_api_key
+from services.stt_service import get_stt_stats
+from services.llm_service import get_llm_stats
+from services.answer_cache import answer_cache
+from services.faq import faq_store, parse_entries
+from services.call_state import call_state_store
+from services.campaign import campaign_manager, parse_numbers
+from services.media_stream import MediaStreamSession, get_media_stream_stats
+from services.tts_service import tts_cache
+from services.metrics import registry, ingestion_stage_seconds, ingestion_errors_total, PROMETHEUS_CONTENT_TYPE
 from services.call_logic import (
-    handle_incoming_call_logic, process_recording_logic, handle_continue_logic, handle_transcription_logic, make_outbound_call_logic, handle_outbound_call_logic, make_interactive_call_logic
+    handle_incoming_call_logic, process_recording_logic, handle_continue_logic, handle_transcription_logic, handle_call_status_logic, make_outbound_call_logic, handle_outbound_call_logic, make_interactive_call_logic
 )
 import os
 
@@ -68,11 +70,36 @@ templates = Jinja2Templates(directory=os.path.join(os.path.dirname(__file__), '.
 
 @router.get("/")
 async def root():
-    return {"status": "Twilio Voice Bot is running", "bot_name": "RAG_Voice_Bot", "version": "1.0.0", "twilio_number": TWILIO_PHONE_NUMBER}
+    return {"status": "Twilio Voice Bot is running", "bot_name": "RAG_Voice_Bot", "version": "1.0.0", "twilio_number": get_twilio_phone_number()}
 
 @router.get("/health")
 async def health_check():
-    return {"status": "healthy", "twilio_configured": bool(twilio_client), "openai_configured": bool(openai_api_key)}
+    return {"status": "healthy", "twilio_configured": bool(load_twilio_config().get("TWILIO_ACCOUNT_SID")), "openai_configured": bool(openai_api_key), "vector_store": await vector_store_health()}
+
+@router.get("/metrics")
+async def metrics():
+    """Prometheus scrape endpoint for per-stage call and ingestion latencies"""
+    return Response(content=registry.render(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+@router.get("/stt_stats")
+async def stt_stats():
+    return get_stt_stats()
+
+@router.get("/llm_stats")
+async def llm_stats():
+    return get_llm_stats()
+
+@router.get("/twilio_stats")
+async def twilio_stats():
+    return get_twilio_api_stats()
+
+@router.get("/cache_stats")
+async def cache_stats():
+    return {"query_embeddings": query_embedding_cache.stats(), "answers": answer_cache.stats(), "tts_audio": tts_cache.stats()}
+
+@router.get("/call_state_stats")
+async def call_state_stats():
+    return await call_state_store.stats()
 
 @router.post("/voice/incoming", tags=["twilio test apis"])
 async def handle_incoming_call(request: Request):
@@ -90,6 +117,27 @@ async def handle_continue(request: Request):
 async def handle_transcription(request: Request):
     return await handle_transcription_logic(request)
 
+@router.websocket("/voice/media_stream")
+async def media_stream(websocket: WebSocket):
+    """Twilio Media Streams endpoint for the real-time voice pipeline (<Connect><Stream>)"""
+    await MediaStreamSession(websocket).run()
+
+@router.get("/media_stream_stats")
+async def media_stream_stats():
+    return get_media_stream_stats()
+
+@router.get("/tts/{filename}")
+async def get_tts_audio(filename: str):
+    """Serve cached prompt audio for TwiML <Play>"""
+    path = tts_cache.path_for(filename)
+    if path is None or not path.exists():
+        raise HTTPException(status_code=404, detail="Audio not found")
+    return FileResponse(path, media_type="audio/mpeg", headers={"Cache-Control": "public, max-age=31536000, immutable"})
+
+@router.post("/voice/status")
+async def handle_call_status(request: Request):
+    return await handle_call_status_logic(request)
+
 @router.post("/make_call", tags=["twilio test apis"])
 async def make_outbound_call(phone_number: str, message: str = None, interactive: bool = False):
     return await make_outbound_call_logic(phone_number, message, interactive)
@@ -116,30 +164,169 @@ async def make_interactive_call_form_post(request: Request, phone_number: str =
     except Exception as e:
         return templates.TemplateResponse("make_interactive_call.html", {"request": request, "message": None, "error": f"Failed to make interactive call: {str(e)}", "phone_number": phone_number, "initial_message": initial_message})
 
+@router.post("/campaigns", tags=["twilio test apis"])
+async def create_campaign(
+    file: UploadFile = File(None),
+    numbers: str = Form(None),
+    message: str = Form(None),
+    interactive: bool = Form(False),
+    name: str = Form(None)
+):
+    """Start a bulk outbound campaign from a CSV/JSON file or a JSON/comma separated list of numbers"""
+    try:
+        if file is not None:
+            phone_numbers = parse_numbers(await file.read(), file.filename or "")
+        elif numbers:
+            phone_numbers = parse_numbers(numbers.encode())
+        else:
+            raise HTTPException(status_code=400, detail="Provide a numbers file or a numbers field")
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Could not parse phone numbers: {str(e)}")
+    campaign = campaign_manager.create(phone_numbers, message, interactive, name)
+    return campaign.progress()
+
+@router.get("/campaigns")
+async def list_campaigns():
+    return campaign_manager.stats()
+
+@router.get("/campaigns/{campaign_id}")
+async def get_campaign(campaign_id: str):
+    return campaign_manager.get(campaign_id).progress()
+
+@router.get("/campaigns/{campaign_id}/results")
+async def get_campaign_results(campaign_id: str, status: str = None, offset: int = 0, limit: int = 1000):
+    campaign = campaign_manager.get(campaign_id)
+    calls = [call for call in campaign.calls if status is None or call.status == status]
+    return {
+        "campaign_id": campaign_id,
+        "total": len(calls),
+        "offset": offset,
+        "results": [call.to_dict() for call in calls[offset:offset + limit]]
+    }
+
+@router.post("/campaigns/{campaign_id}/pause")
+async def pause_campaign(campaign_id: str):
+    campaign = campaign_manager.get(campaign_id)
+    campaign.pause()
+    return campaign.progress()
+
+@router.post("/campaigns/{campaign_id}/resume")
+async def resume_campaign(campaign_id: str):
+    campaign = campaign_manager.get(campaign_id)
+    campaign.resume()
+    return campaign.progress()
+
+@router.post("/campaigns/{campaign_id}/cancel")
+async def cancel_campaign(campaign_id: str):
+    campaign = campaign_manager.get(campaign_id)
+    campaign.cancel()
+    return campaign.progress()
+
+@router.get("/faq_stats")
+async def faq_stats():
+    return faq_store.stats()
+
+@router.get("/faq/{tenant}")
+async def list_faq_entries(tenant: str):
+    return {"tenant": tenant, "entries": faq_store.list_entries(tenant)}
+
+@router.post("/faq/{tenant}")
+async def add_faq_entries(
+    tenant: str,
+    file: UploadFile = File(None),
+    question: str = Form(None),
+    answer: str = Form(None),
+    variants: str = Form(None)
+):
+    """Seed FAQ entries from a JSON file, or add one entry (variants one per line)
+
+    Entries without an answer get one generated from the tenant's documents.
+    """
+    if file is not None:
+        try:
+            items = parse_entries(await file.read())
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f"Could not parse FAQ entries: {str(e)}")
+    elif question:
+        items = [{"question": question, "answer": answer, "variants": (variants or "").splitlines()}]
+    else:
+        raise HTTPException(status_code=400, detail="Provide an entries file or a question field")
+    added = await faq_store.add_entries(tenant, items)
+    rebuild = await faq_store.rebuild(tenant)
+    return {"tenant": tenant, "added": [faq_store.get(tenant, entry["id"]) for entry in added], "rebuild": rebuild}
+
+@router.get("/faq/{tenant}/queries")
+async def list_faq_queries(tenant: str, limit: int = 100):
+    """Most asked questions for a tenant, the input to mining"""
+    return {"tenant": tenant, "queries": faq_store.logged_queries(tenant, limit)}
+
+@router.post("/faq/{tenant}/mine")
+async def mine_faq_entries(tenant: str, min_count: int = None, max_entries: int = None):
+    """Add FAQ entries for the tenant's most frequently asked questions"""
+    return await faq_store.mine(tenant, min_count, max_entries)
+
+@router.post("/faq/{tenant}/rebuild")
+async def rebuild_faq(tenant: str):
+    """Regenerate stale generated answers and embed new questions"""
+    return await faq_store.rebuild(tenant)
+
+@router.get("/faq/{tenant}/{entry_id}")
+async def get_faq_entry(tenant: str, entry_id: str):
+    return faq_store.get(tenant, entry_id)
+
+@router.put("/faq/{tenant}/{entry_id}")
+async def update_faq_entry(
+    tenant: str,
+    entry_id: str,
+    question: str = Form(None),
+    answer: str = Form(None),
+    variants: str = Form(None),
+    regenerate: bool = Form(False)
+):
+    """Edit an entry; regenerate hands its answer back to RAG"""
+    entry = await faq_store.update(tenant, entry_id, question, answer,
+                             variants.splitlines() if variants is not None else None, regenerate)
+    rebuild = await faq_store.rebuild(tenant)
+    return {"tenant": tenant, "entry": faq_store.get(tenant, entry["id"]), "rebuild": rebuild}
+
+@router.delete("/faq/{tenant}/{entry_id}")
+async def delete_faq_entry(tenant: str, entry_id: str):
+    return await faq_store.delete(tenant, entry_id)
+
 @router.get("/setup_webhook")
-async def setup_webhook(webhook_url: str):
-    return await setup_webhook_service(webhook_url)
+async def setup_webhook(webhook_url: str, refresh: bool = False):
+    return await setup_webhook_service(webhook_url, force_refresh=refresh)
 
 @router.get("/webhook_info")
-async def get_webhook_info():
-    return await get_webhook_info_service()
+async def get_webhook_info(refresh: bool = False):
+    return await get_webhook_info_service(force_refresh=refresh)
 
 @router.get("/list_phone_numbers")
-async def list_phone_numbers():
-    return await list_phone_numbers_service()
+async def list_phone_numbers(refresh: bool = False):
+    return await list_phone_numbers_service(force_refresh=refresh)
 
 @router.get("/test_twilio_auth")
-async def test_twilio_auth():
-    return await test_twilio_auth_service()
+async def test_twilio_auth(refresh: bool = False):
+    return await test_twilio_auth_service(force_refresh=refresh)
 
 @router.post("/upload_pdf")
 async def upload_pdf(
     file: UploadFile = File(...),
     username: str = Form(...),
     chunk_size: int = Form(1000),
-    overlap: int = Form(200)
+    overlap: int = Form(200),
+    streaming: bool = Form(True),
+    chunk_unit: str = Form("chars")
 ):
-    """Upload PDF file, process it into chunks, and store in Qdrant"""
+    """Upload PDF file, process it into chunks, and store in Qdrant
+
+    In streaming mode the upload is spooled to a temp file and pages are parsed
+    and chunked lazily, with chunks embedded and stored while later pages are
+    still being read, so memory use does not grow with document size.
+    chunk_size and overlap are counted in chunk_unit: "chars" or "tokens".
+    """
     
     # Validate file type
     if not file.filename.lower().endswith('.pdf'):
@@ -147,50 +334,156 @@ async def upload_pdf(
     
     if not username or username.strip() == "":
         raise HTTPException(status_code=400, detail="Username is required")
+
+    if chunk_unit not in CHUNK_UNITS:
+        raise HTTPException(status_code=400, detail=f"chunk_unit must be one of {', '.join(CHUNK_UNITS)}")
+
+    if chunk_size < 1 or overlap < 0:
+        raise HTTPException(status_code=400, detail="chunk_size must be positive and overlap non-negative")
     
+    if streaming:
+        return await _upload_pdf_streaming(file, username, chunk_size, overlap, chunk_unit)
+
+    pdf_path = None
+    tenant = username.strip()
+    started = time.perf_counter()
     try:
-        # Read file content
-        file_content = await file.read()
+        # Spool the upload so workers can parse it by page range
+        with ingestion_stage_seconds.time(stage="spool", tenant=tenant):
+            pdf_path, file_size = await spool_upload_to_tempfile(file)
         
-        if len(file_content) == 0:
+        if file_size == 0:
             raise HTTPException(status_code=400, detail="Empty file uploaded")
         
         logger.info(f"Processing PDF: {file.filename} for user: {username}")
         
-        # Extract text from PDF
-        text = extract_text_from_pdf(file_content)
+        # Extract text from PDF in the worker pool, keeping the event loop free for calls
+        stats = {"pages": 0, "characters": 0}
+        with ingestion_stage_seconds.time(stage="extract", tenant=tenant):
+            pages = await extract_pages_in_pool(pdf_path, stats)
+        text = "\n".join(pages).strip()
         
         if not text or len(text.strip()) < 10:
             raise HTTPException(status_code=400, detail="No readable text found in PDF")
         
         # Create text chunks
-        chunks = chunk_text(text, chunk_size=chunk_size, overlap=overlap)
+        with ingestion_stage_seconds.time(stage="chunk", tenant=tenant):
+            chunks = await chunk_pages_in_thread(pages, chunk_size=chunk_size, overlap=overlap, unit=chunk_unit)
         
         if not chunks:
             raise HTTPException(status_code=400, detail="Failed to create text chunks")
         
-        # Initialize Qdrant if needed
+        # Set up once at startup; a no-op here unless warm-up has not reached it yet
         await initialize_qdrant()
         
         # Store chunks in Qdrant
-        storage_result = await store_chunks_in_qdrant(chunks, username.strip(), file.filename)
+        with ingestion_stage_seconds.time(stage="store", tenant=tenant):
+            storage_result = await store_chunks_in_qdrant(chunks, tenant, file.filename)
+        _observe_storage_batches(storage_result, tenant)
+
+        # Cached and generated FAQ answers for this tenant may no longer match its documents
+        await answer_cache.invalidate_tenant(username.strip())
+        await faq_store.documents_changed(username.strip())
         
         return {
             "status": "success",
             "message": "PDF processed and stored successfully",
             "filename": file.filename,
             "username": username,
-            "file_size_bytes": len(file_content),
+            "file_size_bytes": file_size,
+            "pages_processed": stats["pages"],
             "extracted_text_length": len(text),
             "total_chunks": len(chunks),
             "chunk_size": chunk_size,
             "overlap": overlap,
+            "chunk_unit": chunk_unit,
+            "streaming": False,
+            "reused_chunks": storage_result["reused_chunks"],
+            "reembedded_chunks": storage_result["embedded_chunks"],
+            "deleted_chunks": storage_result["deleted_chunks"],
             "storage_result": storage_result
         }
         
-    except HTTPException:
+    except HTTPException as e:
+        # Store failures surface as 500s; rejected uploads are not errors
+        if e.status_code >= 500:
+            ingestion_errors_total.inc(tenant=tenant)
         raise
     except Exception as e:
         logger.error(f"Error processing PDF upload: {e}")
+        ingestion_errors_total.inc(tenant=tenant)
         raise HTTPException(status_code=500, detail=f"Failed to process PDF: {str(e)}")
+    finally:
+        ingestion_stage_seconds.observe(time.perf_counter() - started, stage="total", tenant=tenant)
+        if pdf_path and os.path.exists(pdf_path):
+            os.remove(pdf_path)
+
+def _observe_storage_batches(storage_result: dict, tenant: str):
+    for timing in storage_result.get("batch_timings", []):
+        ingestion_stage_seconds.observe(timing["embed_seconds"], stage="embed", tenant=tenant)
+        ingestion_stage_seconds.observe(timing["upsert_seconds"], stage="upsert", tenant=tenant)
+
+async def _upload_pdf_streaming(file: UploadFile, username: str, chunk_size: int, overlap: int, chunk_unit: str):
+    """Spool an upload to disk and stream its chunks into Qdrant"""
+    pdf_path = None
+    tenant = username.strip()
+    started = time.perf_counter()
+    try:
+        with ingestion_stage_seconds.time(stage="spool", tenant=tenant):
+            pdf_path, file_size = await spool_upload_to_tempfile(file)
+
+        if file_size == 0:
+            raise HTTPException(status_code=400, detail="Empty file uploaded")
+
+        logger.info(f"Streaming PDF: {file.filename} ({file_size} bytes) for user: {username}")
+
+        # Set up once at startup; a no-op here unless warm-up has not reached it yet
+        await initialize_qdrant()
+
+        # Chunks are embedded and stored while later pages are still being parsed
+        stats = {"pages": 0, "characters": 0}
+        chunks = stream_pdf_chunks(pdf_path, chunk_size=chunk_size, overlap=overlap, stats=stats, unit=chunk_unit)
+        # Parsing and chunking overlap with storage here, so they are timed together
+        with ingestion_stage_seconds.time(stage="store", tenant=tenant):
+            storage_result = await store_chunks_in_qdrant(chunks, tenant, file.filename)
+        _observe_storage_batches(storage_result, tenant)
 
+        # Cached and generated FAQ answers for this tenant may no longer match its documents
+        await answer_cache.invalidate_tenant(username.strip())
+        await faq_store.documents_changed(username.strip())
+
+        if storage_result["chunks_stored"] == 0:
+            raise HTTPException(status_code=400, detail="No readable text found in PDF")
+
+        return {
+            "status": "success",
+            "message": "PDF processed and stored successfully",
+            "filename": file.filename,
+            "username": username,
+            "file_size_bytes": file_size,
+            "pages_processed": stats["pages"],
+            "extracted_text_length": stats["characters"],
+            "total_chunks": storage_result["chunks_stored"],
+            "chunk_size": chunk_size,
+            "overlap": overlap,
+            "chunk_unit": chunk_unit,
+            "streaming": True,
+            "reused_chunks": storage_result["reused_chunks"],
+            "reembedded_chunks": storage_result["embedded_chunks"],
+            "deleted_chunks": storage_result["deleted_chunks"],
+            "storage_result": storage_result
+        }
+
+    except HTTPException as e:
+        # Store failures surface as 500s; rejected uploads are not errors
+        if e.status_code >= 500:
+            ingestion_errors_total.inc(tenant=tenant)
+        raise
+    except Exception as e:
+        logger.error(f"Error processing PDF upload: {e}")
+        ingestion_errors_total.inc(tenant=tenant)
+        raise HTTPException(status_code=500, detail=f"Failed to process PDF: {str(e)}")
+    finally:
+        ingestion_stage_seconds.observe(time.perf_counter() - started, stage="total", tenant=tenant)
+        if pdf_path and os.path.exists(pdf_path):
+            os.remove(pdf_path)
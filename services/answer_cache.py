@@ -0,0 +1,251 @@
+import os
+import json
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+try:
+    import fcntl
+except ImportError:  # Windows: single-process development only
+    fcntl = None
+import numpy as np
+from config.twilio_config_handler import ConfigProvider
+
+logger = logging.getLogger(__name__)
+
+# Minimum cosine similarity between query embeddings for a cached answer to be reused
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1024"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+# Tenant generations shared by every worker, so one worker's invalidation reaches the others
+ANSWER_CACHE_GENERATIONS_PATH = os.getenv("ANSWER_CACHE_GENERATIONS_PATH",
+                                          str(Path(__file__).parent.parent / "answer_cache_generations.json"))
+# Rows allocated for a tenant's first entries; the matrix doubles when full
+ANSWER_CACHE_INITIAL_ROWS = 16
+
+
+class _TenantVectors:
+    """Unit query vectors of one tenant's cached answers, one matrix row per entry
+
+    Rows are reused when entries are removed, so a lookup is a single
+    matrix-vector product with no per-call stacking. Free rows are zeroed
+    and masked out of the scores.
+    """
+
+    def __init__(self, dim: int):
+        self.matrix = np.zeros((ANSWER_CACHE_INITIAL_ROWS, dim), dtype=np.float32)
+        self.keys: List[Optional[str]] = [None] * ANSWER_CACHE_INITIAL_ROWS
+        self.live = np.zeros(ANSWER_CACHE_INITIAL_ROWS, dtype=bool)
+        self.free = list(range(ANSWER_CACHE_INITIAL_ROWS - 1, -1, -1))
+
+    def __len__(self) -> int:
+        return int(self.live.sum())
+
+    def add(self, query: str, vector: np.ndarray) -> int:
+        if not self.free:
+            rows = len(self.keys)
+            self.matrix = np.vstack([self.matrix, np.zeros_like(self.matrix)])
+            self.live = np.concatenate([self.live, np.zeros(rows, dtype=bool)])
+            self.keys.extend([None] * rows)
+            self.free = list(range(2 * rows - 1, rows - 1, -1))
+        row = self.free.pop()
+        self.matrix[row] = vector
+        self.keys[row] = query
+        self.live[row] = True
+        return row
+
+    def remove(self, row: int):
+        self.matrix[row] = 0.0
+        self.keys[row] = None
+        self.live[row] = False
+        self.free.append(row)
+
+    def best(self, vector: np.ndarray) -> Tuple[Optional[str], float]:
+        """The live entry most similar to `vector`, and its cosine similarity"""
+        if not self.live.any():
+            return None, -1.0
+        scores = self.matrix @ vector
+        scores[~self.live] = -np.inf
+        row = int(np.argmax(scores))
+        return self.keys[row], float(scores[row])
+
+
+class SemanticAnswerCache:
+    """Per-tenant cache of RAG answers looked up by query-embedding similarity
+
+    A new question reuses a cached answer when its embedding is within the
+    cosine threshold of a cached question for the same tenant. Entries are
+    bounded by LRU across tenants and expire after a TTL. Each tenant has a
+    generation, bumped by invalidate_tenant; answers computed against an
+    older generation (still in flight when the documents changed) are not
+    stored.
+
+    Generations live in a JSON file shared by every worker. Each worker
+    compares its own copy with the file (re-read when its mtime changes) on
+    lookup and drops the tenant's answers once another worker has bumped it.
+    """
+
+    def __init__(self, threshold: float = ANSWER_CACHE_THRESHOLD, max_size: int = ANSWER_CACHE_SIZE,
+                 ttl_seconds: float = ANSWER_CACHE_TTL, clock: Callable[[], float] = time.monotonic,
+                 generations_path: str = ANSWER_CACHE_GENERATIONS_PATH):
+        self.threshold = threshold
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        # (tenant, query) -> entry, least recently used first
+        self._entries: "OrderedDict[Tuple[str, str], Dict[str, Any]]" = OrderedDict()
+        self._vectors: Dict[str, _TenantVectors] = {}
+        # Generations the cached entries belong to; the shared file is the source of truth
+        self._generations: Dict[str, int] = {}
+        self._shared_generations = ConfigProvider(Path(generations_path))
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.stale_stores = 0
+        self.seconds_saved = 0.0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def _unit(embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _remove(self, key: Tuple[str, str]):
+        entry = self._entries.pop(key)
+        vectors = self._vectors[key[0]]
+        vectors.remove(entry["row"])
+        if not len(vectors):
+            del self._vectors[key[0]]
+
+    def _drop_tenant(self, tenant: str) -> int:
+        doomed = [key for key in self._entries if key[0] == tenant]
+        for key in doomed:
+            self._entries.pop(key)
+        self._vectors.pop(tenant, None)
+        return len(doomed)
+
+    def _sync_generation(self, tenant: str) -> int:
+        """Catch up with the shared generation, dropping answers another worker invalidated"""
+        shared = int(self._shared_generations.get().get(tenant, 0))
+        if shared != self._generations.get(tenant, 0):
+            dropped = self._drop_tenant(tenant)
+            self._generations[tenant] = shared
+            self.invalidations += 1
+            if dropped:
+                logger.info(f"Dropped {dropped} cached answers for tenant '{tenant}' invalidated by another worker")
+        return shared
+
+    def _bump_shared_generation(self, tenant: str) -> int:
+        """Increment the tenant's generation in the shared file under a cross-worker lock"""
+        path = self._shared_generations.path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path.with_name(path.name + ".lock"), "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            # Read the file itself, not the provider's copy: another worker may have just written it
+            try:
+                with open(path, "r") as f:
+                    generations = json.load(f)
+            except FileNotFoundError:
+                generations = {}
+            generations[tenant] = int(generations.get(tenant, 0)) + 1
+            self._shared_generations.save(generations)
+        return generations[tenant]
+
+    def generation(self, tenant: Optional[str]) -> int:
+        """The tenant's current generation, to pass to store() once the answer is ready"""
+        return self._sync_generation(tenant or "")
+
+    def lookup(self, tenant: Optional[str], embedding: List[float]) -> Optional[Dict[str, Any]]:
+        """Return the cached answer closest to `embedding` for this tenant, if close enough"""
+        tenant = tenant or ""
+        self._sync_generation(tenant)
+        vector = self._unit(embedding)
+        while tenant in self._vectors:
+            query, score = self._vectors[tenant].best(vector)
+            if query is None or score < self.threshold:
+                break
+            key = (tenant, query)
+            entry = self._entries[key]
+            if entry["expires_at"] <= self._clock():
+                # Drop it and look again: an older close match may still be live
+                self._remove(key)
+                self.expirations += 1
+                continue
+            self._entries.move_to_end(key)
+            self.hits += 1
+            self.seconds_saved += entry["seconds"]
+            return {**entry["result"], "cached": True, "cache_similarity": round(score, 4)}
+        self.misses += 1
+        return None
+
+    def store(self, tenant: Optional[str], query: str, embedding: List[float], result: Dict[str, Any], seconds: float,
+              generation: Optional[int] = None):
+        """Cache a RAG answer along with the time it took to produce
+
+        `generation` is the tenant's generation from before retrieval; the
+        answer is dropped if the tenant has been invalidated since.
+        """
+        tenant = tenant or ""
+        if self.max_size <= 0:
+            return
+        current = self.generation(tenant)
+        if generation is not None and generation < current:
+            self.stale_stores += 1
+            return
+        key = (tenant, query)
+        if key in self._entries:
+            self._remove(key)
+        vector = self._unit(embedding)
+        vectors = self._vectors.get(tenant)
+        if vectors is None:
+            vectors = self._vectors[tenant] = _TenantVectors(vector.shape[0])
+        self._entries[key] = {
+            "row": vectors.add(query, vector),
+            "result": result,
+            "seconds": seconds,
+            "expires_at": self._clock() + self.ttl_seconds
+        }
+        while len(self._entries) > self.max_size:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    async def invalidate_tenant(self, tenant: Optional[str]) -> int:
+        """Drop every cached answer for a tenant in every worker, e.g. after its documents change"""
+        tenant = tenant or ""
+        # The shared file is written with fsync; keep it off the event loop
+        generation = await asyncio.to_thread(self._bump_shared_generation, tenant)
+        self._generations[tenant] = generation
+        dropped = self._drop_tenant(tenant)
+        self.invalidations += 1
+        logger.info(f"Invalidated {dropped} cached answers for tenant '{tenant}'")
+        return dropped
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl_seconds,
+            "threshold": self.threshold,
+            "tenants": len(self._vectors),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+            "stale_stores_dropped": self.stale_stores,
+            "latency_saved_seconds": round(self.seconds_saved, 3),
+            "avg_latency_saved_seconds": round(self.seconds_saved / self.hits, 3) if self.hits else None
+        }
+
+
+answer_cache = SemanticAnswerCache()
@@ -0,0 +1,176 @@
+import io
+import os
+import wave
+import math
+from typing import Optional
+import numpy as np
+
+# Twilio Media Streams carry 8 kHz mono G.711 mu-law in 20 ms frames
+MEDIA_SAMPLE_RATE = 8000
+MEDIA_FRAME_BYTES = 160
+
+# Energy VAD tuning
+VAD_FRAME_MS = 20
+VAD_MIN_DBFS = float(os.getenv("VAD_MIN_DBFS", "-45"))
+VAD_MARGIN_DB = float(os.getenv("VAD_MARGIN_DB", "12"))
+VAD_START_MS = int(os.getenv("VAD_START_MS", "60"))
+VAD_SILENCE_MS = int(os.getenv("VAD_SILENCE_MS", "600"))
+VAD_MIN_SPEECH_MS = int(os.getenv("VAD_MIN_SPEECH_MS", "250"))
+VAD_PREROLL_MS = int(os.getenv("VAD_PREROLL_MS", "200"))
+VAD_MAX_UTTERANCE_SECONDS = float(os.getenv("VAD_MAX_UTTERANCE_SECONDS", "30"))
+
+_ULAW_BIAS = 0x84
+_ULAW_CLIP = 32635
+
+
+def _build_ulaw_tables():
+    codes = np.arange(256, dtype=np.int32)
+    inverted = ~codes & 0xFF
+    exponent = (inverted >> 4) & 0x07
+    mantissa = inverted & 0x0F
+    magnitude = (((mantissa << 3) + _ULAW_BIAS) << exponent) - _ULAW_BIAS
+    decode = np.where(inverted & 0x80, -magnitude, magnitude).astype(np.int16)
+
+    samples = np.arange(-32768, 32768, dtype=np.int32)
+    sign = np.where(samples < 0, 0x80, 0)
+    # Quantize to 14 bits first, as the G.711 reference encoder does
+    magnitude = np.minimum(np.abs(samples >> 2) << 2, _ULAW_CLIP) + _ULAW_BIAS
+    exponent = np.floor(np.log2(np.maximum(magnitude >> 7, 1))).astype(np.int32)
+    mantissa = (magnitude >> (exponent + 3)) & 0x0F
+    encode = (~(sign | (exponent << 4) | mantissa) & 0xFF).astype(np.uint8)
+    return decode, encode
+
+
+# Decode table indexed by mu-law byte; encode table indexed by sample + 32768
+_ULAW_DECODE, _ULAW_ENCODE = _build_ulaw_tables()
+
+
+def ulaw_to_pcm16(data: bytes) -> np.ndarray:
+    """Decode G.711 mu-law bytes to 16-bit PCM samples"""
+    return _ULAW_DECODE[np.frombuffer(data, dtype=np.uint8)]
+
+
+def pcm16_to_ulaw(samples: np.ndarray) -> bytes:
+    """Encode 16-bit PCM samples as G.711 mu-law bytes"""
+    return _ULAW_ENCODE[samples.astype(np.int32) + 32768].tobytes()
+
+
+def pcm16_to_wav(samples: np.ndarray, sample_rate: int = MEDIA_SAMPLE_RATE, name: str = "turn.wav") -> io.BytesIO:
+    """Wrap PCM samples in an in-memory WAV file ready for the STT API"""
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(samples.astype("<i2").tobytes())
+    buffer.seek(0)
+    buffer.name = name
+    return buffer
+
+
+def dbfs(samples: np.ndarray) -> float:
+    """RMS level of a frame relative to full scale"""
+    if samples.size == 0:
+        return -120.0
+    rms = math.sqrt(float(np.mean(samples.astype(np.float64) ** 2)))
+    return 20 * math.log10(rms / 32768) if rms > 0 else -120.0
+
+
+class StreamResampler:
+    """Resample a PCM16 stream that arrives in arbitrarily sized byte chunks
+
+    Integer downsampling ratios (24 kHz TTS output to 8 kHz) average each
+    group of input samples, which also acts as the anti-alias filter; other
+    ratios fall back to linear interpolation.
+    """
+
+    def __init__(self, src_rate: int, dst_rate: int):
+        self.src_rate = src_rate
+        self.dst_rate = dst_rate
+        self.factor = src_rate // dst_rate if src_rate % dst_rate == 0 else None
+        self._pending = b""
+
+    def process(self, data: bytes) -> np.ndarray:
+        data = self._pending + data
+        usable = len(data) - len(data) % 2
+        if self.factor:
+            usable -= usable % (2 * self.factor)
+        self._pending = data[usable:]
+        samples = np.frombuffer(data[:usable], dtype="<i2")
+        if self.src_rate == self.dst_rate or samples.size == 0:
+            return samples.astype(np.int16)
+        if self.factor:
+            return samples.reshape(-1, self.factor).mean(axis=1).astype(np.int16)
+        count = int(samples.size * self.dst_rate / self.src_rate)
+        positions = np.linspace(0, samples.size - 1, count)
+        return np.interp(positions, np.arange(samples.size), samples).astype(np.int16)
+
+
+class EnergyVAD:
+    """Frame-energy voice activity detector with an adaptive noise floor
+
+    `process` takes one frame of PCM and returns "speech_start" when speech
+    begins, "speech_end" once VAD_SILENCE_MS of silence follows at least
+    VAD_MIN_SPEECH_MS of speech, and None otherwise. The utterance, including
+    a short pre-roll before the detected start, is then available from
+    `pop_utterance`.
+    """
+
+    def __init__(self, frame_ms: int = VAD_FRAME_MS):
+        self.frame_ms = frame_ms
+        self.noise_floor = VAD_MIN_DBFS - VAD_MARGIN_DB
+        self.in_speech = False
+        self.last_voiced_at: Optional[float] = None
+        self._voiced_run = 0
+        self._silent_run = 0
+        self._speech_frames = 0
+        self._preroll = []
+        self._frames = []
+
+    def _threshold(self) -> float:
+        return max(VAD_MIN_DBFS, self.noise_floor + VAD_MARGIN_DB)
+
+    def process(self, samples: np.ndarray, now: float) -> Optional[str]:
+        level = dbfs(samples)
+        voiced = level >= self._threshold()
+        if not self.in_speech:
+            self._preroll.append(samples)
+            if len(self._preroll) > max(VAD_PREROLL_MS // self.frame_ms, 1):
+                self._preroll.pop(0)
+            if not voiced:
+                self._voiced_run = 0
+                # Track background noise so the threshold follows the line
+                self.noise_floor = 0.95 * self.noise_floor + 0.05 * level
+                return None
+            self._voiced_run += 1
+            if self._voiced_run * self.frame_ms < VAD_START_MS:
+                return None
+            self.in_speech = True
+            self._frames = list(self._preroll)
+            self._preroll = []
+            self._speech_frames = self._voiced_run
+            self._silent_run = 0
+            self.last_voiced_at = now
+            return "speech_start"
+
+        self._frames.append(samples)
+        if voiced:
+            self._speech_frames += 1
+            self._silent_run = 0
+            self.last_voiced_at = now
+        else:
+            self._silent_run += 1
+        too_long = len(self._frames) * self.frame_ms >= VAD_MAX_UTTERANCE_SECONDS * 1000
+        if self._silent_run * self.frame_ms >= VAD_SILENCE_MS or too_long:
+            self.in_speech = False
+            self._voiced_run = 0
+            if self._speech_frames * self.frame_ms < VAD_MIN_SPEECH_MS and not too_long:
+                # A click or short noise burst, not a turn
+                self._frames = []
+                return None
+            return "speech_end"
+        return None
+
+    def pop_utterance(self) -> np.ndarray:
+        frames, self._frames = self._frames, []
+        return np.concatenate(frames) if frames else np.zeros(0, dtype=np.int16)
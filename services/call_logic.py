@@ -1,27 +1,114 @@
-import io
-import requests
+import os
+import time
 import logging
+from urllib.parse import urlsplit
 from fastapi import Request, HTTPException, Response
-from twilio.twiml.voice_response import VoiceResponse
-from services.twilio_client import twilio_client, TWILIO_PHONE_NUMBER
-from services.openai_client import stt_client
+from twilio.twiml.voice_response import VoiceResponse, Connect
+from services.twilio_client import get_twilio_client, get_twilio_phone_number
+from config.twilio_config_handler import load_twilio_config
+from services.stt_service import transcribe_audio
+from services.http_client import download_recording
+from services.tenant import tenant_for_call
+from services.call_state import CallState, call_state_store, FINAL_CALL_STATUSES
+from services.campaign import campaign_manager
+from services.tts_service import tts_cache
+from services.metrics import (
+    call_stage_seconds, call_errors_total, call_fallbacks_total, tts_prompt_fallbacks_total, observe_rag_timings
+)
 from vectordb_files.utils import get_response_for_message
 
 logger = logging.getLogger(__name__)
 
-call_states = {}
+# "record" (<Record> turns) or "stream" (real-time Media Streams over a WebSocket)
+VOICE_PIPELINE = os.getenv("VOICE_PIPELINE", "record").strip().lower()
+
+# Fixed prompts are synthesized once into the TTS cache at startup and played with <Play>
+INCOMING_GREETING = "Hello! Welcome to the RAG Voice Assistant. Please speak your question after the beep, and I'll help you find the information you need."
+OUTBOUND_GREETING = ("Hello! This is your RAG Voice Assistant calling. "
+                     "I can help answer questions based on our knowledge base. "
+                     "Please speak your question after the beep, and I'll provide you with information.")
+STREAM_INCOMING_GREETING = "Hello! Welcome to the RAG Voice Assistant. How can I help you?"
+STREAM_OUTBOUND_GREETING = "Hello! This is your RAG Voice Assistant calling. What would you like to know?"
+NO_RECORDING_PROMPT = "I didn't receive your recording. Please try calling again."
+NO_OUTBOUND_RESPONSE_PROMPT = "I didn't receive your response. Thank you for your time. Goodbye!"
+ANOTHER_QUESTION_PROMPT = "Would you like to ask another question? Press 1 for yes, or simply hang up if you're done."
+PRESS_ONE_PROMPT = "Press 1 to ask another question, or hang up to end the call."
+GOODBYE_PROMPT = "Thank you for using the RAG Voice Assistant. Goodbye!"
+NEXT_QUESTION_PROMPT = "Great! Please speak your next question after the beep."
+NO_NEXT_RECORDING_PROMPT = "I didn't receive your recording. Goodbye!"
+FAREWELL_PROMPT = "Thank you for using the RAG Voice Assistant. Have a great day!"
+
+FIXED_PROMPTS = [
+    INCOMING_GREETING, OUTBOUND_GREETING, STREAM_INCOMING_GREETING, STREAM_OUTBOUND_GREETING,
+    NO_RECORDING_PROMPT, NO_OUTBOUND_RESPONSE_PROMPT, ANOTHER_QUESTION_PROMPT, PRESS_ONE_PROMPT,
+    GOODBYE_PROMPT, NEXT_QUESTION_PROMPT, NO_NEXT_RECORDING_PROMPT, FAREWELL_PROMPT
+]
+
+def public_base_url(request: Request) -> str:
+    """Base URL Twilio reaches us on: the configured webhook_url, else this request's host
+
+    A webhook_url that is not an http(s) URL (the shipped config has "None")
+    is ignored rather than put into <Play> and <Stream> URLs.
+    """
+    webhook_url = (load_twilio_config().get("webhook_url") or "").strip().rstrip('/')
+    parts = urlsplit(webhook_url)
+    if parts.scheme in ("http", "https") and parts.netloc:
+        return webhook_url
+    return str(request.url_for("handle_incoming_call")).rsplit("/voice/", 1)[0]
+
+def say_prompt(verb, request: Request, text: str):
+    """<Play> a fixed prompt from the TTS cache, falling back to <Say> until it is cached"""
+    filename = tts_cache.lookup(text)
+    if filename:
+        verb.play(f"{public_base_url(request)}/tts/{filename}")
+    else:
+        tts_prompt_fallbacks_total.inc()
+        verb.say(text, voice='alice')
+
+def media_stream_url(request: Request) -> str:
+    """WebSocket URL of the media stream endpoint, on the validated public base URL"""
+    base_url = public_base_url(request)
+    if base_url.startswith("https://"):
+        base_url = "wss://" + base_url[len("https://"):]
+    elif base_url.startswith("http://"):
+        base_url = "ws://" + base_url[len("http://"):]
+    return f"{base_url}/voice/media_stream"
+
+def render_twiml(response: VoiceResponse, tenant: str = "", direction: str = "") -> Response:
+    """Serialize TwiML into a webhook response, recording the render time"""
+    with call_stage_seconds.time(stage="twiml_render", tenant=tenant, direction=direction):
+        content = str(response)
+    return Response(content=content, media_type="application/xml")
+
+def media_stream_response(request: Request, greeting: str, tenant: str, direction: str) -> Response:
+    """Greet the caller, then hand the call audio to the media stream WebSocket"""
+    response = VoiceResponse()
+    say_prompt(response, request, greeting)
+    connect = Connect()
+    stream = connect.stream(url=media_stream_url(request))
+    stream.parameter(name="tenant", value=tenant)
+    stream.parameter(name="direction", value=direction)
+    response.append(connect)
+    return render_twiml(response, tenant=tenant, direction=direction)
 
 async def handle_incoming_call_logic(request: Request):
+    started = time.perf_counter()
+    labels = {"tenant": "", "direction": "inbound"}
     try:
         form_data = await request.form()
         call_sid = form_data.get("CallSid")
         from_number = form_data.get("From")
         to_number = form_data.get("To")
         logger.info(f"Incoming call from {from_number} to {to_number}, CallSid: {call_sid}")
-        call_states[call_sid] = {"from": from_number, "step": "greeting"}
+        tenant = labels["tenant"] = tenant_for_call("inbound", to_number, from_number)
+        await call_state_store.put(CallState(
+            call_sid=call_sid, direction="inbound", step="greeting", tenant=tenant,
+            from_number=from_number or "", to_number=to_number or ""
+        ))
+        if VOICE_PIPELINE == "stream":
+            return media_stream_response(request, STREAM_INCOMING_GREETING, tenant, "inbound")
         response = VoiceResponse()
-        welcome_text = "Hello! Welcome to the RAG Voice Assistant. Please speak your question after the beep, and I'll help you find the information you need."
-        response.say(welcome_text, voice='alice')
+        say_prompt(response, request, INCOMING_GREETING)
         response.record(
             action="/voice/process_recording",
             method="POST",
@@ -31,74 +118,109 @@ async def handle_incoming_call_logic(request: Request):
             transcribe=True,
             transcribe_callback="/voice/transcription"
         )
-        response.say("I didn't receive your recording. Please try calling again.", voice='alice')
+        say_prompt(response, request, NO_RECORDING_PROMPT)
         response.hangup()
-        return Response(content=str(response), media_type="application/xml")
+        return render_twiml(response, **labels)
     except Exception as e:
         logger.error(f"Error handling incoming call: {e}")
+        call_errors_total.inc(stage="request", **labels)
         response = VoiceResponse()
         response.say("I'm sorry, there was an error processing your call. Please try again later.", voice='alice')
         response.hangup()
-        return Response(content=str(response), media_type="application/xml")
+        return render_twiml(response, **labels)
+    finally:
+        call_stage_seconds.observe(time.perf_counter() - started, stage="webhook_total", **labels)
 
 async def process_recording_logic(request: Request):
+    started = time.perf_counter()
+    labels = {"tenant": "", "direction": ""}
+    # Stage reported on the error counter if this turn fails
+    stage = "request"
     try:
         form_data = await request.form()
         call_sid = form_data.get("CallSid")
         recording_url = form_data.get("RecordingUrl")
         recording_duration = form_data.get("RecordingDuration")
         logger.info(f"Processing recording for call {call_sid}, duration: {recording_duration}s")
+        call_state = await call_state_store.get(call_sid)
+        if call_state is not None:
+            call_state.step = "answered"
+            await call_state_store.put(call_state)
+        labels["direction"] = call_state.direction if call_state else "inbound"
+        labels["tenant"] = (call_state.tenant if call_state else "") or tenant_for_call(
+            form_data.get("Direction"), form_data.get("To"), form_data.get("From")
+        )
         response = VoiceResponse()
         if not recording_url or float(recording_duration or 0) < 1:
+            call_fallbacks_total.inc(reason="no_recording", **labels)
             response.say("I didn't receive a clear recording. Please try again.", voice='alice')
             response.hangup()
-            return Response(content=str(response), media_type="application/xml")
-        audio_response = requests.get(recording_url + ".wav", auth=(twilio_client.username, twilio_client.password))
-        if audio_response.status_code == 200:
-            audio_file = io.BytesIO(audio_response.content)
-            audio_file.name = "recording.wav"
-            transcription = stt_client.audio.transcriptions.create(
-                model="gpt-4o-transcribe",
-                file=audio_file,
-                language="en"
-            )
-            user_question = transcription.text.strip()
+            return render_twiml(response, **labels)
+        twilio_client = get_twilio_client()
+        stage = "recording_download"
+        with call_stage_seconds.time(stage=stage, **labels):
+            audio_file = await download_recording(recording_url, auth=(twilio_client.username, twilio_client.password))
+        if audio_file is not None:
+            stage = "stt"
+            with call_stage_seconds.time(stage=stage, **labels):
+                user_question = await transcribe_audio(audio_file, call_sid=call_sid, direction=labels["direction"])
             logger.info(f"\n\n\n Transcribed question: {user_question}\n\n\n")
             if user_question:
-                rag_response = await get_response_for_message(user_question)
+                stage = "rag"
+                rag_timings = {}
+                rag_response = await get_response_for_message(user_question, tenant=labels["tenant"], timings=rag_timings)
+                observe_rag_timings(rag_timings, **labels)
                 response.say(f"Based on your Question {rag_response}", voice='alice')
-                response.say("Would you like to ask another question? Press 1 for yes, or simply hang up if you're done.", voice='alice')
+                say_prompt(response, request, ANOTHER_QUESTION_PROMPT)
                 gather = response.gather(
                     action="/voice/continue",
                     method="POST",
                     num_digits=1,
                     timeout=10
                 )
-                gather.say("Press 1 to ask another question, or hang up to end the call.", voice='alice')
-                response.say("Thank you for using the RAG Voice Assistant. Goodbye!", voice='alice')
+                say_prompt(gather, request, PRESS_ONE_PROMPT)
+                say_prompt(response, request, GOODBYE_PROMPT)
                 response.hangup()
             else:
+                call_fallbacks_total.inc(reason="empty_transcript", **labels)
                 response.say("I couldn't understand your question. Please try calling again and speak clearly.", voice='alice')
                 response.hangup()
         else:
+            call_errors_total.inc(stage=stage, **labels)
             response.say("There was an error processing your recording. Please try again.", voice='alice')
             response.hangup()
-        return Response(content=str(response), media_type="application/xml")
+        return render_twiml(response, **labels)
     except Exception as e:
         logger.error(f"Error processing recording: {e}")
+        call_errors_total.inc(stage=stage, **labels)
         response = VoiceResponse()
         response.say("I'm sorry, there was an error processing your question. Please try again.", voice='alice')
         response.hangup()
-        return Response(content=str(response), media_type="application/xml")
+        return render_twiml(response, **labels)
+    finally:
+        call_stage_seconds.observe(time.perf_counter() - started, stage="webhook_total", **labels)
 
 async def handle_continue_logic(request: Request):
+    started = time.perf_counter()
+    labels = {"tenant": "", "direction": ""}
     try:
         form_data = await request.form()
         digits = form_data.get("Digits")
         call_sid = form_data.get("CallSid")
+        call_state = await call_state_store.get(call_sid) if call_sid else None
+        labels["direction"] = call_state.direction if call_state else "inbound"
+        labels["tenant"] = (call_state.tenant if call_state else "") or tenant_for_call(
+            form_data.get("Direction"), form_data.get("To"), form_data.get("From")
+        )
+        if call_state is not None:
+            call_state.step = "next_question" if digits == "1" else "goodbye"
+            await call_state_store.put(call_state)
+        if digits != "1" and call_sid:
+            # We hang up now, so the state is only needed for late webhooks
+            await call_state_store.complete(call_sid)
         response = VoiceResponse()
         if digits == "1":
-            response.say("Great! Please speak your next question after the beep.", voice='alice')
+            say_prompt(response, request, NEXT_QUESTION_PROMPT)
             response.record(
                 action="/voice/process_recording",
                 method="POST",
@@ -107,18 +229,21 @@ async def handle_continue_logic(request: Request):
                 play_beep=True,
                 transcribe=True
             )
-            response.say("I didn't receive your recording. Goodbye!", voice='alice')
+            say_prompt(response, request, NO_NEXT_RECORDING_PROMPT)
             response.hangup()
         else:
-            response.say("Thank you for using the RAG Voice Assistant. Have a great day!", voice='alice')
+            say_prompt(response, request, FAREWELL_PROMPT)
             response.hangup()
-        return Response(content=str(response), media_type="application/xml")
+        return render_twiml(response, **labels)
     except Exception as e:
         logger.error(f"Error handling continue: {e}")
+        call_errors_total.inc(stage="request", **labels)
         response = VoiceResponse()
         response.say("Thank you for calling. Goodbye!", voice='alice')
         response.hangup()
-        return Response(content=str(response), media_type="application/xml")
+        return render_twiml(response, **labels)
+    finally:
+        call_stage_seconds.observe(time.perf_counter() - started, stage="webhook_total", **labels)
 
 async def handle_transcription_logic(request: Request):
     try:
@@ -131,27 +256,43 @@ async def handle_transcription_logic(request: Request):
         logger.error(f"Error handling transcription: {e}")
         return {"status": "error"}
 
+async def handle_call_status_logic(request: Request):
+    try:
+        form_data = await request.form()
+        call_sid = form_data.get("CallSid")
+        call_status = form_data.get("CallStatus")
+        logger.info(f"Call {call_sid} status: {call_status}")
+        if call_sid and call_status in FINAL_CALL_STATUSES:
+            await call_state_store.complete(call_sid, call_status)
+            campaign_manager.on_call_status(call_sid, call_status)
+        return {"status": "received"}
+    except Exception as e:
+        logger.error(f"Error handling call status: {e}")
+        return {"status": "error"}
+
 async def make_outbound_call_logic(phone_number: str, message: str = None, interactive: bool = False):
     try:
         if not phone_number.startswith('+'):
             raise HTTPException(status_code=400, detail="Phone number must include country code (e.g., +1234567890)")
+        twilio_phone_number = get_twilio_phone_number()
         if interactive:
-            from config.twilio_config_handler import load_twilio_config
             twilio_config = load_twilio_config()
             webhook_url = twilio_config.get("webhook_url")
             outbound_webhook = f"{webhook_url}/voice/outbound"
-            call = twilio_client.calls.create(
+            call = await get_twilio_client().calls.create_async(
                 to=phone_number,
-                from_=TWILIO_PHONE_NUMBER,
+                from_=twilio_phone_number,
                 url=outbound_webhook,
-                method='POST'
+                method='POST',
+                status_callback=f"{webhook_url}/voice/status",
+                status_callback_method='POST'
             )
         else:
             if not message:
                 message = "Hello! This is a call from your RAG Voice Assistant. You can call us anytime for questions."
-            call = twilio_client.calls.create(
+            call = await get_twilio_client().calls.create_async(
                 to=phone_number,
-                from_=TWILIO_PHONE_NUMBER,
+                from_=twilio_phone_number,
                 twiml=f'<Response><Say voice="alice">{message}</Say></Response>'
             )
         logger.info(f"{'Interactive' if interactive else 'Simple'} outbound call initiated to {phone_number}, SID: {call.sid}")
@@ -159,7 +300,7 @@ async def make_outbound_call_logic(phone_number: str, message: str = None, inter
             "status": "success",
             "call_sid": call.sid,
             "to": phone_number,
-            "from": TWILIO_PHONE_NUMBER,
+            "from": twilio_phone_number,
             "interactive": interactive,
             "message": "Call initiated successfully"
         }
@@ -168,18 +309,23 @@ async def make_outbound_call_logic(phone_number: str, message: str = None, inter
         raise HTTPException(status_code=500, detail=f"Failed to make call: {str(e)}")
 
 async def handle_outbound_call_logic(request: Request):
+    started = time.perf_counter()
+    labels = {"tenant": "", "direction": "outbound"}
     try:
         form_data = await request.form()
         call_sid = form_data.get("CallSid")
         to_number = form_data.get("To")
         from_number = form_data.get("From")
         logger.info(f"Outbound call answered by {to_number}, CallSid: {call_sid}")
-        call_states[call_sid] = {"to": to_number, "step": "outbound_greeting", "direction": "outbound"}
+        tenant = labels["tenant"] = tenant_for_call("outbound", to_number, from_number)
+        await call_state_store.put(CallState(
+            call_sid=call_sid, direction="outbound", step="outbound_greeting", tenant=tenant,
+            from_number=from_number or "", to_number=to_number or ""
+        ))
+        if VOICE_PIPELINE == "stream":
+            return media_stream_response(request, STREAM_OUTBOUND_GREETING, tenant, "outbound")
         response = VoiceResponse()
-        greeting_text = ("Hello! This is your RAG Voice Assistant calling. "
-                        "I can help answer questions based on our knowledge base. "
-                        "Please speak your question after the beep, and I'll provide you with information.")
-        response.say(greeting_text, voice='alice')
+        say_prompt(response, request, OUTBOUND_GREETING)
         response.record(
             action="/voice/process_recording",
             method="POST",
@@ -188,21 +334,24 @@ async def handle_outbound_call_logic(request: Request):
             play_beep=True,
             transcribe=True
         )
-        response.say("I didn't receive your response. Thank you for your time. Goodbye!", voice='alice')
+        say_prompt(response, request, NO_OUTBOUND_RESPONSE_PROMPT)
         response.hangup()
-        return Response(content=str(response), media_type="application/xml")
+        return render_twiml(response, **labels)
     except Exception as e:
         logger.error(f"Error handling outbound call: {e}")
+        call_errors_total.inc(stage="request", **labels)
         response = VoiceResponse()
         response.say("I'm sorry, there was an error with this call. Goodbye!", voice='alice')
         response.hangup()
-        return Response(content=str(response), media_type="application/xml")
+        return render_twiml(response, **labels)
+    finally:
+        call_stage_seconds.observe(time.perf_counter() - started, stage="webhook_total", **labels)
 
 async def make_interactive_call_logic(phone_number: str, initial_message: str = None):
     try:
         if not phone_number.startswith('+'):
             raise HTTPException(status_code=400, detail="Phone number must include country code (e.g., +1234567890)")
-        from config.twilio_config_handler import load_twilio_config
+        twilio_phone_number = get_twilio_phone_number()
         twilio_config = load_twilio_config()
         webhook_url = twilio_config.get("webhook_url")
         if not webhook_url:
@@ -212,18 +361,20 @@ async def make_interactive_call_logic(phone_number: str, initial_message: str =
             raise HTTPException(status_code=400, detail="WEBHOOK_URL must be a valid HTTP/HTTPS URL")
         outbound_webhook = f"{webhook_url}/voice/outbound"
         logger.info(f"Using webhook URL: {outbound_webhook}")
-        call = twilio_client.calls.create(
+        call = await get_twilio_client().calls.create_async(
             to=phone_number,
-            from_=TWILIO_PHONE_NUMBER,
+            from_=twilio_phone_number,
             url=outbound_webhook,
-            method='POST'
+            method='POST',
+            status_callback=f"{webhook_url}/voice/status",
+            status_callback_method='POST'
         )
         logger.info(f"Interactive outbound call initiated to {phone_number}, SID: {call.sid}")
         return {
             "status": "success",
             "call_sid": call.sid,
             "to": phone_number,
-            "from": TWILIO_PHONE_NUMBER,
+            "from": twilio_phone_number,
             "type": "interactive",
             "webhook_url": outbound_webhook,
             "message": "Interactive call initiated successfully - user can have full conversation with RAG system"
@@ -0,0 +1,217 @@
+import os
+import time
+import sqlite3
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, astuple, fields
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# "memory" (this process only) or "sqlite" (shared by every worker on the host)
+CALL_STATE_BACKEND = os.getenv("CALL_STATE_BACKEND", "memory").strip().lower()
+CALL_STATE_DB_PATH = os.getenv("CALL_STATE_DB_PATH", "call_states.db")
+# Upper bound for a live call's state between webhooks; every webhook of the
+# call refreshes it, so it only needs to outlast one recording/answer turn.
+# Numbers whose status callback is not configured (see /setup_webhook) rely on it.
+CALL_STATE_TTL = float(os.getenv("CALL_STATE_TTL", "900"))
+# How long state survives after Twilio reports the call finished, for late webhooks
+CALL_STATE_COMPLETED_TTL = float(os.getenv("CALL_STATE_COMPLETED_TTL", "120"))
+# Expired entries are swept at most this often
+CALL_STATE_SWEEP_SECONDS = float(os.getenv("CALL_STATE_SWEEP_SECONDS", "30"))
+# The in-memory backend drops its least recently written states beyond this many
+CALL_STATE_MAX_ENTRIES = int(os.getenv("CALL_STATE_MAX_ENTRIES", "10000"))
+
+FINAL_CALL_STATUSES = {"completed", "busy", "failed", "no-answer", "canceled"}
+
+
+@dataclass(slots=True)
+class CallState:
+    """Compact per-call record kept between webhooks"""
+    call_sid: str
+    direction: str = "inbound"
+    # Last webhook handled: greeting, outbound_greeting, media_stream, answered, next_question, goodbye
+    step: str = ""
+    tenant: str = ""
+    from_number: str = ""
+    to_number: str = ""
+    status: str = "in-progress"
+    expires_at: float = 0.0
+
+
+class CallStateStore(ABC):
+    """Interface for call state shared between webhook requests"""
+
+    backend = "base"
+
+    def __init__(self):
+        self.evictions = 0
+        self._last_sweep = 0.0
+
+    @abstractmethod
+    async def get(self, call_sid: str) -> Optional[CallState]:
+        pass
+
+    @abstractmethod
+    async def put(self, state: CallState):
+        """Insert or replace a call's state, extending its TTL unless the call has finished"""
+        pass
+
+    @abstractmethod
+    async def complete(self, call_sid: str, status: str = "completed"):
+        """Mark a call finished so its state expires shortly after"""
+        pass
+
+    @abstractmethod
+    async def size(self) -> int:
+        pass
+
+    @abstractmethod
+    async def _sweep(self, now: float) -> int:
+        pass
+
+    @staticmethod
+    def _expires_at(state: CallState) -> float:
+        ttl = CALL_STATE_COMPLETED_TTL if state.status in FINAL_CALL_STATUSES else CALL_STATE_TTL
+        return time.time() + ttl
+
+    async def _maybe_sweep(self):
+        now = time.time()
+        if now - self._last_sweep >= CALL_STATE_SWEEP_SECONDS:
+            self._last_sweep = now
+            self.evictions += await self._sweep(now)
+
+    async def stats(self) -> Dict[str, Any]:
+        await self._maybe_sweep()
+        return {
+            "backend": self.backend,
+            "size": await self.size(),
+            "evictions": self.evictions,
+            "ttl_seconds": CALL_STATE_TTL,
+            "completed_ttl_seconds": CALL_STATE_COMPLETED_TTL
+        }
+
+
+class InMemoryCallStateStore(CallStateStore):
+    """Call state in a dict local to this process, bounded to `max_entries` states"""
+
+    backend = "memory"
+
+    def __init__(self, max_entries: int = CALL_STATE_MAX_ENTRIES):
+        super().__init__()
+        self.max_entries = max_entries
+        # call_sid -> state, least recently written first
+        self._states: "OrderedDict[str, CallState]" = OrderedDict()
+
+    async def get(self, call_sid):
+        await self._maybe_sweep()
+        state = self._states.get(call_sid)
+        if state is not None and state.expires_at <= time.time():
+            del self._states[call_sid]
+            self.evictions += 1
+            return None
+        return state
+
+    async def put(self, state):
+        await self._maybe_sweep()
+        state.expires_at = self._expires_at(state)
+        self._states[state.call_sid] = state
+        self._states.move_to_end(state.call_sid)
+        while len(self._states) > self.max_entries:
+            self._states.popitem(last=False)
+            self.evictions += 1
+
+    async def complete(self, call_sid, status="completed"):
+        state = self._states.get(call_sid)
+        if state is not None:
+            state.status = status
+            state.expires_at = time.time() + CALL_STATE_COMPLETED_TTL
+
+    async def size(self):
+        return len(self._states)
+
+    async def _sweep(self, now):
+        expired = [call_sid for call_sid, state in self._states.items() if state.expires_at <= now]
+        for call_sid in expired:
+            del self._states[call_sid]
+        return len(expired)
+
+    async def stats(self):
+        return {**await super().stats(), "max_entries": self.max_entries}
+
+
+class SqliteCallStateStore(CallStateStore):
+    """Call state in a local SQLite database in WAL mode
+
+    Every uvicorn worker on the host opens the same file, so a webhook sees
+    the state written by whichever worker handled the previous one.
+    """
+
+    backend = "sqlite"
+    _columns = [field.name for field in fields(CallState)]
+
+    def __init__(self, path: str = CALL_STATE_DB_PATH):
+        super().__init__()
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS call_states ("
+            "call_sid TEXT PRIMARY KEY, direction TEXT, step TEXT, tenant TEXT, "
+            "from_number TEXT, to_number TEXT, status TEXT, expires_at REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS call_states_expires_at ON call_states (expires_at)")
+
+    def _execute(self, sql: str, params=()):
+        with self._lock:
+            cursor = self._conn.execute(sql, params)
+            return cursor.fetchone(), cursor.rowcount
+
+    async def _run(self, sql: str, params=()):
+        return await asyncio.to_thread(self._execute, sql, params)
+
+    async def get(self, call_sid):
+        await self._maybe_sweep()
+        row, _ = await self._run(
+            f"SELECT {', '.join(self._columns)} FROM call_states WHERE call_sid = ? AND expires_at > ?",
+            (call_sid, time.time())
+        )
+        return CallState(*row) if row else None
+
+    async def put(self, state):
+        await self._maybe_sweep()
+        state.expires_at = self._expires_at(state)
+        await self._run(
+            f"INSERT OR REPLACE INTO call_states ({', '.join(self._columns)}) "
+            f"VALUES ({', '.join('?' for _ in self._columns)})",
+            astuple(state)
+        )
+
+    async def complete(self, call_sid, status="completed"):
+        await self._run(
+            "UPDATE call_states SET status = ?, expires_at = ? WHERE call_sid = ?",
+            (status, time.time() + CALL_STATE_COMPLETED_TTL, call_sid)
+        )
+
+    async def size(self):
+        row, _ = await self._run("SELECT COUNT(*) FROM call_states")
+        return row[0]
+
+    async def _sweep(self, now):
+        _, deleted = await self._run("DELETE FROM call_states WHERE expires_at <= ?", (now,))
+        return max(deleted, 0)
+
+
+def create_call_state_store() -> CallStateStore:
+    """Build the call state store selected by CALL_STATE_BACKEND"""
+    if CALL_STATE_BACKEND == "sqlite":
+        return SqliteCallStateStore(CALL_STATE_DB_PATH)
+    return InMemoryCallStateStore()
+
+
+call_state_store = create_call_state_store()
@@ -0,0 +1,408 @@
+import io
+import os
+import csv
+import json
+import math
+import time
+import uuid
+import random
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlsplit
+from xml.sax.saxutils import escape
+import httpx
+from fastapi import HTTPException
+from twilio.base.exceptions import TwilioRestException
+from services.twilio_client import get_twilio_client, get_twilio_phone_number
+from services.call_state import CallState, call_state_store, FINAL_CALL_STATUSES
+from config.twilio_config_handler import load_twilio_config
+
+logger = logging.getLogger(__name__)
+
+# Account-wide pacing of calls.create; Twilio's default outbound limit is 1 CPS
+CAMPAIGN_CALLS_PER_SECOND = float(os.getenv("CAMPAIGN_CALLS_PER_SECOND", "1"))
+# Calls that may be live at once across all campaigns
+CAMPAIGN_MAX_CONCURRENT_CALLS = int(os.getenv("CAMPAIGN_MAX_CONCURRENT_CALLS", "10"))
+CAMPAIGN_MAX_RETRIES = int(os.getenv("CAMPAIGN_MAX_RETRIES", "5"))
+CAMPAIGN_RETRY_BASE_SECONDS = float(os.getenv("CAMPAIGN_RETRY_BASE_SECONDS", "1"))
+CAMPAIGN_RETRY_MAX_SECONDS = float(os.getenv("CAMPAIGN_RETRY_MAX_SECONDS", "60"))
+# Seconds Twilio lets a campaign call ring before giving up (its calls.create default)
+CAMPAIGN_RING_TIMEOUT_SECONDS = int(os.getenv("CAMPAIGN_RING_TIMEOUT_SECONDS", "60"))
+# Speaking rate used to estimate how long a campaign message takes to play
+CAMPAIGN_SPEECH_WORDS_PER_SECOND = float(os.getenv("CAMPAIGN_SPEECH_WORDS_PER_SECOND", "2.5"))
+# Longest an interactive campaign call may last; Twilio hangs up after this
+CAMPAIGN_INTERACTIVE_CALL_SECONDS = int(os.getenv("CAMPAIGN_INTERACTIVE_CALL_SECONDS", "300"))
+# Slack over a call's expected length before its slot is freed without a status callback
+CAMPAIGN_CALL_GRACE_SECONDS = float(os.getenv("CAMPAIGN_CALL_GRACE_SECONDS", "30"))
+# How often live calls are checked for a final status recorded by another worker's status callback
+CAMPAIGN_STATUS_POLL_SECONDS = float(os.getenv("CAMPAIGN_STATUS_POLL_SECONDS", "2"))
+# Finished campaigns keep their per-number results this long, and at most this many are kept
+CAMPAIGN_RETENTION_SECONDS = float(os.getenv("CAMPAIGN_RETENTION_SECONDS", "86400"))
+CAMPAIGN_MAX_FINISHED = int(os.getenv("CAMPAIGN_MAX_FINISHED", "50"))
+
+DEFAULT_CAMPAIGN_MESSAGE = "Hello! This is a call from your RAG Voice Assistant. You can call us anytime for questions."
+NUMBER_COLUMNS = ("phone_number", "number", "phone", "to")
+
+
+@dataclass(slots=True)
+class CampaignCall:
+    """Result for one number in a campaign"""
+    phone_number: str
+    status: str = "queued"  # queued, dialing, initiated, finished, failed
+    call_sid: Optional[str] = None
+    call_status: Optional[str] = None
+    attempts: int = 0
+    error: Optional[str] = None
+    slot_held: bool = False
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "phone_number": self.phone_number,
+            "status": self.status,
+            "call_sid": self.call_sid,
+            "call_status": self.call_status,
+            "attempts": self.attempts,
+            "error": self.error
+        }
+
+
+def parse_numbers(content: bytes, filename: str = "") -> List[str]:
+    """Read phone numbers from a JSON array or a CSV file
+
+    JSON may be a list of strings or of objects with a phone number field.
+    CSV uses a phone_number/number/phone/to column when the file has a
+    header, and the first column otherwise.
+    """
+    text = content.decode("utf-8-sig").strip()
+    if not text:
+        return []
+    if filename.lower().endswith(".json") or text[0] in "[{":
+        data = json.loads(text)
+        if isinstance(data, dict):
+            data = data.get("numbers") or data.get("phone_numbers") or []
+        numbers = []
+        for item in data:
+            if isinstance(item, dict):
+                item = next((item[key] for key in NUMBER_COLUMNS if item.get(key)), "")
+            numbers.append(str(item))
+    else:
+        rows = [row for row in csv.reader(io.StringIO(text)) if row]
+        header = [cell.strip().lower() for cell in rows[0]]
+        column = next((header.index(key) for key in NUMBER_COLUMNS if key in header), None)
+        if column is not None:
+            rows = rows[1:]
+        numbers = [row[column or 0] for row in rows if len(row) > (column or 0)]
+    return [number.strip() for number in numbers if number and number.strip()]
+
+
+class CallPacer:
+    """Spaces calls.create requests to a fixed calls-per-second rate"""
+
+    def __init__(self, calls_per_second: float):
+        self.interval = 1.0 / calls_per_second if calls_per_second > 0 else 0.0
+        self._next_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next_at - now
+            self._next_at = max(now, self._next_at) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+def campaign_webhook_url() -> str:
+    """The configured webhook_url, which campaigns need for the completion callbacks that free call slots"""
+    webhook_url = (load_twilio_config().get("webhook_url") or "").strip().rstrip('/')
+    parts = urlsplit(webhook_url)
+    if parts.scheme not in ("http", "https") or not parts.netloc:
+        raise HTTPException(
+            status_code=400,
+            detail=f"webhook_url must be a public http(s) URL to run campaigns, got {webhook_url!r}"
+        )
+    return webhook_url
+
+
+def expected_call_seconds(message: str, interactive: bool) -> float:
+    """Upper estimate of a campaign call's length, from dialing to hang-up"""
+    if interactive:
+        talk_seconds = CAMPAIGN_INTERACTIVE_CALL_SECONDS
+    else:
+        talk_seconds = math.ceil(len(message.split()) / CAMPAIGN_SPEECH_WORDS_PER_SECOND)
+    return CAMPAIGN_RING_TIMEOUT_SECONDS + talk_seconds + CAMPAIGN_CALL_GRACE_SECONDS
+
+
+def _is_transient(error: Exception) -> bool:
+    """429s, 5xx responses and connection failures are worth retrying"""
+    if isinstance(error, TwilioRestException):
+        return error.status == 429 or error.status >= 500
+    return isinstance(error, (ConnectionError, TimeoutError, httpx.TransportError))
+
+
+class Campaign:
+    def __init__(self, manager: "CampaignManager", numbers: List[str], message: Optional[str], interactive: bool, name: Optional[str] = None):
+        self.id = uuid.uuid4().hex
+        self.name = name or self.id
+        self.manager = manager
+        self.message = message or DEFAULT_CAMPAIGN_MESSAGE
+        self.interactive = interactive
+        # A call's slot is freed after this long if its status callback never arrives
+        self.call_timeout = expected_call_seconds(self.message, interactive)
+        self.status = "pending"
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.calls: List[CampaignCall] = []
+        self.duplicates = 0
+        seen = set()
+        for number in numbers:
+            if number in seen:
+                self.duplicates += 1
+                continue
+            seen.add(number)
+            call = CampaignCall(number)
+            if not number.startswith('+'):
+                call.status = "failed"
+                call.error = "Phone number must include country code (e.g., +1234567890)"
+            self.calls.append(call)
+        self._resume = asyncio.Event()
+        self._resume.set()
+        self._task: Optional[asyncio.Task] = None
+        self._dials: set = set()
+
+    def start(self):
+        self.status = "running"
+        self.started_at = time.time()
+        self._task = asyncio.create_task(self._run())
+
+    def pause(self):
+        if self.status == "running":
+            self.status = "paused"
+            self._resume.clear()
+
+    def resume(self):
+        if self.status == "paused":
+            self.status = "running"
+            self._resume.set()
+
+    def cancel(self):
+        if self.status in ("pending", "running", "paused"):
+            self.status = "cancelled"
+            self._resume.set()
+
+    async def _run(self):
+        try:
+            for call in self.calls:
+                if call.status != "queued":
+                    continue
+                await self._resume.wait()
+                if self.status == "cancelled":
+                    break
+                await self.manager.acquire_slot(call)
+                if self.status == "cancelled":
+                    self.manager.release_slot(call)
+                    break
+                call.status = "dialing"
+                task = asyncio.create_task(self._dial(call))
+                self._dials.add(task)
+                task.add_done_callback(self._dials.discard)
+            if self._dials:
+                await asyncio.gather(*self._dials, return_exceptions=True)
+            if self.status != "cancelled":
+                self.status = "completed"
+        except Exception as e:
+            logger.error(f"Campaign {self.id} stopped: {e}")
+            self.status = "failed"
+        finally:
+            self.finished_at = time.time()
+            logger.info(f"Campaign {self.id} {self.status}: {self.progress()['counts']}")
+
+    async def _dial(self, call: CampaignCall):
+        while True:
+            await self.manager.pacer.wait()
+            call.attempts += 1
+            try:
+                created = await self.manager.create_call(call.phone_number, self.message, self.interactive)
+                call.status = "initiated"
+                call.call_sid = created.sid
+                call.error = None
+                await self.manager.track_call(call, self.call_timeout)
+                return
+            except Exception as e:
+                call.error = str(e)
+                if not _is_transient(e) or call.attempts > CAMPAIGN_MAX_RETRIES or self.status == "cancelled":
+                    logger.error(f"Campaign {self.id} failed to call {call.phone_number}: {e}")
+                    call.status = "failed"
+                    self.manager.release_slot(call)
+                    return
+                delay = min(CAMPAIGN_RETRY_MAX_SECONDS, CAMPAIGN_RETRY_BASE_SECONDS * 2 ** (call.attempts - 1))
+                delay *= random.uniform(0.5, 1.0)
+                logger.warning(f"Campaign {self.id} retrying {call.phone_number} in {delay:.1f}s: {e}")
+                await asyncio.sleep(delay)
+
+    def progress(self) -> Dict[str, Any]:
+        counts: Dict[str, int] = {}
+        for call in self.calls:
+            counts[call.status] = counts.get(call.status, 0) + 1
+        dialed = counts.get("initiated", 0) + counts.get("finished", 0)
+        elapsed = ((self.finished_at or time.time()) - self.started_at) if self.started_at else 0.0
+        return {
+            "campaign_id": self.id,
+            "name": self.name,
+            "status": self.status,
+            "interactive": self.interactive,
+            "total_numbers": len(self.calls),
+            "duplicates_skipped": self.duplicates,
+            "counts": counts,
+            "completed_percent": round(100 * sum(1 for call in self.calls if call.status not in ("queued", "dialing")) / max(len(self.calls), 1), 2),
+            "elapsed_seconds": round(elapsed, 3),
+            "calls_per_second": round(dialed / elapsed, 3) if elapsed > 0 else 0.0,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at
+        }
+
+
+class CampaignManager:
+    """Runs campaigns against shared account-wide CPS and concurrency limits
+
+    Slots belong to the worker that placed the call, but Twilio's status
+    callback may reach any worker. The callback records the final status in
+    the call state store, which this worker polls for its live calls; with
+    several workers that store must be shared (CALL_STATE_BACKEND=sqlite).
+    """
+
+    def __init__(self, calls_per_second: float = CAMPAIGN_CALLS_PER_SECOND, max_concurrent_calls: int = CAMPAIGN_MAX_CONCURRENT_CALLS):
+        self.campaigns: Dict[str, Campaign] = {}
+        self.pacer = CallPacer(calls_per_second)
+        self.max_concurrent_calls = max_concurrent_calls
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._live: Dict[str, CampaignCall] = {}
+        self._slot_timers: Dict[str, asyncio.TimerHandle] = {}
+        self._status_poller: Optional[asyncio.Task] = None
+        self.evictions = 0
+
+    async def create_call(self, phone_number: str, message: str, interactive: bool):
+        """Place one call with the same parameters as make_outbound_call_logic"""
+        webhook_url = campaign_webhook_url()
+        params = {
+            "to": phone_number,
+            "from_": get_twilio_phone_number(),
+            "timeout": CAMPAIGN_RING_TIMEOUT_SECONDS,
+            # Completion callbacks free the call's concurrency slot
+            "status_callback": f"{webhook_url}/voice/status",
+            "status_callback_method": 'POST'
+        }
+        if interactive:
+            params.update(url=f"{webhook_url}/voice/outbound", method='POST', time_limit=CAMPAIGN_INTERACTIVE_CALL_SECONDS)
+        else:
+            params["twiml"] = f'<Response><Say voice="alice">{escape(message)}</Say></Response>'
+        return await get_twilio_client().calls.create_async(**params)
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_concurrent_calls)
+        return self._slots
+
+    async def acquire_slot(self, call: CampaignCall):
+        await self._semaphore().acquire()
+        call.slot_held = True
+
+    def release_slot(self, call: CampaignCall):
+        if call.slot_held:
+            call.slot_held = False
+            self._semaphore().release()
+        timer = self._slot_timers.pop(call.call_sid, None) if call.call_sid else None
+        if timer:
+            timer.cancel()
+
+    async def track_call(self, call: CampaignCall, timeout: float):
+        self._live[call.call_sid] = call
+        self._slot_timers[call.call_sid] = asyncio.get_running_loop().call_later(timeout, self._expire_call, call)
+        try:
+            await call_state_store.put(CallState(
+                call_sid=call.call_sid, direction="outbound", step="campaign", to_number=call.phone_number
+            ))
+        except Exception as e:
+            # The slot timer still frees the slot
+            logger.error(f"Recording call state for campaign call {call.call_sid} failed: {e}")
+        if self._status_poller is None or self._status_poller.done():
+            self._status_poller = asyncio.create_task(self._poll_call_status())
+
+    async def _poll_call_status(self):
+        """Free slots of live calls whose status callback was handled by another worker"""
+        while self._live:
+            await asyncio.sleep(CAMPAIGN_STATUS_POLL_SECONDS)
+            for call_sid in list(self._live):
+                try:
+                    state = await call_state_store.get(call_sid)
+                except Exception as e:
+                    logger.error(f"Checking call state of campaign call {call_sid} failed: {e}")
+                    break
+                if state is not None and state.status in FINAL_CALL_STATUSES:
+                    self.on_call_status(call_sid, state.status)
+
+    def _expire_call(self, call: CampaignCall):
+        self._slot_timers.pop(call.call_sid, None)
+        self._live.pop(call.call_sid, None)
+        self.release_slot(call)
+
+    def on_call_status(self, call_sid: str, call_status: str):
+        """Record a final call status from Twilio and free the call's slot"""
+        call = self._live.pop(call_sid, None)
+        if call is None:
+            return
+        call.status = "finished"
+        call.call_status = call_status
+        self.release_slot(call)
+
+    def _evict_finished(self):
+        """Drop finished campaigns past the retention period, then the oldest beyond the cap"""
+        now = time.time()
+        finished = sorted(
+            (campaign for campaign in self.campaigns.values() if campaign.finished_at is not None),
+            key=lambda campaign: campaign.finished_at
+        )
+        expired = [campaign for campaign in finished if now - campaign.finished_at >= CAMPAIGN_RETENTION_SECONDS]
+        kept = finished[len(expired):]
+        doomed = expired + kept[:max(0, len(kept) - CAMPAIGN_MAX_FINISHED)]
+        for campaign in doomed:
+            del self.campaigns[campaign.id]
+        self.evictions += len(doomed)
+
+    def create(self, numbers: List[str], message: Optional[str] = None, interactive: bool = False, name: Optional[str] = None) -> Campaign:
+        self._evict_finished()
+        if not numbers:
+            raise HTTPException(status_code=400, detail="No phone numbers provided")
+        # Fail before dialing rather than on every number
+        campaign_webhook_url()
+        campaign = Campaign(self, numbers, message, interactive, name)
+        self.campaigns[campaign.id] = campaign
+        campaign.start()
+        logger.info(f"Campaign {campaign.id} started with {len(campaign.calls)} numbers")
+        return campaign
+
+    def get(self, campaign_id: str) -> Campaign:
+        self._evict_finished()
+        campaign = self.campaigns.get(campaign_id)
+        if campaign is None:
+            raise HTTPException(status_code=404, detail=f"Campaign {campaign_id} not found")
+        return campaign
+
+    def stats(self) -> Dict[str, Any]:
+        self._evict_finished()
+        return {
+            "calls_per_second_limit": CAMPAIGN_CALLS_PER_SECOND,
+            "max_concurrent_calls": self.max_concurrent_calls,
+            "live_calls": len(self._live),
+            "retention_seconds": CAMPAIGN_RETENTION_SECONDS,
+            "max_finished_campaigns": CAMPAIGN_MAX_FINISHED,
+            "evicted_campaigns": self.evictions,
+            "campaigns": [campaign.progress() for campaign in self.campaigns.values()]
+        }
+
+
+campaign_manager = CampaignManager()
@@ -0,0 +1,535 @@
+"""Per-tenant FAQ: precomputed answers to frequent questions, served before RAG
+
+Entries live in a JSON file (FAQ_STORE_PATH) and are matched in order of
+cost: normalized exact match, fuzzy string match, then similarity of the
+query embedding to the entry's question and variant phrasings. Answers
+written by an admin are served as-is. Answers generated by RAG (mined
+entries, or entries seeded without an answer) are marked stale when the
+tenant's documents change and are not served until a rebuild regenerates them.
+"""
+import os
+import re
+import copy
+import json
+import time
+import uuid
+import hashlib
+import asyncio
+import logging
+from datetime import datetime
+from difflib import SequenceMatcher
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+import numpy as np
+from fastapi import HTTPException
+from config.twilio_config_handler import ConfigProvider
+from services.cache import TTLCache
+from vectordb_files.pre_pocess import rag_qna_chatbot, embed_query_cached, embedding_model
+
+logger = logging.getLogger(__name__)
+
+FAQ_ENABLED = os.getenv("FAQ_ENABLED", "true").lower() == "true"
+FAQ_STORE_PATH = os.getenv("FAQ_STORE_PATH", str(Path(__file__).parent.parent / "faq_store.json"))
+# Minimum difflib ratio between normalized questions for a fuzzy match
+FAQ_FUZZY_THRESHOLD = float(os.getenv("FAQ_FUZZY_THRESHOLD", "0.9"))
+# Minimum cosine similarity between the query embedding and an entry's for an embedding match
+FAQ_EMBEDDING_THRESHOLD = float(os.getenv("FAQ_EMBEDDING_THRESHOLD", "0.93"))
+# Mining: times a question must have been asked, and most entries added per run
+FAQ_MINE_MIN_COUNT = int(os.getenv("FAQ_MINE_MIN_COUNT", "3"))
+FAQ_MINE_MAX_ENTRIES = int(os.getenv("FAQ_MINE_MAX_ENTRIES", "20"))
+# Answers generated at once during mining and rebuilds
+FAQ_GENERATION_CONCURRENCY = int(os.getenv("FAQ_GENERATION_CONCURRENCY", "2"))
+# Asked questions remembered for mining, per (tenant, question)
+FAQ_QUERY_LOG_SIZE = int(os.getenv("FAQ_QUERY_LOG_SIZE", "10000"))
+FAQ_QUERY_LOG_TTL = float(os.getenv("FAQ_QUERY_LOG_TTL", str(7 * 86400)))
+
+# Generated answers with a lower RAG confidence are not served from the FAQ
+SERVABLE_CONFIDENCE = ("high", "medium")
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+
+
+def normalize_question(text: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace"""
+    return " ".join(_PUNCTUATION.sub("", text.lower()).split())
+
+
+def parse_entries(content: bytes) -> List[Dict[str, Any]]:
+    """Read FAQ entries from a JSON array, or an object with an "entries" array
+
+    Each item is an object with a question, and optionally an answer and a
+    list of variant phrasings.
+    """
+    data = json.loads(content.decode("utf-8-sig"))
+    if isinstance(data, dict):
+        data = data.get("entries") or []
+    if not isinstance(data, list) or not all(isinstance(item, dict) for item in data):
+        raise ValueError("expected a list of objects with question, answer and variants")
+    return [
+        {"question": str(item.get("question") or ""), "answer": item.get("answer"), "variants": list(item.get("variants") or [])}
+        for item in data
+    ]
+
+
+def _now() -> str:
+    return datetime.now().isoformat()
+
+
+def _with_defaults(entry: Dict[str, Any]) -> Dict[str, Any]:
+    """Fill in fields that entries written into the file by hand may leave out"""
+    question = entry.get("question") or ""
+    answer = entry.get("answer") or None
+    return {
+        "id": hashlib.sha1(normalize_question(question).encode("utf-8")).hexdigest()[:12],
+        "variants": [],
+        "source": "manual",
+        "generated": answer is None,
+        "stale": answer is None,
+        "confidence": None,
+        "asked": 0,
+        **entry,
+        "question": question,
+        "answer": answer
+    }
+
+
+def _new_entry(question: str, answer: Optional[str] = None, variants: Optional[List[str]] = None,
+               source: str = "manual", asked: int = 0, confidence: Optional[str] = None) -> Dict[str, Any]:
+    question = (question or "").strip()
+    if not normalize_question(question):
+        raise HTTPException(status_code=400, detail="question is required")
+    answer = (answer or "").strip() or None
+    return {
+        "id": uuid.uuid4().hex[:12],
+        "question": question,
+        "variants": [v.strip() for v in variants or [] if v.strip()],
+        "answer": answer,
+        "source": source,
+        "generated": source == "mined" or answer is None,
+        "stale": answer is None,
+        "confidence": confidence,
+        "asked": asked,
+        "created_at": _now(),
+        "updated_at": _now()
+    }
+
+
+def _servable(entry: Dict[str, Any]) -> bool:
+    return bool(entry.get("answer")) and not entry.get("stale")
+
+
+def _entry_texts(entry: Dict[str, Any]) -> List[str]:
+    texts = [normalize_question(text) for text in [entry["question"], *entry.get("variants", [])]]
+    return list(dict.fromkeys(text for text in texts if text))
+
+
+def _unit(vector) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class _TenantIndex:
+    """Servable entries of one tenant, keyed for exact, fuzzy and embedding lookup"""
+
+    def __init__(self, entries: List[Dict[str, Any]], vectors: Dict[str, np.ndarray]):
+        self.entries = {entry["id"]: entry for entry in entries if _servable(entry)}
+        self.exact: Dict[str, str] = {}
+        self.texts: List[tuple] = []
+        for entry_id, entry in self.entries.items():
+            for text in _entry_texts(entry):
+                self.exact.setdefault(text, entry_id)
+                self.texts.append((text, entry_id))
+        embedded = [(text, entry_id) for text, entry_id in self.texts if text in vectors]
+        self.vector_ids = [entry_id for _, entry_id in embedded]
+        self.matrix = np.stack([vectors[text] for text, _ in embedded]) if embedded else None
+
+
+class FAQStore:
+    """FAQ entries per tenant, with in-memory match indexes rebuilt when the file changes"""
+
+    def __init__(self, path: str = FAQ_STORE_PATH):
+        self._provider = ConfigProvider(Path(path))
+        self._indexes: Dict[str, _TenantIndex] = {}
+        self._indexed_version = None
+        # Unit-length embeddings of normalized question texts, shared across tenants
+        self._vectors: Dict[str, np.ndarray] = {}
+        self._query_log = TTLCache(max_size=FAQ_QUERY_LOG_SIZE, ttl_seconds=FAQ_QUERY_LOG_TTL)
+        self._rebuild_locks: Dict[str, asyncio.Lock] = {}
+        # Bumped when a tenant's documents change, so a rebuild started earlier does not clear staleness
+        self._document_versions: Dict[str, int] = {}
+        self._tasks = set()
+        # Serializes read-modify-write of the entries while saves run on a thread
+        self._write_lock = asyncio.Lock()
+        self._entry_hits: Dict[tuple, int] = {}
+        self.hits = {"exact": 0, "fuzzy": 0, "embedding": 0}
+        self.misses = 0
+        self.lookup_seconds = 0.0
+        self.rebuilds = 0
+        self.last_rebuild: Optional[Dict[str, Any]] = None
+
+    # Storage
+
+    def entries(self, tenant: str) -> List[Dict[str, Any]]:
+        """A copy of the tenant's entries, safe to modify"""
+        entries = (self._provider.get().get("tenants") or {}).get(tenant, [])
+        return [_with_defaults(copy.deepcopy(entry)) for entry in entries]
+
+    async def _save(self, tenant: str, entries: List[Dict[str, Any]]):
+        """Replace the tenant's entries; call with the write lock held"""
+        config = self._provider.get()
+        tenants = dict(config.get("tenants") or {})
+        tenants[tenant] = entries
+        config["tenants"] = tenants
+        # Atomic write with fsync; keep it off the event loop
+        await asyncio.to_thread(self._provider.save, config)
+
+    async def _append(self, tenant: str, new_entries: List[Dict[str, Any]]):
+        async with self._write_lock:
+            entries = self.entries(tenant)
+            entries.extend(new_entries)
+            await self._save(tenant, entries)
+
+    def _index(self, tenant: str) -> _TenantIndex:
+        config = self._provider.get()  # picks up edits made to the file directly
+        if self._indexed_version != self._provider.version:
+            self._indexes.clear()
+            self._indexed_version = self._provider.version
+        index = self._indexes.get(tenant)
+        if index is None:
+            entries = (config.get("tenants") or {}).get(tenant, [])
+            index = _TenantIndex([_with_defaults(entry) for entry in entries], self._vectors)
+            self._indexes[tenant] = index
+        return index
+
+    def get(self, tenant: str, entry_id: str) -> Dict[str, Any]:
+        entry = next((entry for entry in self.entries(tenant) if entry["id"] == entry_id), None)
+        if entry is None:
+            raise HTTPException(status_code=404, detail=f"FAQ entry {entry_id} not found for tenant '{tenant}'")
+        return {**entry, "hits": self._entry_hits.get((tenant, entry_id), 0)}
+
+    def list_entries(self, tenant: str) -> List[Dict[str, Any]]:
+        return [{**entry, "hits": self._entry_hits.get((tenant, entry["id"]), 0)} for entry in self.entries(tenant)]
+
+    async def add(self, tenant: str, question: str, answer: Optional[str] = None, variants: Optional[List[str]] = None,
+                  source: str = "manual", asked: int = 0, confidence: Optional[str] = None) -> Dict[str, Any]:
+        """Add an entry; without an answer it is generated by the next rebuild"""
+        entry = _new_entry(question, answer, variants, source, asked, confidence)
+        await self._append(tenant, [entry])
+        logger.info(f"Added FAQ entry {entry['id']} for tenant '{tenant}': {entry['question']}")
+        return entry
+
+    async def add_entries(self, tenant: str, items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Add parsed entries (see parse_entries) with a single save; none are added if one is invalid"""
+        entries = [_new_entry(item["question"], item.get("answer"), item.get("variants")) for item in items]
+        await self._append(tenant, entries)
+        logger.info(f"Added {len(entries)} FAQ entries for tenant '{tenant}'")
+        return entries
+
+    async def update(self, tenant: str, entry_id: str, question: Optional[str] = None, answer: Optional[str] = None,
+                     variants: Optional[List[str]] = None, regenerate: bool = False) -> Dict[str, Any]:
+        """Change an entry; a new answer makes it manual, `regenerate` hands it back to RAG"""
+        async with self._write_lock:
+            entries = self.entries(tenant)
+            entry = next((entry for entry in entries if entry["id"] == entry_id), None)
+            if entry is None:
+                raise HTTPException(status_code=404, detail=f"FAQ entry {entry_id} not found for tenant '{tenant}'")
+            if question is not None:
+                if not normalize_question(question):
+                    raise HTTPException(status_code=400, detail="question must not be empty")
+                if question.strip() != entry["question"] and entry["generated"]:
+                    entry["stale"] = True
+                entry["question"] = question.strip()
+            if variants is not None:
+                entry["variants"] = [v.strip() for v in variants if v.strip()]
+            if answer is not None and answer.strip():
+                entry.update(answer=answer.strip(), generated=False, stale=False, confidence=None)
+            if regenerate:
+                entry.update(generated=True, stale=True)
+            entry["updated_at"] = _now()
+            await self._save(tenant, entries)
+            return entry
+
+    async def delete(self, tenant: str, entry_id: str) -> Dict[str, Any]:
+        async with self._write_lock:
+            entries = self.entries(tenant)
+            remaining = [entry for entry in entries if entry["id"] != entry_id]
+            if len(remaining) == len(entries):
+                raise HTTPException(status_code=404, detail=f"FAQ entry {entry_id} not found for tenant '{tenant}'")
+            await self._save(tenant, remaining)
+        self._entry_hits.pop((tenant, entry_id), None)
+        return {"status": "deleted", "id": entry_id}
+
+    # Lookup
+
+    def _fuzzy(self, index: _TenantIndex, query: str) -> Optional[tuple]:
+        matcher = SequenceMatcher(autojunk=False)
+        matcher.set_seq2(query)  # seq2 is the side SequenceMatcher preprocesses
+        best = None
+        for text, entry_id in index.texts:
+            matcher.set_seq1(text)
+            if matcher.real_quick_ratio() < FAQ_FUZZY_THRESHOLD or matcher.quick_ratio() < FAQ_FUZZY_THRESHOLD:
+                continue
+            ratio = matcher.ratio()
+            if ratio >= FAQ_FUZZY_THRESHOLD and (best is None or ratio > best[1]):
+                best = (entry_id, ratio)
+        return best
+
+    def match_text(self, tenant: str, query: str) -> Optional[Dict[str, Any]]:
+        """Exact, then fuzzy match of the normalized question; no network calls"""
+        index = self._index(tenant)
+        normalized = normalize_question(query)
+        if not normalized or not index.entries:
+            return None
+        entry_id = index.exact.get(normalized)
+        if entry_id is not None:
+            return {**index.entries[entry_id], "match": "exact", "similarity": 1.0}
+        best = self._fuzzy(index, normalized)
+        if best is not None:
+            return {**index.entries[best[0]], "match": "fuzzy", "similarity": round(best[1], 4)}
+        return None
+
+    def match_embedding(self, tenant: str, embedding: List[float]) -> Optional[Dict[str, Any]]:
+        index = self._index(tenant)
+        if index.matrix is None:
+            return None
+        scores = index.matrix @ _unit(embedding)
+        best = int(np.argmax(scores))
+        if scores[best] < FAQ_EMBEDDING_THRESHOLD:
+            return None
+        return {**index.entries[index.vector_ids[best]], "match": "embedding", "similarity": round(float(scores[best]), 4)}
+
+    async def lookup(self, tenant: str, query: str, timings: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        """Answer from the FAQ if the question matches an entry
+
+        The embedding match uses the cached query embedding, which RAG reuses
+        on a miss. If `timings` is given it receives the lookup time, the
+        kind of match, and the embedding time if the query had to be embedded.
+        """
+        if not FAQ_ENABLED:
+            return None
+        started = time.perf_counter()
+        match = self.match_text(tenant, query)
+        if match is None and self._index(tenant).matrix is not None:
+            try:
+                embedding = await embed_query_cached(query, timings)
+                match = self.match_embedding(tenant, embedding)
+            except Exception as e:
+                logger.error(f"FAQ embedding lookup failed: {e}")
+        elapsed = time.perf_counter() - started
+        self.lookup_seconds += elapsed
+        if timings is not None:
+            timings["faq_seconds"] = round(elapsed, 4)
+        if match is None:
+            self.misses += 1
+            return None
+        self.hits[match["match"]] += 1
+        key = (tenant, match["id"])
+        self._entry_hits[key] = self._entry_hits.get(key, 0) + 1
+        if timings is not None:
+            timings["faq_match"] = match["match"]
+        logger.info(f"FAQ {match['match']} match ({match['similarity']}) for tenant '{tenant}': {match['question']}")
+        return match
+
+    # Query log and mining
+
+    def log_query(self, tenant: str, query: str):
+        """Count an asked question for later mining"""
+        normalized = normalize_question(query)
+        if not normalized:
+            return
+        key = (tenant, normalized)
+        logged = self._query_log.get(key, count=False)
+        self._query_log.set(key, {
+            "query": query.strip(),
+            "count": (logged["count"] if logged else 0) + 1,
+            "last_seen": _now()
+        })
+
+    def logged_queries(self, tenant: str, limit: int = 100) -> List[Dict[str, Any]]:
+        """Most asked questions for a tenant"""
+        queries = [{"normalized": key[1], **value} for key, value in self._query_log.items() if key[0] == tenant]
+        return sorted(queries, key=lambda q: q["count"], reverse=True)[:limit]
+
+    async def _generate(self, tenant: str, question: str) -> Dict[str, Any]:
+        result = await rag_qna_chatbot(user_query=question, username=tenant)
+        fallback = result.get("timings", {}).get("fallback")
+        if result.get("status") != "success" or fallback:
+            return {"error": fallback or result.get("error") or "no answer"}
+        if result.get("confidence") not in SERVABLE_CONFIDENCE:
+            return {"error": f"{result.get('confidence')} confidence", "confidence": result.get("confidence")}
+        return {"answer": result["answer"], "confidence": result["confidence"]}
+
+    async def _generate_all(self, tenant: str, questions: List[str]) -> List[Dict[str, Any]]:
+        semaphore = asyncio.Semaphore(FAQ_GENERATION_CONCURRENCY)
+
+        async def generate(question):
+            async with semaphore:
+                try:
+                    return await self._generate(tenant, question)
+                except Exception as e:
+                    logger.error(f"Generating FAQ answer failed for '{question}': {e}")
+                    return {"error": str(e)}
+        return await asyncio.gather(*(generate(question) for question in questions))
+
+    async def mine(self, tenant: str, min_count: int = None, max_entries: int = None) -> Dict[str, Any]:
+        """Turn frequently asked questions from the query log into FAQ entries
+
+        Questions already answered by an entry are skipped and near-duplicates
+        are grouped as variants of the most asked phrasing. Only questions
+        RAG answers with enough confidence are added.
+        """
+        min_count = FAQ_MINE_MIN_COUNT if min_count is None else min_count
+        max_entries = FAQ_MINE_MAX_ENTRIES if max_entries is None else max_entries
+        known = set()
+        for entry in self.entries(tenant):
+            known.update(_entry_texts(entry))
+        candidates = [q for q in self.logged_queries(tenant, limit=FAQ_QUERY_LOG_SIZE)
+                      if q["count"] >= min_count and q["normalized"] not in known]
+
+        groups: List[Dict[str, Any]] = []
+        matcher = SequenceMatcher(autojunk=False)
+        for candidate in candidates:
+            if self.match_text(tenant, candidate["normalized"]) is not None:
+                continue
+            matcher.set_seq2(candidate["normalized"])
+            for group in groups:
+                matcher.set_seq1(group["normalized"])
+                if matcher.quick_ratio() >= FAQ_FUZZY_THRESHOLD and matcher.ratio() >= FAQ_FUZZY_THRESHOLD:
+                    group["variants"].append(candidate["query"])
+                    group["count"] += candidate["count"]
+                    break
+            else:
+                groups.append({**candidate, "variants": []})
+        groups = sorted(groups, key=lambda g: g["count"], reverse=True)[:max_entries]
+
+        generated = await self._generate_all(tenant, [group["query"] for group in groups])
+        added, rejected = [], []
+        for group, result in zip(groups, generated):
+            if "answer" in result:
+                added.append(_new_entry(group["query"], result["answer"], group["variants"], source="mined",
+                                        asked=group["count"], confidence=result["confidence"]))
+            else:
+                rejected.append({"question": group["query"], "asked": group["count"], "reason": result["error"]})
+        if added:
+            await self._append(tenant, added)
+        await self._embed_tenant(tenant)
+        logger.info(f"Mined {len(added)} FAQ entries for tenant '{tenant}' from {len(candidates)} frequent questions")
+        return {"tenant": tenant, "candidates": len(candidates), "added": added, "rejected": rejected}
+
+    # Rebuild
+
+    async def _embed_tenant(self, tenant: str) -> int:
+        """Embed question texts of the tenant's entries that have no vector yet"""
+        texts = list(dict.fromkeys(text for entry in self.entries(tenant) for text in _entry_texts(entry)))
+        missing = [text for text in texts if text not in self._vectors]
+        if missing:
+            vectors = await embedding_model.aembed_documents(missing)
+            for text, vector in zip(missing, vectors):
+                self._vectors[text] = _unit(vector)
+            self._indexes.pop(tenant, None)
+        return len(missing)
+
+    async def rebuild(self, tenant: str) -> Dict[str, Any]:
+        """Regenerate stale generated answers and embed new question texts"""
+        lock = self._rebuild_locks.setdefault(tenant, asyncio.Lock())
+        async with lock:
+            started = time.perf_counter()
+            version = self._document_versions.get(tenant, 0)
+            stale = [entry for entry in self.entries(tenant) if entry["generated"] and entry["stale"]]
+            results = await self._generate_all(tenant, [entry["question"] for entry in stale])
+
+            # Apply to the current entries: they may have been edited while answers were generated
+            refreshed, failed = 0, []
+            async with self._write_lock:
+                if self._document_versions.get(tenant, 0) == version:
+                    by_id = {entry["id"]: (entry, result) for entry, result in zip(stale, results)}
+                    entries = self.entries(tenant)
+                    for entry in entries:
+                        original, result = by_id.get(entry["id"], (None, None))
+                        if original is None or entry["question"] != original["question"] or not entry["generated"]:
+                            continue
+                        if "answer" in result:
+                            entry.update(answer=result["answer"], confidence=result["confidence"], stale=False,
+                                         updated_at=_now())
+                            refreshed += 1
+                        else:
+                            entry["confidence"] = result.get("confidence")
+                            failed.append({"id": entry["id"], "question": entry["question"], "reason": result["error"]})
+                    if stale:
+                        await self._save(tenant, entries)
+
+            try:
+                embedded = await self._embed_tenant(tenant)
+            except Exception as e:
+                # Exact and fuzzy matching still work without vectors
+                logger.error(f"Embedding FAQ questions for tenant '{tenant}' failed: {e}")
+                embedded = 0
+            self._prune_vectors()
+            self.rebuilds += 1
+            self.last_rebuild = {
+                "tenant": tenant,
+                "at": _now(),
+                "seconds": round(time.perf_counter() - started, 3),
+                "regenerated": refreshed,
+                "failed": failed,
+                "embedded_texts": embedded
+            }
+            logger.info(f"Rebuilt FAQ for tenant '{tenant}': {refreshed} answers regenerated, "
+                        f"{len(failed)} failed, {embedded} questions embedded")
+            return self.last_rebuild
+
+    def _prune_vectors(self):
+        tenants = self._provider.get().get("tenants") or {}
+        used = {text for entries in tenants.values() for entry in entries for text in _entry_texts(_with_defaults(entry))}
+        for text in [text for text in self._vectors if text not in used]:
+            del self._vectors[text]
+
+    async def documents_changed(self, tenant: str):
+        """Mark generated answers stale and regenerate them in the background"""
+        self._document_versions[tenant] = self._document_versions.get(tenant, 0) + 1
+        async with self._write_lock:
+            entries = self.entries(tenant)
+            stale = [entry for entry in entries if entry["generated"]]
+            if not stale:
+                return
+            for entry in stale:
+                entry["stale"] = True
+            await self._save(tenant, entries)
+        logger.info(f"Documents changed for tenant '{tenant}': regenerating {len(stale)} FAQ answers")
+        task = asyncio.create_task(self.rebuild(tenant))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def warm(self):
+        """Embed every tenant's FAQ questions so embedding matches work from the first call"""
+        for tenant in self._provider.get().get("tenants") or {}:
+            await self._embed_tenant(tenant)
+
+    def stats(self) -> Dict[str, Any]:
+        tenants = self._provider.get().get("tenants") or {}
+        entries = [_with_defaults(entry) for tenant_entries in tenants.values() for entry in tenant_entries]
+        hits = sum(self.hits.values())
+        lookups = hits + self.misses
+        return {
+            "enabled": FAQ_ENABLED,
+            "path": str(self._provider.path),
+            "tenants": len(tenants),
+            "entries": len(entries),
+            "servable_entries": sum(1 for entry in entries if _servable(entry)),
+            "stale_entries": sum(1 for entry in entries if entry.get("stale")),
+            "embedded_texts": len(self._vectors),
+            "fuzzy_threshold": FAQ_FUZZY_THRESHOLD,
+            "embedding_threshold": FAQ_EMBEDDING_THRESHOLD,
+            "lookups": lookups,
+            "hits": dict(self.hits),
+            "misses": self.misses,
+            "hit_rate": round(hits / lookups, 3) if lookups else None,
+            "avg_lookup_ms": round(self.lookup_seconds / lookups * 1000, 3) if lookups else None,
+            "logged_queries": len(self._query_log),
+            "rebuilds": self.rebuilds,
+            "last_rebuild": self.last_rebuild
+        }
+
+
+faq_store = FAQStore()
@@ -0,0 +1,82 @@
+import os
+import io
+import asyncio
+import logging
+from typing import Optional, Tuple
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Shared connection pool settings
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "30"))
+
+# Twilio can answer 404 for a short while before a recording is ready
+RECORDING_FETCH_RETRIES = int(os.getenv("RECORDING_FETCH_RETRIES", "3"))
+RECORDING_FETCH_RETRY_DELAY = float(os.getenv("RECORDING_FETCH_RETRY_DELAY", "0.5"))
+
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Return the shared keep-alive HTTP client, creating it on first use"""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY
+            ),
+            timeout=httpx.Timeout(HTTP_READ_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+            follow_redirects=True
+        )
+    return _http_client
+
+
+async def close_http_client():
+    """Close the shared HTTP client and its pooled connections"""
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+async def download_recording(
+    recording_url: str,
+    auth: Tuple[str, str],
+    retries: int = None,
+    retry_delay: float = None
+) -> Optional[io.BytesIO]:
+    """Download a Twilio call recording as WAV, retrying while it is not yet available
+
+    Returns a named in-memory file ready for upload to the STT API, or None
+    if the recording could not be fetched.
+    """
+    retries = RECORDING_FETCH_RETRIES if retries is None else retries
+    retry_delay = RECORDING_FETCH_RETRY_DELAY if retry_delay is None else retry_delay
+    client = get_http_client()
+    url = recording_url + ".wav"
+
+    for attempt in range(retries + 1):
+        async with client.stream("GET", url, auth=auth) as response:
+            if response.status_code == 200:
+                audio_file = io.BytesIO()
+                async for block in response.aiter_bytes():
+                    audio_file.write(block)
+                audio_file.seek(0)
+                audio_file.name = "recording.wav"
+                return audio_file
+            if response.status_code != 404:
+                logger.error(f"Recording download failed with status {response.status_code}: {url}")
+                return None
+
+        if attempt < retries:
+            logger.info(f"Recording not ready yet, retry {attempt + 1}/{retries}: {url}")
+            await asyncio.sleep(retry_delay * (attempt + 1))
+
+    logger.error(f"Recording still unavailable after {retries} retries: {url}")
+    return None
@@ -0,0 +1,108 @@
+import os
+import re
+import time
+import logging
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from services.openai_client import async_openai_client
+
+logger = logging.getLogger(__name__)
+
+LLM_MODEL = os.getenv("LLM_MODEL", "gpt-4.1")
+# Segments shorter than this are held back and merged with the next sentence
+LLM_MIN_SEGMENT_CHARS = int(os.getenv("LLM_MIN_SEGMENT_CHARS", "20"))
+
+# Sentence end: terminal punctuation, optional closing quotes/brackets, then whitespace
+_SENTENCE_END = re.compile(r'[.!?]+["\')\]]*\s+')
+
+_totals = {"requests": 0, "errors": 0, "ttft_seconds": 0.0, "total_seconds": 0.0}
+
+
+async def stream_llm_tokens(
+    messages: List[Dict[str, str]],
+    model: str = None,
+    temperature: float = None,
+    timings: Optional[Dict[str, Any]] = None
+) -> AsyncIterator[str]:
+    """Stream text deltas from the Responses API
+
+    If `timings` is given it is filled with time-to-first-token and total
+    generation time once the stream finishes.
+    """
+    started = time.perf_counter()
+    first_token_at = None
+    output_chars = 0
+    request = {"model": model or LLM_MODEL, "input": messages, "stream": True}
+    if temperature is not None:
+        request["temperature"] = temperature
+    try:
+        stream = await async_openai_client.responses.create(**request)
+        try:
+            async for event in stream:
+                if event.type != "response.output_text.delta" or not event.delta:
+                    continue
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                output_chars += len(event.delta)
+                yield event.delta
+        finally:
+            await stream.close()
+    except Exception:
+        _totals["errors"] += 1
+        raise
+    finished = time.perf_counter()
+    ttft = (first_token_at or finished) - started
+    _totals["requests"] += 1
+    _totals["ttft_seconds"] += ttft
+    _totals["total_seconds"] += finished - started
+    if timings is not None:
+        timings["ttft_seconds"] = round(ttft, 3)
+        timings["generation_seconds"] = round(finished - started, 3)
+        timings["output_chars"] = output_chars
+    logger.info(f"LLM generation: first token {ttft:.2f}s, total {finished - started:.2f}s, {output_chars} chars")
+
+
+async def generate_text(
+    messages: List[Dict[str, str]],
+    model: str = None,
+    temperature: float = None
+) -> Tuple[str, Dict[str, Any]]:
+    """Generate a full answer over the streaming API, returning it with its timings"""
+    timings = {}
+    parts = [token async for token in stream_llm_tokens(messages, model=model, temperature=temperature, timings=timings)]
+    return "".join(parts), timings
+
+
+async def stream_sentences(tokens: AsyncIterator[str], min_chars: int = None) -> AsyncIterator[str]:
+    """Regroup a token stream into sentence-sized segments for early speech"""
+    min_chars = LLM_MIN_SEGMENT_CHARS if min_chars is None else min_chars
+    buffer = ""
+    async for token in tokens:
+        buffer += token
+        search_from = 0
+        while True:
+            match = _SENTENCE_END.search(buffer, search_from)
+            if match is None:
+                break
+            if match.end() < min_chars:
+                search_from = match.end()
+                continue
+            segment = buffer[:match.end()].strip()
+            buffer = buffer[match.end():]
+            search_from = 0
+            if segment:
+                yield segment
+    segment = buffer.strip()
+    if segment:
+        yield segment
+
+
+def get_llm_stats() -> Dict[str, Any]:
+    """Return aggregate generation timings"""
+    requests = _totals["requests"]
+    return {
+        "model": LLM_MODEL,
+        "requests": requests,
+        "errors": _totals["errors"],
+        "avg_ttft_seconds": round(_totals["ttft_seconds"] / requests, 3) if requests else None,
+        "avg_generation_seconds": round(_totals["total_seconds"] / requests, 3) if requests else None
+    }
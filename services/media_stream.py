@@ -0,0 +1,221 @@
+import os
+import json
+import time
+import base64
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Dict, Optional
+from fastapi import WebSocket, WebSocketDisconnect
+from services.audio import (
+    MEDIA_SAMPLE_RATE, EnergyVAD, StreamResampler,
+    ulaw_to_pcm16, pcm16_to_ulaw, pcm16_to_wav
+)
+from services.call_state import CallState, call_state_store
+from services.stt_service import transcribe_audio
+from services.tts_service import stream_tts_pcm, TTS_PCM_SAMPLE_RATE
+from services.tenant import DEFAULT_TENANT
+from services.metrics import call_stage_seconds, call_errors_total, observe_rag_timings
+from services.faq import faq_store
+from vectordb_files.pre_pocess import rag_qna_stream
+
+logger = logging.getLogger(__name__)
+
+# Turns whose latency breakdown is kept for /media_stream_stats
+MEDIA_STREAM_TURN_HISTORY = int(os.getenv("MEDIA_STREAM_TURN_HISTORY", "200"))
+# Let the caller interrupt playback by speaking over it
+MEDIA_STREAM_BARGE_IN = os.getenv("MEDIA_STREAM_BARGE_IN", "true").lower() == "true"
+
+# RAG timings and outcome copied into each turn record
+_RAG_TURN_KEYS = (
+    "embedding_seconds", "search_seconds", "prompt_tokens", "ttft_seconds", "generation_seconds",
+    "faq_seconds", "faq_match", "answer_cache_hit", "fallback"
+)
+
+_recent_turns: deque = deque(maxlen=MEDIA_STREAM_TURN_HISTORY)
+_totals = {"sessions": 0, "active_sessions": 0, "turns": 0, "barge_ins": 0, "mouth_to_ear_seconds": 0.0}
+
+
+class MediaStreamSession:
+    """One Twilio Media Streams WebSocket: caller audio in, synthesized answer audio out
+
+    Each turn runs VAD end-of-speech -> STT -> retrieval and streaming
+    generation -> sentence-by-sentence TTS, with speech for the first
+    sentence sent while later sentences are still being generated.
+    Mouth-to-ear latency is measured from the caller's last voiced frame to
+    the first answer frame written back to the socket.
+    """
+
+    def __init__(self, websocket: WebSocket):
+        self.websocket = websocket
+        self.stream_sid: Optional[str] = None
+        self.call_sid: Optional[str] = None
+        self.tenant = DEFAULT_TENANT
+        self.direction = "inbound"
+        self.vad = EnergyVAD()
+        self.turns = 0
+        self._response: Optional[asyncio.Task] = None
+        self._send_lock = asyncio.Lock()
+
+    async def run(self):
+        await self.websocket.accept()
+        _totals["sessions"] += 1
+        _totals["active_sessions"] += 1
+        try:
+            while True:
+                message = json.loads(await self.websocket.receive_text())
+                event = message.get("event")
+                if event == "start":
+                    await self._on_start(message["start"])
+                elif event == "media":
+                    await self._on_media(message["media"])
+                elif event == "stop":
+                    break
+        except WebSocketDisconnect:
+            pass
+        except Exception as e:
+            logger.error(f"Media stream for call {self.call_sid} failed: {e}")
+        finally:
+            _totals["active_sessions"] -= 1
+            await self._cancel_response()
+            logger.info(f"Media stream for call {self.call_sid} closed after {self.turns} turns")
+
+    async def _on_start(self, start: Dict[str, Any]):
+        self.stream_sid = start.get("streamSid")
+        self.call_sid = start.get("callSid")
+        parameters = start.get("customParameters") or {}
+        call_state = await call_state_store.get(self.call_sid) if self.call_sid else None
+        self.tenant = parameters.get("tenant") or (call_state.tenant if call_state else "") or DEFAULT_TENANT
+        self.direction = parameters.get("direction") or (call_state.direction if call_state else "inbound")
+        if self.call_sid:
+            await call_state_store.put(CallState(
+                call_sid=self.call_sid, direction=self.direction, step="media_stream", tenant=self.tenant,
+                from_number=call_state.from_number if call_state else "",
+                to_number=call_state.to_number if call_state else ""
+            ))
+        logger.info(f"Media stream {self.stream_sid} started for call {self.call_sid}, tenant {self.tenant}")
+
+    async def _on_media(self, media: Dict[str, Any]):
+        if media.get("track", "inbound") != "inbound":
+            return
+        now = time.perf_counter()
+        event = self.vad.process(ulaw_to_pcm16(base64.b64decode(media["payload"])), now)
+        if event == "speech_start" and MEDIA_STREAM_BARGE_IN and self._responding():
+            _totals["barge_ins"] += 1
+            await self._cancel_response()
+            await self._send({"event": "clear", "streamSid": self.stream_sid})
+        elif event == "speech_end":
+            await self._cancel_response()
+            utterance = self.vad.pop_utterance()
+            self._response = asyncio.create_task(self._respond(utterance, self.vad.last_voiced_at, now))
+
+    def _responding(self) -> bool:
+        return self._response is not None and not self._response.done()
+
+    async def _cancel_response(self):
+        if self._responding():
+            self._response.cancel()
+            try:
+                await self._response
+            except asyncio.CancelledError:
+                pass
+
+    async def _send(self, message: Dict[str, Any]):
+        async with self._send_lock:
+            await self.websocket.send_text(json.dumps(message))
+
+    async def _send_audio(self, ulaw: bytes):
+        # Twilio buffers outbound audio, so chunks are sent as soon as they are synthesized
+        await self._send({
+            "event": "media",
+            "streamSid": self.stream_sid,
+            "media": {"payload": base64.b64encode(ulaw).decode("ascii")}
+        })
+
+    async def _respond(self, utterance, speech_ended_at: float, detected_at: float):
+        self.turns += 1
+        turn = {"call_sid": self.call_sid, "turn": self.turns, "tenant": self.tenant, "direction": self.direction,
+                "utterance_seconds": round(utterance.size / MEDIA_SAMPLE_RATE, 3),
+                "vad_seconds": round(detected_at - speech_ended_at, 3)}
+        try:
+            started = time.perf_counter()
+            question = await transcribe_audio(pcm16_to_wav(utterance), call_sid=self.call_sid, direction=self.direction)
+            turn["stt_seconds"] = round(time.perf_counter() - started, 3)
+            if not question:
+                return
+            logger.info(f"Media stream turn {self.turns} for call {self.call_sid}: {question}")
+
+            # Generation keeps running while earlier sentences are synthesized and sent
+            sentences: asyncio.Queue = asyncio.Queue()
+            llm_timings: Dict[str, Any] = {}
+
+            async def produce():
+                try:
+                    faq_store.log_query(self.tenant, question)
+                    faq = await faq_store.lookup(self.tenant, question, timings=llm_timings)
+                    if faq is not None:
+                        await sentences.put(faq["answer"])
+                        return
+                    async for sentence in rag_qna_stream(question, username=self.tenant, timings=llm_timings):
+                        await sentences.put(sentence)
+                finally:
+                    await sentences.put(None)
+
+            producer = asyncio.create_task(produce())
+            try:
+                first_audio_at = None
+                while (sentence := await sentences.get()) is not None:
+                    if "first_sentence_seconds" not in turn:
+                        turn["first_sentence_seconds"] = round(time.perf_counter() - started, 3)
+                    resampler = StreamResampler(TTS_PCM_SAMPLE_RATE, MEDIA_SAMPLE_RATE)
+                    async for chunk in stream_tts_pcm(sentence):
+                        samples = resampler.process(chunk)
+                        if samples.size == 0:
+                            continue
+                        if first_audio_at is None:
+                            first_audio_at = time.perf_counter()
+                            turn["mouth_to_ear_seconds"] = round(first_audio_at - speech_ended_at, 3)
+                        await self._send_audio(pcm16_to_ulaw(samples))
+                await self._send({"event": "mark", "streamSid": self.stream_sid, "mark": {"name": f"turn-{self.turns}"}})
+            finally:
+                producer.cancel()
+            turn.update({k: llm_timings[k] for k in _RAG_TURN_KEYS if k in llm_timings})
+        except asyncio.CancelledError:
+            turn["interrupted"] = True
+            raise
+        except Exception as e:
+            logger.error(f"Media stream turn failed for call {self.call_sid}: {e}")
+            turn["error"] = str(e)
+        finally:
+            _record_turn(turn)
+
+
+def _record_turn(turn: Dict[str, Any]):
+    _recent_turns.append(turn)
+    labels = {"tenant": turn["tenant"], "direction": turn["direction"]}
+    observe_rag_timings(turn, **labels)
+    if "stt_seconds" in turn:
+        call_stage_seconds.observe(turn["stt_seconds"], stage="stt", **labels)
+    if "mouth_to_ear_seconds" in turn:
+        call_stage_seconds.observe(turn["mouth_to_ear_seconds"], stage="mouth_to_ear", **labels)
+    if "error" in turn:
+        call_errors_total.inc(stage="media_stream_turn", **labels)
+    if "mouth_to_ear_seconds" in turn:
+        _totals["turns"] += 1
+        _totals["mouth_to_ear_seconds"] += turn["mouth_to_ear_seconds"]
+        logger.info(f"Call {turn['call_sid']} turn {turn['turn']} mouth-to-ear {turn['mouth_to_ear_seconds']:.2f}s")
+
+
+def get_media_stream_stats() -> Dict[str, Any]:
+    """Return session counts and per-turn latency breakdowns"""
+    turns = _totals["turns"]
+    latencies = sorted(t["mouth_to_ear_seconds"] for t in _recent_turns if "mouth_to_ear_seconds" in t)
+    return {
+        "sessions": _totals["sessions"],
+        "active_sessions": _totals["active_sessions"],
+        "turns": turns,
+        "barge_ins": _totals["barge_ins"],
+        "avg_mouth_to_ear_seconds": round(_totals["mouth_to_ear_seconds"] / turns, 3) if turns else None,
+        "p95_mouth_to_ear_seconds": latencies[int(0.95 * (len(latencies) - 1))] if latencies else None,
+        "recent_turns": list(_recent_turns)
+    }
@@ -0,0 +1,145 @@
+"""Local stand-in for Twilio Media Streams
+
+Replays recorded caller audio into the /voice/media_stream WebSocket the way
+Twilio does (8 kHz mu-law, 20 ms frames, in real time), keeps sending silence
+while the answer plays, and reports mouth-to-ear latency per turn as seen by
+the caller: from the last frame of each recording to the first answer frame.
+
+    python -m services.media_stream_replay question1.wav question2.ulaw \\
+        --url ws://localhost:8000/api/voice/media_stream --tenant acme --output answers.wav
+"""
+import sys
+import json
+import time
+import uuid
+import wave
+import base64
+import asyncio
+import argparse
+from typing import List, Optional
+import numpy as np
+from websockets.asyncio.client import connect
+from services.audio import (
+    MEDIA_SAMPLE_RATE, MEDIA_FRAME_BYTES, StreamResampler, pcm16_to_ulaw, ulaw_to_pcm16
+)
+
+FRAME_SECONDS = MEDIA_FRAME_BYTES / MEDIA_SAMPLE_RATE
+SILENCE_FRAME = pcm16_to_ulaw(np.zeros(MEDIA_FRAME_BYTES, dtype=np.int16))
+
+
+def load_ulaw(path: str) -> bytes:
+    """Read a .wav (16-bit mono, any rate) or raw 8 kHz mu-law recording"""
+    if not path.lower().endswith(".wav"):
+        with open(path, "rb") as f:
+            return f.read()
+    with wave.open(path, "rb") as wav:
+        if wav.getsampwidth() != 2 or wav.getnchannels() != 1:
+            raise ValueError(f"{path}: expected 16-bit mono WAV")
+        rate = wav.getframerate()
+        frames = wav.readframes(wav.getnframes())
+    return pcm16_to_ulaw(StreamResampler(rate, MEDIA_SAMPLE_RATE).process(frames))
+
+
+class ReplayCall:
+    def __init__(self, websocket, stream_sid: str, realtime: bool):
+        self.websocket = websocket
+        self.stream_sid = stream_sid
+        self.realtime = realtime
+        self.received = bytearray()
+        self.first_audio_at: Optional[float] = None
+        self.marks: asyncio.Queue = asyncio.Queue()
+
+    async def send_frame(self, payload: bytes):
+        await self.websocket.send(json.dumps({
+            "event": "media",
+            "streamSid": self.stream_sid,
+            "media": {"track": "inbound", "payload": base64.b64encode(payload).decode("ascii")}
+        }))
+        if self.realtime:
+            await asyncio.sleep(FRAME_SECONDS)
+
+    async def receive(self):
+        async for message in self.websocket:
+            data = json.loads(message)
+            if data.get("event") == "media":
+                if self.first_audio_at is None:
+                    self.first_audio_at = time.perf_counter()
+                self.received.extend(base64.b64decode(data["media"]["payload"]))
+            elif data.get("event") == "mark":
+                await self.marks.put(data["mark"]["name"])
+            elif data.get("event") == "clear":
+                self.received.clear()
+
+    async def play_turn(self, audio: bytes, timeout: float) -> dict:
+        self.first_audio_at = None
+        for offset in range(0, len(audio), MEDIA_FRAME_BYTES):
+            await self.send_frame(audio[offset:offset + MEDIA_FRAME_BYTES].ljust(MEDIA_FRAME_BYTES, SILENCE_FRAME[:1]))
+        speech_ended_at = time.perf_counter()
+        # Like a real line, keep streaming silence until the answer has been sent
+        deadline = speech_ended_at + timeout
+        while self.marks.empty() and time.perf_counter() < deadline:
+            await self.send_frame(SILENCE_FRAME)
+            if not self.realtime:
+                await asyncio.sleep(0)
+        mark = None if self.marks.empty() else self.marks.get_nowait()
+        return {
+            "utterance_seconds": round(len(audio) / MEDIA_SAMPLE_RATE, 3),
+            "mouth_to_ear_seconds": round(self.first_audio_at - speech_ended_at, 3) if self.first_audio_at else None,
+            "completed": mark is not None
+        }
+
+
+async def replay(paths: List[str], url: str, tenant: Optional[str], timeout: float, realtime: bool, output: Optional[str]):
+    stream_sid = "MZ" + uuid.uuid4().hex
+    call_sid = "CA" + uuid.uuid4().hex
+    async with connect(url) as websocket:
+        call = ReplayCall(websocket, stream_sid, realtime)
+        receiver = asyncio.create_task(call.receive())
+        await websocket.send(json.dumps({"event": "connected", "protocol": "Call", "version": "1.0.0"}))
+        parameters = {"tenant": tenant} if tenant else {}
+        await websocket.send(json.dumps({
+            "event": "start",
+            "streamSid": stream_sid,
+            "start": {
+                "streamSid": stream_sid,
+                "callSid": call_sid,
+                "tracks": ["inbound"],
+                "customParameters": parameters,
+                "mediaFormat": {"encoding": "audio/x-mulaw", "sampleRate": MEDIA_SAMPLE_RATE, "channels": 1}
+            }
+        }))
+        results = []
+        for turn, path in enumerate(paths, start=1):
+            result = await call.play_turn(load_ulaw(path), timeout)
+            result.update({"turn": turn, "file": path})
+            print(json.dumps(result))
+            results.append(result)
+        await websocket.send(json.dumps({"event": "stop", "streamSid": stream_sid, "stop": {"callSid": call_sid}}))
+        receiver.cancel()
+    if output:
+        with wave.open(output, "wb") as wav:
+            wav.setnchannels(1)
+            wav.setsampwidth(2)
+            wav.setframerate(MEDIA_SAMPLE_RATE)
+            wav.writeframes(ulaw_to_pcm16(bytes(call.received)).astype("<i2").tobytes())
+    latencies = [r["mouth_to_ear_seconds"] for r in results if r["mouth_to_ear_seconds"] is not None]
+    if latencies:
+        print(json.dumps({"turns": len(results), "avg_mouth_to_ear_seconds": round(sum(latencies) / len(latencies), 3),
+                          "max_mouth_to_ear_seconds": max(latencies)}))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay recorded caller audio into the media stream endpoint")
+    parser.add_argument("files", nargs="+", help="One recording per turn: 16-bit mono .wav or raw 8 kHz mu-law")
+    parser.add_argument("--url", default="ws://localhost:8000/api/voice/media_stream")
+    parser.add_argument("--tenant", default=None)
+    parser.add_argument("--timeout", type=float, default=30.0, help="Seconds to wait for each answer")
+    parser.add_argument("--fast", action="store_true", help="Send frames as fast as possible instead of in real time")
+    parser.add_argument("--output", default=None, help="Write the received answer audio to this .wav file")
+    args = parser.parse_args(argv)
+    asyncio.run(replay(args.files, args.url, args.tenant, args.timeout, not args.fast, args.output))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
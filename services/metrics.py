@@ -0,0 +1,202 @@
+import os
+import math
+import time
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+# Upper bounds (seconds) of the latency histogram buckets
+METRICS_LATENCY_BUCKETS = [
+    float(b) for b in os.getenv(
+        "METRICS_LATENCY_BUCKETS", "0.05,0.1,0.25,0.5,0.75,1,1.5,2,3,5,8,13,20,30,60"
+    ).split(",")
+]
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric(ABC):
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name] or "") for name in self.labelnames)
+
+    @abstractmethod
+    def _samples(self) -> List[str]:
+        pass
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """Monotonic count per label set"""
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(v)}" for key, v in items]
+
+
+class Histogram(_Metric):
+    """Cumulative bucket counts, sum and count per label set"""
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = None):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = sorted(buckets or METRICS_LATENCY_BUCKETS) + [math.inf]
+        # key -> [per-bucket counts..., sum, count]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+                    break
+            state[-2] += value
+            state[-1] += 1
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        """Observe the duration of the `with` block, also when it raises"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, list(state)) for key, state in self._values.items())
+        lines = []
+        for key, state in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(round(state[-2], 6))}")
+            lines.append(f"{self.name}_count{labels} {state[-1]}")
+        return lines
+
+
+class MetricsRegistry:
+    """Metrics rendered together in the Prometheus text exposition format"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+
+
+registry = MetricsRegistry()
+
+# Call turns. Stages: recording_download, stt, query_embedding, vector_search,
+# llm_first_token, llm, twiml_render, webhook_total (every TwiML webhook) and mouth_to_ear (stream pipeline)
+call_stage_seconds = registry.register(Histogram(
+    "voicebot_call_stage_seconds", "Time spent in each stage of a call turn",
+    ["stage", "tenant", "direction"]
+))
+call_errors_total = registry.register(Counter(
+    "voicebot_call_errors_total", "Call turns that failed, by stage",
+    ["stage", "tenant", "direction"]
+))
+call_fallbacks_total = registry.register(Counter(
+    "voicebot_call_fallbacks_total", "Call turns answered with a fallback instead of a generated answer",
+    ["reason", "tenant", "direction"]
+))
+answer_cache_hits_total = registry.register(Counter(
+    "voicebot_answer_cache_hits_total", "Call turns answered from the answer cache",
+    ["tenant", "direction"]
+))
+faq_hits_total = registry.register(Counter(
+    "voicebot_faq_hits_total", "Call turns answered from the FAQ, by kind of match",
+    ["match", "tenant", "direction"]
+))
+tts_prompt_fallbacks_total = registry.register(Counter(
+    "voicebot_tts_prompt_fallbacks_total", "Fixed prompts spoken with <Say> because their audio was not cached"
+))
+
+# PDF ingestion. Stages: spool, extract, chunk, embed (per batch), upsert (per batch), store, total
+ingestion_stage_seconds = registry.register(Histogram(
+    "voicebot_ingestion_stage_seconds", "Time spent in each stage of a PDF upload",
+    ["stage", "tenant"]
+))
+ingestion_errors_total = registry.register(Counter(
+    "voicebot_ingestion_errors_total", "PDF uploads that failed",
+    ["tenant"]
+))
+
+
+def observe_rag_timings(timings: Dict[str, float], tenant: str, direction: str):
+    """Record the retrieval and generation stages reported in a RAG timings dict"""
+    stages = {
+        "faq_seconds": "faq_lookup",
+        "embedding_seconds": "query_embedding",
+        "search_seconds": "vector_search",
+        "ttft_seconds": "llm_first_token",
+        "generation_seconds": "llm"
+    }
+    for key, stage in stages.items():
+        if key in timings:
+            call_stage_seconds.observe(timings[key], stage=stage, tenant=tenant, direction=direction)
+    if timings.get("faq_match"):
+        faq_hits_total.inc(match=timings["faq_match"], tenant=tenant, direction=direction)
+    if timings.get("answer_cache_hit"):
+        answer_cache_hits_total.inc(tenant=tenant, direction=direction)
+    if timings.get("fallback"):
+        call_fallbacks_total.inc(reason=timings["fallback"], tenant=tenant, direction=direction)
@@ -0,0 +1,79 @@
+import os
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, BinaryIO, Dict, Optional
+from services.openai_client import async_openai_client
+
+logger = logging.getLogger(__name__)
+
+STT_MODEL = os.getenv("STT_MODEL", "gpt-4o-transcribe")
+STT_LANGUAGE = os.getenv("STT_LANGUAGE", "en")
+# Transcriptions in flight at once across all calls
+STT_MAX_CONCURRENCY = int(os.getenv("STT_MAX_CONCURRENCY", "8"))
+# Calls whose timings are kept for /stt_stats
+STT_TIMING_HISTORY = int(os.getenv("STT_TIMING_HISTORY", "500"))
+
+_stt_semaphore = asyncio.Semaphore(STT_MAX_CONCURRENCY)
+_call_timings: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+_totals = {"requests": 0, "errors": 0, "in_flight": 0, "transcribe_seconds": 0.0, "queue_seconds": 0.0}
+
+
+def _record_timing(call_sid: Optional[str], direction: Optional[str], queue_seconds: float, transcribe_seconds: float):
+    _totals["requests"] += 1
+    _totals["queue_seconds"] += queue_seconds
+    _totals["transcribe_seconds"] += transcribe_seconds
+    if not call_sid:
+        return
+    timing = _call_timings.pop(call_sid, None) or {"direction": direction, "turns": 0, "transcribe_seconds": 0.0}
+    timing["turns"] += 1
+    timing["transcribe_seconds"] = round(timing["transcribe_seconds"] + transcribe_seconds, 3)
+    timing["last_queue_seconds"] = round(queue_seconds, 3)
+    timing["last_transcribe_seconds"] = round(transcribe_seconds, 3)
+    _call_timings[call_sid] = timing
+    while len(_call_timings) > STT_TIMING_HISTORY:
+        _call_timings.popitem(last=False)
+
+
+async def transcribe_audio(audio_file: BinaryIO, call_sid: str = None, direction: str = None) -> str:
+    """Transcribe a recorded turn with the async OpenAI client
+
+    At most STT_MAX_CONCURRENCY transcriptions run at once; time spent waiting
+    for a slot and in the API call is recorded per call.
+    """
+    queued = time.perf_counter()
+    async with _stt_semaphore:
+        started = time.perf_counter()
+        _totals["in_flight"] += 1
+        try:
+            transcription = await async_openai_client.audio.transcriptions.create(
+                model=STT_MODEL,
+                file=audio_file,
+                language=STT_LANGUAGE
+            )
+        except Exception:
+            _totals["errors"] += 1
+            raise
+        finally:
+            _totals["in_flight"] -= 1
+    finished = time.perf_counter()
+    _record_timing(call_sid, direction, started - queued, finished - started)
+    logger.info(f"Transcribed {direction or 'unknown'} call {call_sid} in {finished - started:.2f}s "
+                f"(queued {started - queued:.2f}s)")
+    return transcription.text.strip()
+
+
+def get_stt_stats() -> Dict[str, Any]:
+    """Return aggregate and recent per-call transcription timings"""
+    requests = _totals["requests"]
+    return {
+        "model": STT_MODEL,
+        "max_concurrency": STT_MAX_CONCURRENCY,
+        "in_flight": _totals["in_flight"],
+        "requests": requests,
+        "errors": _totals["errors"],
+        "avg_transcribe_seconds": round(_totals["transcribe_seconds"] / requests, 3) if requests else None,
+        "avg_queue_seconds": round(_totals["queue_seconds"] / requests, 3) if requests else None,
+        "calls": dict(_call_timings)
+    }
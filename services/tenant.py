@@ -0,0 +1,41 @@
+import os
+import logging
+from typing import Optional
+from config.twilio_config_handler import load_twilio_config
+
+logger = logging.getLogger(__name__)
+
+# Tenant used when a number has no mapping; matches the username documents were uploaded under
+DEFAULT_TENANT = os.getenv("DEFAULT_TENANT", "string")
+
+
+def normalize_number(number: Optional[str]) -> str:
+    """Reduce a phone number to '+' and digits so config and webhook formats match"""
+    if not number:
+        return ""
+    digits = "".join(ch for ch in number if ch.isdigit())
+    return f"+{digits}" if digits else ""
+
+
+def resolve_tenant(number: Optional[str]) -> str:
+    """Map one of our Twilio numbers to the tenant whose documents it answers from
+
+    Mappings live under "tenants" in twilio_config.json, e.g.
+    {"tenants": {"+15551234567": "acme"}}.
+    """
+    tenants = load_twilio_config().get("tenants") or {}
+    normalized = normalize_number(number)
+    for tenant_number, tenant in tenants.items():
+        if normalize_number(tenant_number) == normalized:
+            return tenant
+    return DEFAULT_TENANT
+
+
+def tenant_for_call(direction: Optional[str], to_number: Optional[str], from_number: Optional[str]) -> str:
+    """Resolve the tenant from the side of the call that is our number
+
+    Inbound calls dial our number (To); outbound calls are placed from it (From).
+    """
+    if direction and direction.startswith("outbound"):
+        return resolve_tenant(from_number)
+    return resolve_tenant(to_number)
@@ -0,0 +1,70 @@
+import os
+import math
+import logging
+import threading
+from typing import Iterable, Optional
+from services.llm_service import LLM_MODEL
+
+logger = logging.getLogger(__name__)
+
+# Encoding used when tiktoken does not know the model
+TOKENIZER_FALLBACK_ENCODING = os.getenv("TOKENIZER_FALLBACK_ENCODING", "o200k_base")
+# Characters per token for the estimate used when no encoding can be loaded
+TOKEN_ESTIMATE_CHARS = 4
+
+# Per-message overhead of the chat format (role and separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+_encoding = None
+_encoding_loaded = False
+_encoding_lock = threading.Lock()
+
+
+def get_encoding():
+    """Return the tiktoken encoding for LLM_MODEL, or None if it cannot be loaded
+
+    The encoding file is downloaded on first use; without network access or
+    tiktoken, token counts fall back to a character-based estimate.
+    """
+    global _encoding, _encoding_loaded
+    if _encoding_loaded:
+        return _encoding
+    with _encoding_lock:
+        if not _encoding_loaded:
+            try:
+                import tiktoken
+                try:
+                    _encoding = tiktoken.encoding_for_model(LLM_MODEL)
+                except KeyError:
+                    _encoding = tiktoken.get_encoding(TOKENIZER_FALLBACK_ENCODING)
+            except Exception as e:
+                logger.warning(f"Tokenizer unavailable, estimating token counts: {e}")
+                _encoding = None
+            _encoding_loaded = True
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    """Number of tokens `text` takes in the LLM prompt"""
+    if not text:
+        return 0
+    encoding = get_encoding()
+    if encoding is None:
+        return math.ceil(len(text) / TOKEN_ESTIMATE_CHARS)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def count_message_tokens(messages: Iterable[dict]) -> int:
+    """Approximate prompt size of a list of chat messages"""
+    return sum(count_tokens(m.get("content", "")) + MESSAGE_OVERHEAD_TOKENS for m in messages)
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> Optional[str]:
+    """Cut `text` to at most `max_tokens` tokens, or None if nothing fits"""
+    if max_tokens <= 0:
+        return None
+    encoding = get_encoding()
+    if encoding is None:
+        return text[:max_tokens * TOKEN_ESTIMATE_CHARS] or None
+    tokens = encoding.encode(text, disallowed_special=())
+    return encoding.decode(tokens[:max_tokens]) or None
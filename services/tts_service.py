@@ -0,0 +1,200 @@
+import os
+import re
+import time
+import asyncio
+import hashlib
+import logging
+from contextlib import contextmanager
+from pathlib import Path
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+try:
+    import fcntl
+except ImportError:  # Windows: single-process development only
+    fcntl = None
+from services.openai_client import async_openai_client
+
+logger = logging.getLogger(__name__)
+
+TTS_MODEL = os.getenv("TTS_MODEL", "tts-1")
+TTS_VOICE = os.getenv("TTS_VOICE", "alloy")
+# The API's raw "pcm" format: 24 kHz, 16-bit little-endian, mono
+TTS_PCM_SAMPLE_RATE = 24000
+TTS_STREAM_CHUNK_BYTES = int(os.getenv("TTS_STREAM_CHUNK_BYTES", "4800"))
+
+# Synthesized prompts are stored once per (text, voice, model) and served for <Play>
+TTS_CACHE_DIR = os.getenv("TTS_CACHE_DIR", "tts_cache")
+TTS_CACHE_MAX_BYTES = int(os.getenv("TTS_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+TTS_AUDIO_FORMAT = "mp3"
+# Files used more recently than this are never evicted: another worker may still be serving them
+TTS_CACHE_EVICT_GRACE_SECONDS = float(os.getenv("TTS_CACHE_EVICT_GRACE_SECONDS", "300"))
+
+_CACHE_FILE = re.compile(r"^[0-9a-f]{64}\.mp3$")
+
+
+@contextmanager
+def _directory_lock(directory: Path):
+    """Exclusive lock shared by every worker using the cache directory"""
+    directory.mkdir(parents=True, exist_ok=True)
+    with open(directory / ".lock", "a") as lock_file:
+        if fcntl is None:
+            yield
+            return
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+async def stream_tts_pcm(text: str, voice: str = None, model: str = None) -> AsyncIterator[bytes]:
+    """Stream synthesized speech as raw PCM while the API is still generating it"""
+    async with async_openai_client.audio.speech.with_streaming_response.create(
+        model=model or TTS_MODEL,
+        voice=voice or TTS_VOICE,
+        input=text,
+        response_format="pcm"
+    ) as response:
+        async for chunk in response.iter_bytes(TTS_STREAM_CHUNK_BYTES):
+            yield chunk
+
+
+def tts_cache_key(text: str, voice: str, model: str) -> str:
+    return hashlib.sha256(f"{model}\0{voice}\0{TTS_AUDIO_FORMAT}\0{text}".encode("utf-8")).hexdigest()
+
+
+class TTSAudioCache:
+    """Content-addressed on-disk audio cache with a total size cap and LRU eviction
+
+    Files are named by the hash of text, voice and model, so concurrent calls
+    never overwrite each other and identical prompts are synthesized once.
+    The directory is the only index: every worker sees the same files, and
+    recency is kept in file mtimes (touched on each hit). Eviction scans the
+    directory under a file lock and never removes files used within the
+    grace period, which may still be fetched by Twilio from another worker.
+    """
+
+    def __init__(self, directory: str = TTS_CACHE_DIR, max_bytes: int = TTS_CACHE_MAX_BYTES,
+                 grace_seconds: float = TTS_CACHE_EVICT_GRACE_SECONDS):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.grace_seconds = grace_seconds
+        self._pending: Dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def path_for(self, filename: str) -> Optional[Path]:
+        """Path of a cached file, or None if it is not (or no longer) cached"""
+        if not _CACHE_FILE.match(filename):
+            return None
+        path = self.directory / filename
+        return path if path.is_file() else None
+
+    def lookup(self, text: str, voice: str = None, model: str = None) -> Optional[str]:
+        """File name of already synthesized audio, without synthesizing"""
+        filename = f"{tts_cache_key(text, voice or TTS_VOICE, model or TTS_MODEL)}.{TTS_AUDIO_FORMAT}"
+        try:
+            # Refresh its LRU position; fails if it was never cached or was evicted
+            os.utime(self.directory / filename)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return filename
+
+    async def synthesize(self, text: str, voice: str = None, model: str = None) -> str:
+        """Return the cached file name for `text`, synthesizing it on a miss
+
+        Concurrent requests for the same audio in this process share one TTS request.
+        """
+        voice = voice or TTS_VOICE
+        model = model or TTS_MODEL
+        cached = self.lookup(text, voice, model)
+        if cached:
+            return cached
+        filename = f"{tts_cache_key(text, voice, model)}.{TTS_AUDIO_FORMAT}"
+        pending = self._pending.get(filename)
+        if pending is not None:
+            return await asyncio.shield(pending)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[filename] = future
+        try:
+            response = await async_openai_client.audio.speech.create(
+                model=model, voice=voice, input=text, response_format=TTS_AUDIO_FORMAT
+            )
+            await asyncio.to_thread(self._write_file, filename, response.content)
+            self.evictions += await asyncio.to_thread(self._evict)
+            future.set_result(filename)
+            return filename
+        except Exception as e:
+            future.set_exception(e)
+            # Nobody else may be waiting; mark the exception as retrieved
+            future.exception()
+            raise
+        finally:
+            if not future.done():
+                future.cancel()
+            del self._pending[filename]
+
+    def _write_file(self, filename: str, data: bytes):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        # Unique per writer, so two workers synthesizing the same text do not collide
+        tmp_path = self.directory / f"{filename}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, self.directory / filename)
+
+    def _scan(self) -> List[Tuple[float, Path, int]]:
+        """(mtime, path, size) of every cached file, least recently used first"""
+        entries = []
+        try:
+            paths = list(self.directory.iterdir())
+        except FileNotFoundError:
+            return entries
+        for path in paths:
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            if _CACHE_FILE.match(path.name):
+                entries.append((stat.st_mtime, path, stat.st_size))
+            elif path.name.endswith(".tmp") and stat.st_mtime < time.time() - self.grace_seconds:
+                # Left behind by a worker that died mid-write
+                path.unlink(missing_ok=True)
+        return sorted(entries)
+
+    def _evict(self) -> int:
+        """Delete least recently used files until the cache fits max_bytes"""
+        with _directory_lock(self.directory):
+            entries = self._scan()
+            size = sum(entry_size for _, _, entry_size in entries)
+            cutoff = time.time() - self.grace_seconds
+            evicted = 0
+            for mtime, path, entry_size in entries[:-1]:
+                if size <= self.max_bytes or mtime >= cutoff:
+                    break
+                path.unlink(missing_ok=True)
+                size -= entry_size
+                evicted += 1
+            return evicted
+
+    def stats(self):
+        entries = self._scan()
+        return {
+            "files": len(entries),
+            "bytes": sum(size for _, _, size in entries),
+            "max_bytes": self.max_bytes,
+            "evict_grace_seconds": self.grace_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions
+        }
+
+
+tts_cache = TTSAudioCache()
+
+
+async def presynthesize(prompts) -> int:
+    """Synthesize fixed prompts into the cache so calls can <Play> them immediately"""
+    await asyncio.gather(*(tts_cache.synthesize(text) for text in prompts))
+    return len(prompts)
@@ -1,29 +1,285 @@
 import os
+import re
+import time
+import asyncio
+import httpx
+from typing import Any, Dict, List, Optional, Set, Tuple
+from urllib.parse import urlsplit
 from twilio.rest import Client
+from twilio.http import AsyncHttpClient
+from twilio.http.response import Response as TwilioResponse
 from fastapi import HTTPException
 from config.twilio_config_handler import load_twilio_config
+from services.tenant import normalize_number
 import logging
 
 logger = logging.getLogger(__name__)
 
-twilio_config = load_twilio_config()
-TWILIO_ACCOUNT_SID = twilio_config.get("TWILIO_ACCOUNT_SID")
-TWILIO_AUTH_TOKEN = twilio_config.get("TWILIO_AUTH_TOKEN")
-TWILIO_PHONE_NUMBER = twilio_config.get("TWILIO_PHONE_NUMBER")
+# Connection pool for Twilio REST calls, separate from the shared pool so a
+# burst of campaign dialing cannot starve recording downloads
+TWILIO_HTTP_MAX_CONNECTIONS = int(os.getenv("TWILIO_HTTP_MAX_CONNECTIONS", "20"))
+TWILIO_HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("TWILIO_HTTP_MAX_KEEPALIVE_CONNECTIONS", "10"))
+TWILIO_HTTP_KEEPALIVE_EXPIRY = float(os.getenv("TWILIO_HTTP_KEEPALIVE_EXPIRY", "60"))
+TWILIO_HTTP_CONNECT_TIMEOUT = float(os.getenv("TWILIO_HTTP_CONNECT_TIMEOUT", "5"))
+TWILIO_HTTP_READ_TIMEOUT = float(os.getenv("TWILIO_HTTP_READ_TIMEOUT", "15"))
 
-def validate_twilio_credentials():
+# How long the account's phone number list is reused before listing again
+TWILIO_NUMBER_CACHE_TTL = float(os.getenv("TWILIO_NUMBER_CACHE_TTL", "300"))
+
+# Seconds a replaced client's pool is kept open after a credential change
+TWILIO_CLIENT_RETIRE_SECONDS = float(os.getenv("TWILIO_CLIENT_RETIRE_SECONDS", "60"))
+
+# Account, call and number SIDs are collapsed so latency is grouped per endpoint
+_SID_PATTERN = re.compile(r"[A-Z]{2}[0-9a-fA-F]{32}")
+
+_endpoint_stats: Dict[str, Dict[str, Any]] = {}
+
+
+def _endpoint_key(method: str, url: str) -> str:
+    parts = urlsplit(url)
+    return f"{method.upper()} {parts.netloc}{_SID_PATTERN.sub('{sid}', parts.path)}"
+
+
+def _record_latency(endpoint: str, seconds: float, status_code: Optional[int]):
+    stats = _endpoint_stats.setdefault(endpoint, {"requests": 0, "errors": 0, "total_seconds": 0.0, "max_seconds": 0.0})
+    stats["requests"] += 1
+    stats["total_seconds"] += seconds
+    stats["max_seconds"] = max(stats["max_seconds"], seconds)
+    if status_code is None or status_code >= 400:
+        stats["errors"] += 1
+
+
+class TwilioHttpxClient(AsyncHttpClient):
+    """Async Twilio HTTP client on a pooled keep-alive httpx connection pool"""
+
+    def __init__(self):
+        super().__init__(logger, True, TWILIO_HTTP_READ_TIMEOUT)
+        self._client: Optional[httpx.AsyncClient] = None
+        # Loop the pool was opened on; its connections can only be closed there
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=TWILIO_HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=TWILIO_HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry=TWILIO_HTTP_KEEPALIVE_EXPIRY
+                ),
+                timeout=httpx.Timeout(TWILIO_HTTP_READ_TIMEOUT, connect=TWILIO_HTTP_CONNECT_TIMEOUT)
+            )
+            self.loop = asyncio.get_running_loop()
+        return self._client
+
+    async def request(
+        self,
+        method: str,
+        url: str,
+        params: Optional[Dict[str, object]] = None,
+        data: Optional[Dict[str, object]] = None,
+        headers: Optional[Dict[str, str]] = None,
+        auth: Optional[Tuple[str, str]] = None,
+        timeout: Optional[float] = None,
+        allow_redirects: bool = False,
+    ) -> TwilioResponse:
+        endpoint = _endpoint_key(method, url)
+        started = time.perf_counter()
+        status_code = None
+        try:
+            response = await self._get_client().request(
+                method.upper(),
+                url,
+                params=params,
+                data=data,
+                headers=headers,
+                auth=auth,
+                timeout=timeout if timeout is not None else httpx.USE_CLIENT_DEFAULT,
+                follow_redirects=allow_redirects
+            )
+            status_code = response.status_code
+        finally:
+            _record_latency(endpoint, time.perf_counter() - started, status_code)
+        return TwilioResponse(response.status_code, response.text, response.headers)
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+def validate_twilio_credentials(account_sid: str = None, auth_token: str = None):
     try:
-        twilio_client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
+        twilio_client = Client(account_sid, auth_token, http_client=TwilioHttpxClient())
         return twilio_client
     except Exception as e:
         logger.error(f"Twilio credential validation failed: {e}")
         raise HTTPException(status_code=400, detail="Invalid Twilio credentials.")
 
-twilio_client = validate_twilio_credentials()
+_twilio_client: Optional[Client] = None
+_twilio_credentials: Optional[Tuple[str, str]] = None
+# Pools of replaced clients not closed yet, and the tasks closing them
+_retiring_pools: Set[TwilioHttpxClient] = set()
+_retire_tasks: Set[asyncio.Task] = set()
+
+
+def get_twilio_client() -> Client:
+    """Return the Twilio client for the current credentials, rebuilding it when they change
+
+    The replaced client's connection pool is closed only after
+    TWILIO_CLIENT_RETIRE_SECONDS, so requests already using it can finish.
+    """
+    global _twilio_client, _twilio_credentials
+    config = load_twilio_config()
+    credentials = (config.get("TWILIO_ACCOUNT_SID"), config.get("TWILIO_AUTH_TOKEN"))
+    if _twilio_client is None or credentials != _twilio_credentials:
+        previous = _twilio_client
+        _twilio_client = validate_twilio_credentials(*credentials)
+        _twilio_credentials = credentials
+        if previous is not None:
+            logger.info("Twilio credentials changed, rebuilt the Twilio client")
+            number_inventory.invalidate()
+            _retire_client(previous)
+    return _twilio_client
 
-async def list_phone_numbers_service():
+
+def _retire_client(client: Client):
+    """Schedule a replaced client's pool to close on the loop it was opened on
+
+    Safe to call from any thread, e.g. a sync route running in the threadpool.
+    """
+    pool = client.http_client
+    if pool.loop is None:
+        return  # never sent a request, so it has no connections
+    _retiring_pools.add(pool)
     try:
-        incoming_numbers = twilio_client.incoming_phone_numbers.list()
+        pool.loop.call_soon_threadsafe(pool.loop.call_later, TWILIO_CLIENT_RETIRE_SECONDS, _close_retired_pool, pool)
+    except RuntimeError:
+        # The loop is closed, and its connections with it
+        _retiring_pools.discard(pool)
+
+
+def _close_retired_pool(pool: TwilioHttpxClient):
+    if pool not in _retiring_pools:
+        return  # already closed at shutdown
+    task = asyncio.get_running_loop().create_task(pool.close())
+    _retire_tasks.add(task)
+
+    def closed(task: asyncio.Task):
+        _retire_tasks.discard(task)
+        _retiring_pools.discard(pool)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Closing a retired Twilio connection pool failed: {task.exception()}")
+    task.add_done_callback(closed)
+
+
+def get_twilio_account_sid() -> Optional[str]:
+    return load_twilio_config().get("TWILIO_ACCOUNT_SID")
+
+
+def get_twilio_phone_number() -> Optional[str]:
+    return load_twilio_config().get("TWILIO_PHONE_NUMBER")
+
+
+async def close_twilio_client():
+    """Close pooled connections to the Twilio API, including those of replaced clients"""
+    if _twilio_client is not None:
+        await _twilio_client.http_client.close()
+    while _retiring_pools:
+        await _retiring_pools.pop().close()
+
+
+def get_twilio_api_stats() -> Dict[str, Any]:
+    """Return request counts and latency per Twilio API endpoint"""
+    return {
+        "max_connections": TWILIO_HTTP_MAX_CONNECTIONS,
+        "number_inventory": number_inventory.stats(),
+        "endpoints": {
+            endpoint: {
+                "requests": stats["requests"],
+                "errors": stats["errors"],
+                "avg_seconds": round(stats["total_seconds"] / stats["requests"], 3) if stats["requests"] else None,
+                "max_seconds": round(stats["max_seconds"], 3)
+            }
+            for endpoint, stats in _endpoint_stats.items()
+        }
+    }
+
+class PhoneNumberInventory:
+    """TTL-cached list of the account's incoming numbers with a number -> instance index
+
+    Concurrent refreshes share a single listing request. Admin calls that
+    change a number replace it in place instead of forcing a full re-list.
+    """
+
+    def __init__(self, ttl_seconds: float = TWILIO_NUMBER_CACHE_TTL):
+        self.ttl_seconds = ttl_seconds
+        self._numbers: List[Any] = []
+        self._by_number: Dict[str, Any] = {}
+        self._loaded_at: Optional[float] = None
+        self._lock = asyncio.Lock()
+        self.hits = 0
+        self.refreshes = 0
+
+    def _fresh(self) -> bool:
+        return self._loaded_at is not None and time.monotonic() - self._loaded_at < self.ttl_seconds
+
+    async def numbers(self, force_refresh: bool = False) -> List[Any]:
+        if not force_refresh and self._fresh():
+            self.hits += 1
+            return self._numbers
+        loaded_at = self._loaded_at
+        async with self._lock:
+            # Another request may have refreshed while we waited for the lock
+            if self._loaded_at != loaded_at and self._fresh():
+                self.hits += 1
+                return self._numbers
+            client = get_twilio_client()
+            numbers = await client.incoming_phone_numbers.list_async()
+            self._numbers = numbers
+            self._by_number = {normalize_number(number.phone_number): number for number in numbers}
+            # A listing from credentials replaced mid-request is used once but not cached
+            self._loaded_at = time.monotonic() if client is _twilio_client else None
+            self.refreshes += 1
+            logger.info(f"Loaded {len(numbers)} phone numbers from Twilio")
+            return numbers
+
+    async def get(self, phone_number: str, force_refresh: bool = False) -> Optional[Any]:
+        await self.numbers(force_refresh)
+        return self._by_number.get(normalize_number(phone_number))
+
+    async def target(self, force_refresh: bool = False) -> Optional[Any]:
+        """The configured Twilio phone number, or the account's first number"""
+        numbers = await self.numbers(force_refresh)
+        return self._by_number.get(normalize_number(get_twilio_phone_number())) or (numbers[0] if numbers else None)
+
+    def replace(self, number: Any):
+        """Swap in an updated number instance without re-listing the account"""
+        key = normalize_number(number.phone_number)
+        previous = self._by_number.get(key)
+        self._by_number[key] = number
+        if previous is not None and previous in self._numbers:
+            self._numbers[self._numbers.index(previous)] = number
+        else:
+            self._numbers.append(number)
+
+    def invalidate(self):
+        self._loaded_at = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "numbers": len(self._numbers),
+            "ttl_seconds": self.ttl_seconds,
+            "age_seconds": round(time.monotonic() - self._loaded_at, 1) if self._loaded_at is not None else None,
+            "hits": self.hits,
+            "refreshes": self.refreshes
+        }
+
+
+number_inventory = PhoneNumberInventory()
+
+async def list_phone_numbers_service(force_refresh: bool = False):
+    try:
+        incoming_numbers = await number_inventory.numbers(force_refresh)
         numbers_list = []
         for number in incoming_numbers:
             numbers_list.append({
@@ -47,41 +303,39 @@ async def list_phone_numbers_service():
         logger.error(f"Error listing phone numbers: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to list phone numbers: {str(e)}")
 
-async def setup_webhook_service(webhook_url: str):
+async def setup_webhook_service(webhook_url: str, force_refresh: bool = False):
     try:
         voice_webhook_url = f"{webhook_url}/voice/incoming"
         # Test Twilio connection
         try:
-            account = twilio_client.api.accounts(TWILIO_ACCOUNT_SID).fetch()
+            account = await get_twilio_client().api.accounts(get_twilio_account_sid()).fetch_async()
             logger.info(f"Twilio connection verified for account: {account.friendly_name}")
         except Exception as auth_error:
             logger.error(f"Twilio authentication failed: {auth_error}")
             raise HTTPException(status_code=401, detail=f"Twilio authentication failed: {str(auth_error)}")
-        # List all incoming phone numbers to find the right one
+        # Find the configured number in the cached inventory
         try:
-            incoming_numbers = twilio_client.incoming_phone_numbers.list()
-            logger.info(f"Found {len(incoming_numbers)} phone numbers in account")
-            target_number = None
-            for number in incoming_numbers:
-                logger.info(f"Available number: {number.phone_number} (SID: {number.sid})")
-                if number.phone_number == TWILIO_PHONE_NUMBER:
-                    target_number = number
-                    break
+            target_number = await number_inventory.get(get_twilio_phone_number(), force_refresh)
             if not target_number:
-                if incoming_numbers:
-                    target_number = incoming_numbers[0]
+                target_number = await number_inventory.target()
+                if target_number:
                     logger.warning(f"Exact number match not found. Using first available: {target_number.phone_number}")
                 else:
                     raise HTTPException(status_code=404, detail=f"No phone numbers found in Twilio account")
+        except HTTPException:
+            raise
         except Exception as list_error:
             logger.error(f"Error listing phone numbers: {list_error}")
             raise HTTPException(status_code=500, detail=f"Error accessing phone numbers: {str(list_error)}")
         # Update the phone number's webhook
         try:
-            updated_number = twilio_client.incoming_phone_numbers(target_number.sid).update(
+            updated_number = await get_twilio_client().incoming_phone_numbers(target_number.sid).update_async(
                 voice_url=voice_webhook_url,
-                voice_method='POST'
+                voice_method='POST',
+                status_callback=f"{webhook_url}/voice/status",
+                status_callback_method='POST'
             )
+            number_inventory.replace(updated_number)
             logger.info(f"Webhook updated successfully for {updated_number.phone_number}")
             return {
                 "status": "success",
@@ -99,18 +353,11 @@ async def setup_webhook_service(webhook_url: str):
         logger.error(f"Unexpected error setting up webhook: {e}")
         raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
 
-async def get_webhook_info_service():
+async def get_webhook_info_service(force_refresh: bool = False):
     try:
-        incoming_numbers = twilio_client.incoming_phone_numbers.list()
-        if not incoming_numbers:
-            raise HTTPException(status_code=404, detail="No phone numbers found in account")
-        target_number = None
-        for number in incoming_numbers:
-            if number.phone_number == TWILIO_PHONE_NUMBER:
-                target_number = number
-                break
+        target_number = await number_inventory.target(force_refresh)
         if not target_number:
-            target_number = incoming_numbers[0]
+            raise HTTPException(status_code=404, detail="No phone numbers found in account")
         return {
             "phone_number": target_number.phone_number,
             "sid": target_number.sid,
@@ -124,10 +371,10 @@ async def get_webhook_info_service():
         logger.error(f"Error getting webhook info: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to get webhook info: {str(e)}")
 
-async def test_twilio_auth_service():
+async def test_twilio_auth_service(force_refresh: bool = False):
     try:
-        account = twilio_client.api.accounts(TWILIO_ACCOUNT_SID).fetch()
-        incoming_numbers = twilio_client.incoming_phone_numbers.list()
+        account = await get_twilio_client().api.accounts(get_twilio_account_sid()).fetch_async()
+        incoming_numbers = await number_inventory.numbers(force_refresh)
         numbers_info = []
         for number in incoming_numbers:
             numbers_info.append({
@@ -150,6 +397,6 @@ async def test_twilio_auth_service():
         return {
             "status": "error",
             "error": str(e),
-            "account_sid": TWILIO_ACCOUNT_SID[:8] + "...",
+            "account_sid": (get_twilio_account_sid() or "")[:8] + "...",
             "message": "Check your Twilio credentials"
         } 
\ No newline at end of file
@@ -0,0 +1,82 @@
+import os
+import time
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict
+from services.openai_client import async_openai_client
+from services.llm_service import LLM_MODEL
+from services.stt_service import STT_MODEL
+from services.tts_service import presynthesize
+from services.call_logic import FIXED_PROMPTS
+from services.tokens import get_encoding
+from services.faq import faq_store
+from vectordb_files.pre_pocess import initialize_qdrant, embedding_model
+
+logger = logging.getLogger(__name__)
+
+# Delay before retrying components that failed to warm up
+WARMUP_RETRY_SECONDS = float(os.getenv("WARMUP_RETRY_SECONDS", "10"))
+
+readiness: Dict[str, Any] = {"status": "cold", "components": {}}
+
+
+def _warmup_steps() -> Dict[str, Callable[[], Awaitable[Any]]]:
+    """Each step validates a dependency and leaves a pooled connection open to it"""
+    return {
+        "vector_store": initialize_qdrant,
+        # Bypasses the query cache, so warm-up neither fills it nor counts a miss
+        "embeddings": lambda: embedding_model.aembed_query("hello"),
+        "llm": lambda: async_openai_client.models.retrieve(LLM_MODEL),
+        "stt": lambda: async_openai_client.models.retrieve(STT_MODEL),
+        # Loads (or downloads) the BPE file off the event loop; never fails, counts fall back to estimates
+        "tokenizer": lambda: asyncio.to_thread(get_encoding),
+        # Embeds FAQ questions so embedding matches work from the first call
+        "faq": faq_store.warm,
+    }
+
+
+async def _warm(name: str, step: Callable[[], Awaitable[Any]]) -> bool:
+    started = time.perf_counter()
+    try:
+        await step()
+        readiness["components"][name] = {"status": "warm", "seconds": round(time.perf_counter() - started, 3)}
+        return True
+    except Exception as e:
+        logger.error(f"Warm-up of {name} failed: {e}")
+        readiness["components"][name] = {"status": "failed", "error": str(e)}
+        return False
+
+
+async def warm_up():
+    """Warm every dependency, retrying failures until all are ready"""
+    steps = _warmup_steps()
+    readiness["status"] = "warming"
+    readiness["components"] = {name: {"status": "cold"} for name in steps}
+    started = time.perf_counter()
+    while steps:
+        results = await asyncio.gather(*(_warm(name, step) for name, step in steps.items()))
+        steps = {name: step for (name, step), ok in zip(steps.items(), results) if not ok}
+        if steps:
+            logger.warning(f"Retrying warm-up of {', '.join(steps)} in {WARMUP_RETRY_SECONDS}s")
+            await asyncio.sleep(WARMUP_RETRY_SECONDS)
+    readiness["status"] = "warm"
+    readiness["warmup_seconds"] = round(time.perf_counter() - started, 3)
+    logger.info(f"Warm-up complete in {readiness['warmup_seconds']}s")
+
+
+async def warm_prompt_audio():
+    """Pre-synthesize fixed call prompts into the TTS cache
+
+    Not part of readiness: a prompt that is not cached yet is spoken with <Say>.
+    """
+    started = time.perf_counter()
+    try:
+        count = await presynthesize(FIXED_PROMPTS)
+        readiness["prompt_audio"] = {"status": "warm", "prompts": count, "seconds": round(time.perf_counter() - started, 3)}
+    except Exception as e:
+        logger.error(f"Pre-synthesizing prompt audio failed: {e}")
+        readiness["prompt_audio"] = {"status": "failed", "error": str(e)}
+
+
+def is_ready() -> bool:
+    return readiness["status"] == "warm"
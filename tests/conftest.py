@@ -0,0 +1,12 @@
+import os
+import tempfile
+
+# Modules create their clients at import time; nothing in the tests calls out to them
+os.environ["OPENAI_API_KEY"] = os.environ.get("OPENAI_API_KEY") or "sk-test-offline"
+os.environ.setdefault("CALL_STATE_BACKEND", "memory")
+os.environ.setdefault("VECTOR_STORE_BACKEND", "local")
+os.environ.setdefault("LOCAL_VECTOR_STORE_PATH", tempfile.mkdtemp(prefix="test-vectors-"))
+os.environ.setdefault("TTS_CACHE_DIR", tempfile.mkdtemp(prefix="test-tts-"))
+os.environ.setdefault("ANSWER_CACHE_GENERATIONS_PATH",
+                      os.path.join(tempfile.mkdtemp(prefix="test-answer-cache-"), "generations.json"))
+os.environ.setdefault("FAQ_STORE_PATH", os.path.join(tempfile.mkdtemp(prefix="test-faq-"), "faq_store.json"))
@@ -0,0 +1,129 @@
+import asyncio
+import numpy as np
+import pytest
+from services.answer_cache import SemanticAnswerCache, ANSWER_CACHE_INITIAL_ROWS
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def new_cache(tmp_path):
+    def new_cache(**kwargs):
+        cache = SemanticAnswerCache(generations_path=str(tmp_path / "generations.json"), **kwargs)
+        # Re-read the shared generations on every lookup instead of once a second
+        cache._shared_generations.check_interval = 0
+        return cache
+    return new_cache
+
+
+def vector(*components, dim=8):
+    v = np.zeros(dim)
+    v[:len(components)] = components
+    return list(v)
+
+
+def result(answer):
+    return {"status": "success", "answer": answer}
+
+
+def test_reuses_answer_above_threshold_only(new_cache):
+    cache = new_cache(threshold=0.95)
+    cache.store("acme", "hours", vector(1, 0), result("nine to five"), seconds=2.0)
+    hit = cache.lookup("acme", vector(1, 0.1))
+    assert hit["answer"] == "nine to five" and hit["cached"]
+    assert cache.lookup("acme", vector(1, 1)) is None
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_tenants_are_isolated(new_cache):
+    cache = new_cache()
+    cache.store("acme", "hours", vector(1, 0), result("acme hours"), seconds=1.0)
+    assert cache.lookup("globex", vector(1, 0)) is None
+    assert cache.lookup("acme", vector(1, 0))["answer"] == "acme hours"
+
+
+def test_closest_entry_wins(new_cache):
+    cache = new_cache(threshold=0.9)
+    cache.store("acme", "a", vector(1, 0.3), result("a"), seconds=1.0)
+    cache.store("acme", "b", vector(1, 0.05), result("b"), seconds=1.0)
+    assert cache.lookup("acme", vector(1, 0))["answer"] == "b"
+
+
+def test_expired_entry_falls_back_to_older_live_match(new_cache):
+    clock = FakeClock()
+    cache = new_cache(threshold=0.9, ttl_seconds=10, clock=clock)
+    cache.store("acme", "old", vector(1, 0.2), result("old"), seconds=1.0)
+    clock.now = 8
+    cache.store("acme", "new", vector(1, 0), result("new"), seconds=1.0)
+    clock.now = 12
+    assert cache.lookup("acme", vector(1, 0))["answer"] == "new"
+    clock.now = 19
+    assert cache.lookup("acme", vector(1, 0)) is None
+    assert cache.stats()["expirations"] == 2 and len(cache) == 0
+
+
+def test_lru_eviction_frees_matrix_rows(new_cache):
+    cache = new_cache(threshold=0.99, max_size=3)
+    for i in range(5):
+        cache.store("acme", f"q{i}", vector(*np.eye(8)[i]), result(f"a{i}"), seconds=1.0)
+    assert len(cache) == 3 and cache.stats()["evictions"] == 2
+    assert cache.lookup("acme", vector(*np.eye(8)[0])) is None
+    assert cache.lookup("acme", vector(*np.eye(8)[4]))["answer"] == "a4"
+    assert len(cache._vectors["acme"]) == 3
+
+
+def test_matrix_grows_past_initial_rows(new_cache):
+    cache = new_cache(threshold=0.99)
+    dim = ANSWER_CACHE_INITIAL_ROWS * 2 + 1
+    for i in range(dim):
+        cache.store("acme", f"q{i}", list(np.eye(dim)[i]), result(f"a{i}"), seconds=1.0)
+    assert all(cache.lookup("acme", list(np.eye(dim)[i]))["answer"] == f"a{i}" for i in range(dim))
+
+
+def test_restoring_a_query_replaces_its_row(new_cache):
+    cache = new_cache(threshold=0.9)
+    cache.store("acme", "hours", vector(1, 0), result("v1"), seconds=1.0)
+    cache.store("acme", "hours", vector(1, 0), result("v2"), seconds=1.0)
+    assert len(cache) == 1 and len(cache._vectors["acme"]) == 1
+    assert cache.lookup("acme", vector(1, 0))["answer"] == "v2"
+
+
+def test_invalidation_drops_entries_and_in_flight_answers(new_cache):
+    cache = new_cache()
+    cache.store("acme", "hours", vector(1, 0), result("old"), seconds=1.0)
+    cache.store("globex", "hours", vector(1, 0), result("globex"), seconds=1.0)
+    in_flight = cache.generation("acme")
+
+    assert asyncio.run(cache.invalidate_tenant("acme")) == 1
+    assert cache.lookup("acme", vector(1, 0)) is None
+    assert cache.lookup("globex", vector(1, 0))["answer"] == "globex"
+
+    # An answer retrieved before the invalidation must not repopulate the cache
+    cache.store("acme", "hours", vector(1, 0), result("stale"), seconds=1.0, generation=in_flight)
+    assert cache.lookup("acme", vector(1, 0)) is None
+    assert cache.stats()["stale_stores_dropped"] == 1
+
+    cache.store("acme", "hours", vector(1, 0), result("fresh"), seconds=1.0, generation=cache.generation("acme"))
+    assert cache.lookup("acme", vector(1, 0))["answer"] == "fresh"
+
+
+def test_invalidation_reaches_other_workers(new_cache):
+    worker, other = new_cache(), new_cache()
+    worker.store("acme", "hours", vector(1, 0), result("old"), seconds=1.0)
+    other.store("acme", "hours", vector(1, 0), result("old"), seconds=1.0)
+    in_flight = other.generation("acme")
+
+    asyncio.run(worker.invalidate_tenant("acme"))
+    assert other.lookup("acme", vector(1, 0)) is None
+    other.store("acme", "hours", vector(1, 0), result("stale"), seconds=1.0, generation=in_flight)
+    assert other.lookup("acme", vector(1, 0)) is None
+
+    other.store("acme", "hours", vector(1, 0), result("fresh"), seconds=1.0, generation=other.generation("acme"))
+    assert other.lookup("acme", vector(1, 0))["answer"] == "fresh"
+    assert worker.generation("acme") == other.generation("acme") == 1
@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+from services.audio import (
+    EnergyVAD, StreamResampler, VAD_FRAME_MS, MEDIA_FRAME_BYTES, dbfs, pcm16_to_ulaw, ulaw_to_pcm16
+)
+
+
+def test_ulaw_reference_values():
+    assert pcm16_to_ulaw(np.array([0], dtype=np.int16)) == b"\xff"
+    assert ulaw_to_pcm16(b"\xff\x7f\x00\x80").tolist() == [0, 0, -32124, 32124]
+
+
+def test_ulaw_round_trips_every_code():
+    codes = bytes(range(256))
+    decoded = ulaw_to_pcm16(codes)
+    assert ulaw_to_pcm16(pcm16_to_ulaw(decoded)).tolist() == decoded.tolist()
+
+
+def test_ulaw_quantization_error_is_bounded():
+    samples = np.arange(-32635, 32636, 7, dtype=np.int32)
+    restored = ulaw_to_pcm16(pcm16_to_ulaw(samples.astype(np.int16))).astype(np.int32)
+    # Logarithmic steps: the error grows with the magnitude, up to 1/16 of it
+    assert np.all(np.abs(restored - samples) <= np.abs(samples) // 16 + 16)
+
+
+def test_ulaw_matches_audioop():
+    audioop = pytest.importorskip("audioop")
+    samples = np.arange(-32768, 32768, 3, dtype=np.int16)
+    assert pcm16_to_ulaw(samples) == audioop.lin2ulaw(samples.astype("<i2").tobytes(), 2)
+    codes = bytes(range(256))
+    assert ulaw_to_pcm16(codes).astype("<i2").tobytes() == audioop.ulaw2lin(codes, 2)
+
+
+def test_resampler_handles_split_chunks():
+    samples = (np.arange(2400) % 300 * 50).astype("<i2").tobytes()
+    resampler = StreamResampler(24000, 8000)
+    # Odd-sized pieces split samples and 3-sample groups
+    pieces = [resampler.process(samples[i:i + 997]) for i in range(0, len(samples), 997)]
+    out = np.concatenate(pieces)
+    expected = np.frombuffer(samples, dtype="<i2").reshape(-1, 3).mean(axis=1).astype(np.int16)
+    assert out.tolist() == expected.tolist()
+
+
+def _frame(level):
+    t = np.arange(MEDIA_FRAME_BYTES)
+    return (np.sin(t / 3) * level).astype(np.int16)
+
+
+def test_vad_detects_an_utterance():
+    vad = EnergyVAD()
+    events = []
+    frames = [_frame(20)] * 25 + [_frame(8000)] * 30 + [_frame(20)] * 40
+    for i, frame in enumerate(frames):
+        event = vad.process(frame, now=i * VAD_FRAME_MS / 1000)
+        if event:
+            events.append(event)
+    assert events == ["speech_start", "speech_end"]
+    utterance = vad.pop_utterance()
+    assert dbfs(utterance) > -30
+    assert utterance.size >= 30 * MEDIA_FRAME_BYTES
+
+
+def test_vad_ignores_short_bursts():
+    vad = EnergyVAD()
+    frames = [_frame(20)] * 25 + [_frame(8000)] * 4 + [_frame(20)] * 40
+    events = [vad.process(frame, now=i * VAD_FRAME_MS / 1000) for i, frame in enumerate(frames)]
+    assert "speech_end" not in events
@@ -0,0 +1,78 @@
+import asyncio
+from types import SimpleNamespace
+from services.cache import TTLCache
+from vectordb_files import pre_pocess
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_evicts_least_recently_used():
+    cache = TTLCache(max_size=2, ttl_seconds=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # "b" is now least recently used
+    cache.set("c", 3)
+    assert "b" not in cache
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.evictions == 1
+
+
+def test_entries_expire_after_their_ttl():
+    clock = Clock()
+    cache = TTLCache(max_size=10, ttl_seconds=10, clock=clock)
+    cache.set("a", 1)
+    cache.set("b", 2, ttl_seconds=30)
+    clock.now = 10
+    assert cache.get("a") is None
+    assert cache.get("b") == 2
+    assert list(cache.items()) == [("b", 2)]
+    assert cache.expirations == 1
+
+
+def test_stats_count_hits_and_misses():
+    cache = TTLCache(max_size=10)
+    cache.set("a", 1)
+    cache.get("a")
+    cache.get("missing")
+    assert "a" in cache  # membership checks are not counted
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["hit_rate"]) == (1, 1, 0.5)
+
+
+def test_zero_size_disables_caching():
+    cache = TTLCache(max_size=0)
+    cache.set("a", 1)
+    assert len(cache) == 0
+
+
+def test_remove_where():
+    cache = TTLCache(max_size=10)
+    for key in ["alice:1", "alice:2", "bob:1"]:
+        cache.set(key, key)
+    assert cache.remove_where(lambda key, value: key.startswith("alice")) == 2
+    assert list(cache.items()) == [("bob:1", "bob:1")]
+
+
+def test_query_embeddings_are_reused_for_equivalent_questions(monkeypatch):
+    calls = []
+
+    async def embed_query(text):
+        calls.append(text)
+        return [float(len(text))]
+
+    monkeypatch.setattr(pre_pocess, "embedding_model", SimpleNamespace(model="m", aembed_query=embed_query))
+    monkeypatch.setattr(pre_pocess, "query_embedding_cache", TTLCache(max_size=16, ttl_seconds=60))
+
+    async def run():
+        return [await pre_pocess.embed_query_cached(query)
+                for query in ["What are your hours?", "  what are your   HOURS?", "Where are you?"]]
+
+    first, repeated, other = asyncio.run(run())
+    assert first == repeated
+    assert len(calls) == 2
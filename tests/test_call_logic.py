@@ -0,0 +1,75 @@
+import re
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from routes.twilo_talk import router
+from services import call_logic
+from services.metrics import call_stage_seconds
+from services.tts_service import TTS_MODEL, TTS_VOICE, TTS_AUDIO_FORMAT, tts_cache, tts_cache_key
+
+app = FastAPI()
+app.include_router(router, prefix="/api")
+
+
+@pytest.fixture
+def client():
+    return TestClient(app, base_url="https://bot.test")
+
+
+@pytest.fixture
+def webhook_url(monkeypatch):
+    config = {}
+    monkeypatch.setattr(call_logic, "load_twilio_config", lambda: config)
+    return lambda value: config.update(webhook_url=value)
+
+
+@pytest.fixture
+def cached_greeting():
+    filename = f"{tts_cache_key(call_logic.INCOMING_GREETING, TTS_VOICE, TTS_MODEL)}.{TTS_AUDIO_FORMAT}"
+    tts_cache._write_file(filename, b"audio")
+    return filename
+
+
+def _incoming(client):
+    return client.post("/api/voice/incoming", data={"CallSid": "CA1", "From": "+15550001", "To": "+15550002"}).text
+
+
+@pytest.mark.parametrize("configured", ["None", "", None, "bot.example.com", "ftp://bot.example.com"])
+def test_invalid_webhook_url_falls_back_to_the_request_host(client, webhook_url, cached_greeting, configured):
+    webhook_url(configured)
+    assert f"<Play>https://bot.test/api/tts/{cached_greeting}</Play>" in _incoming(client)
+
+
+def test_configured_webhook_url_is_used(client, webhook_url, cached_greeting):
+    webhook_url("https://public.example.com/api/")
+    assert f"<Play>https://public.example.com/api/tts/{cached_greeting}</Play>" in _incoming(client)
+
+
+@pytest.mark.parametrize("configured, expected", [
+    ("None", "wss://bot.test/api/voice/media_stream"),
+    ("http://public.example.com/api", "ws://public.example.com/api/voice/media_stream"),
+])
+def test_media_stream_url_uses_the_validated_base(client, webhook_url, monkeypatch, configured, expected):
+    monkeypatch.setattr(call_logic, "VOICE_PIPELINE", "stream")
+    webhook_url(configured)
+    assert f'<Stream url="{expected}">' in _incoming(client)
+
+
+def _stage_count(stage, direction):
+    pattern = re.compile(rf'^voicebot_call_stage_seconds_count\{{stage="{stage}",tenant="[^"]*",direction="{direction}"\}} (\d+)$')
+    return sum(int(match.group(1)) for match in map(pattern.match, call_stage_seconds.render().splitlines()) if match)
+
+
+@pytest.mark.parametrize("path, data, direction", [
+    ("/api/voice/incoming", {"CallSid": "CA1", "From": "+15550001", "To": "+15550002"}, "inbound"),
+    ("/api/voice/continue", {"CallSid": "CA1", "Digits": "1"}, "inbound"),
+    ("/api/voice/continue", {"CallSid": "CA1", "Digits": "9"}, "inbound"),
+    ("/api/voice/outbound", {"CallSid": "CA2", "From": "+15550002", "To": "+15550001"}, "outbound"),
+])
+def test_every_twiml_webhook_is_timed(client, webhook_url, path, data, direction):
+    webhook_url("None")
+    before = {stage: _stage_count(stage, direction) for stage in ("webhook_total", "twiml_render")}
+    assert client.post(path, data=data).text.startswith("<?xml")
+    assert {stage: _stage_count(stage, direction) - count for stage, count in before.items()} == {
+        "webhook_total": 1, "twiml_render": 1
+    }
@@ -0,0 +1,101 @@
+import asyncio
+import pytest
+from services import call_state
+from services.call_state import CallState, InMemoryCallStateStore, SqliteCallStateStore
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_store(request, tmp_path):
+    def make():
+        if request.param == "sqlite":
+            return SqliteCallStateStore(str(tmp_path / "call_states.db"))
+        return InMemoryCallStateStore()
+    return make
+
+
+def test_put_and_get(make_store):
+    store = make_store()
+
+    async def run():
+        await store.put(CallState("CA1", direction="outbound", step="outbound_greeting", tenant="acme"))
+        return await store.get("CA1"), await store.get("CA2")
+
+    state, missing = asyncio.run(run())
+    assert (state.direction, state.step, state.tenant) == ("outbound", "outbound_greeting", "acme")
+    assert missing is None
+
+
+def test_state_expires_after_ttl(make_store, monkeypatch):
+    store = make_store()
+    now = [1000.0]
+    monkeypatch.setattr(call_state.time, "time", lambda: now[0])
+
+    async def run():
+        await store.put(CallState("CA1"))
+        now[0] += call_state.CALL_STATE_TTL - 1
+        assert await store.get("CA1") is not None
+        now[0] += 2
+        return await store.get("CA1")
+
+    assert asyncio.run(run()) is None
+
+
+def test_completed_calls_expire_sooner(make_store, monkeypatch):
+    store = make_store()
+    now = [1000.0]
+    monkeypatch.setattr(call_state.time, "time", lambda: now[0])
+
+    async def run():
+        await store.put(CallState("CA1"))
+        await store.complete("CA1", "no-answer")
+        assert (await store.get("CA1")).status == "no-answer"
+        now[0] += call_state.CALL_STATE_COMPLETED_TTL + 1
+        return await store.get("CA1")
+
+    assert asyncio.run(run()) is None
+
+
+def test_sweep_evicts_expired_states(make_store, monkeypatch):
+    store = make_store()
+    now = [1000.0]
+    monkeypatch.setattr(call_state.time, "time", lambda: now[0])
+
+    async def run():
+        for i in range(3):
+            await store.put(CallState(f"CA{i}"))
+        now[0] += call_state.CALL_STATE_TTL + call_state.CALL_STATE_SWEEP_SECONDS + 1
+        return await store.stats()
+
+    stats = asyncio.run(run())
+    assert stats["size"] == 0
+    assert stats["evictions"] == 3
+
+
+def test_sqlite_state_is_shared_between_workers(tmp_path):
+    path = str(tmp_path / "call_states.db")
+    first, second = SqliteCallStateStore(path), SqliteCallStateStore(path)
+
+    async def run():
+        await first.put(CallState("CA1", step="greeting", tenant="acme"))
+        state = await second.get("CA1")
+        state.step = "answered"
+        await second.put(state)
+        return await first.get("CA1")
+
+    assert asyncio.run(run()).step == "answered"
+
+
+def test_memory_store_evicts_oldest_beyond_max_entries():
+    store = InMemoryCallStateStore(max_entries=2)
+
+    async def run():
+        await store.put(CallState("CA1"))
+        await store.put(CallState("CA2"))
+        # Writing CA1 again makes CA2 the oldest
+        await store.put(CallState("CA1", step="answered"))
+        await store.put(CallState("CA3"))
+        return [await store.get(sid) for sid in ("CA1", "CA2", "CA3")], await store.stats()
+
+    (first, second, third), stats = asyncio.run(run())
+    assert first.step == "answered" and second is None and third is not None
+    assert (stats["size"], stats["evictions"], stats["max_entries"]) == (2, 1, 2)
@@ -0,0 +1,128 @@
+import asyncio
+import time
+from types import SimpleNamespace
+import pytest
+from fastapi import HTTPException
+from services import campaign
+from services.call_state import InMemoryCallStateStore
+from services.campaign import CallPacer, CampaignManager, expected_call_seconds, parse_numbers
+
+
+def test_parse_json_numbers():
+    assert parse_numbers(b'["+15550001", " +15550002 ", ""]') == ["+15550001", "+15550002"]
+    assert parse_numbers(b'{"numbers": [{"phone": "+15550003"}, {"to": "+15550004"}]}') == ["+15550003", "+15550004"]
+
+
+def test_parse_csv_numbers():
+    with_header = b"name,phone_number\nAda,+15550001\nBob,+15550002\n"
+    without_header = b"\xef\xbb\xbf+15550001,Ada\n\n+15550002,Bob\n"
+    assert parse_numbers(with_header, "list.csv") == ["+15550001", "+15550002"]
+    assert parse_numbers(without_header, "list.csv") == ["+15550001", "+15550002"]
+    assert parse_numbers(b"  ") == []
+
+
+def test_pacer_spaces_calls():
+    pacer = CallPacer(calls_per_second=20)
+
+    async def run():
+        started = time.monotonic()
+        await asyncio.gather(*(pacer.wait() for _ in range(5)))
+        return time.monotonic() - started
+
+    # The first call goes immediately, the next four 50ms apart
+    assert 0.19 <= asyncio.run(run()) < 0.5
+
+
+@pytest.mark.parametrize("webhook_url", [None, "", "None", "example.com", "ftp://example.com"])
+def test_campaigns_require_an_http_webhook_url(monkeypatch, webhook_url):
+    monkeypatch.setattr(campaign, "load_twilio_config", lambda: {"webhook_url": webhook_url})
+    with pytest.raises(HTTPException) as raised:
+        campaign.campaign_webhook_url()
+    assert raised.value.status_code == 400
+
+
+def test_expected_call_seconds_scale_with_the_message():
+    short = expected_call_seconds("Hello there", interactive=False)
+    long = expected_call_seconds("word " * 500, interactive=False)
+    assert long - short == pytest.approx(200, abs=1)
+    assert expected_call_seconds("Hi", interactive=True) > expected_call_seconds("Hi", interactive=False)
+
+
+@pytest.fixture
+def manager(monkeypatch):
+    monkeypatch.setattr(campaign, "load_twilio_config", lambda: {"webhook_url": "https://bot.example.com"})
+    monkeypatch.setattr(campaign, "call_state_store", InMemoryCallStateStore())
+    manager = CampaignManager(calls_per_second=0, max_concurrent_calls=2)
+    manager.dialed = []
+
+    async def create_call(phone_number, message, interactive):
+        manager.dialed.append(phone_number)
+        return SimpleNamespace(sid=f"CA{len(manager.dialed)}")
+
+    manager.create_call = create_call
+    return manager
+
+
+def test_campaign_waits_for_free_slots(manager):
+    async def run():
+        running = manager.create(["+15550001", "+15550002", "+15550003", "5550004", "+15550001"])
+        await asyncio.sleep(0.05)
+        # Two calls are live; the third waits for a slot
+        assert manager.dialed == ["+15550001", "+15550002"]
+        manager.on_call_status("CA1", "completed")
+        await asyncio.wait_for(running._task, 1)
+        return running
+
+    finished = asyncio.run(run())
+    assert manager.dialed == ["+15550001", "+15550002", "+15550003"]
+    progress = finished.progress()
+    assert progress["status"] == "completed"
+    assert progress["counts"] == {"finished": 1, "initiated": 2, "failed": 1}
+    assert progress["duplicates_skipped"] == 1
+
+
+def test_slots_are_freed_by_a_status_callback_on_another_worker(manager, monkeypatch):
+    monkeypatch.setattr(campaign, "CAMPAIGN_STATUS_POLL_SECONDS", 0.01)
+
+    async def run():
+        running = manager.create(["+15550001", "+15550002", "+15550003"])
+        await asyncio.sleep(0.05)
+        assert manager.dialed == ["+15550001", "+15550002"]
+        # Another worker handled /voice/status: only the shared call state changes
+        await campaign.call_state_store.complete("CA2", "busy")
+        await asyncio.wait_for(running._task, 1)
+        return running
+
+    finished = asyncio.run(run())
+    assert manager.dialed == ["+15550001", "+15550002", "+15550003"]
+    assert [(call.status, call.call_status) for call in finished.calls] == [
+        ("initiated", None), ("finished", "busy"), ("initiated", None)]
+
+
+def test_slots_are_freed_when_no_status_callback_arrives(manager):
+    async def run():
+        running = manager.create(["+15550001", "+15550002", "+15550003"])
+        running.call_timeout = 0.05
+        await asyncio.wait_for(running._task, 1)
+
+    asyncio.run(run())
+    assert len(manager.dialed) == 3
+
+
+def test_finished_campaigns_are_evicted(manager, monkeypatch):
+    monkeypatch.setattr(campaign, "CAMPAIGN_MAX_FINISHED", 2)
+
+    async def run():
+        created = []
+        for i in range(4):
+            created.append(manager.create([f"+1555000{i}"]))
+            await asyncio.wait_for(created[-1]._task, 1)
+            manager.on_call_status(created[-1].calls[0].call_sid, "completed")
+        return created
+
+    created = asyncio.run(run())
+    stats = manager.stats()
+    assert [c["campaign_id"] for c in stats["campaigns"]] == [created[2].id, created[3].id]
+    assert stats["evicted_campaigns"] == 2
+    with pytest.raises(HTTPException):
+        manager.get(created[0].id)
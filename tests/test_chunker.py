@@ -0,0 +1,77 @@
+import pytest
+from benchmarks.fixtures import synthetic_text
+from vectordb_files.chunker import Chunker, iter_chunks
+
+
+def _pages(count=6, chars_per_page=900):
+    text = synthetic_text(count * chars_per_page)
+    return [text[i * chars_per_page:(i + 1) * chars_per_page] for i in range(count)]
+
+
+def _document(pages):
+    return " ".join(" ".join(page.split()) for page in pages if page.split())
+
+
+def test_offsets_point_into_the_normalized_document():
+    pages = _pages()
+    document = _document(pages)
+    chunks = list(iter_chunks(pages, chunk_size=300, overlap=60))
+    assert [chunk.index for chunk in chunks] == list(range(len(chunks)))
+    for chunk in chunks:
+        assert document[chunk.char_start:chunk.char_end] == chunk.text
+        assert len(chunk.text) <= 300
+
+
+def test_chunks_cover_the_document_with_overlap():
+    pages = _pages()
+    document = _document(pages)
+    chunks = list(iter_chunks(pages, chunk_size=300, overlap=60))
+    assert chunks[0].char_start == 0
+    assert chunks[-1].char_end == len(document)
+    for previous, chunk in zip(chunks, chunks[1:]):
+        # Each chunk starts after the previous start and no later than its end
+        assert previous.char_start < chunk.char_start <= previous.char_end
+
+
+def test_cuts_prefer_sentence_ends():
+    chunks = list(iter_chunks(_pages(), chunk_size=300, overlap=0))
+    assert sum(chunk.text.endswith((".", "?", "!")) for chunk in chunks[:-1]) >= len(chunks) // 2
+
+
+def test_page_numbers_follow_the_text():
+    pages = ["alpha beta gamma " * 20, "", "delta epsilon " * 20]
+    first_page_end = len(pages[0].strip())
+    chunks = list(iter_chunks(pages, chunk_size=100, overlap=20))
+    for chunk in chunks:
+        # The empty second page keeps its number, so the text after it is page 3
+        assert chunk.page_start == (1 if chunk.char_start < first_page_end else 3)
+        assert chunk.page_end == (1 if chunk.char_end <= first_page_end else 3)
+    assert any(chunk.page_start == 1 and chunk.page_end == 3 for chunk in chunks)
+
+
+def test_page_boundaries_do_not_change_the_chunks():
+    pages = _pages()
+    whole = [chunk.text for chunk in iter_chunks([_document(pages)], chunk_size=250, overlap=40)]
+    paged = [chunk.text for chunk in iter_chunks(pages, chunk_size=250, overlap=40)]
+    assert paged == whole
+
+
+def test_text_without_breaks_is_cut_at_the_window():
+    chunks = list(iter_chunks(["x" * 1000], chunk_size=300, overlap=50))
+    assert [len(chunk.text) for chunk in chunks[:-1]] == [300] * (len(chunks) - 1)
+    assert chunks[-1].char_end == 1000
+
+
+def test_token_chunks_stay_within_size():
+    chunker = Chunker(chunk_size=80, overlap=10, unit="tokens")
+    chunks = [chunk for page in _pages() for chunk in chunker.push(page)] + chunker.flush()
+    assert len(chunks) > 1
+    if chunker.encoding is not None:
+        # A chunk spanning a page break may be one token over
+        assert max(len(chunker.encoding.encode(chunk.text)) for chunk in chunks) <= 81
+
+
+@pytest.mark.parametrize("kwargs", [{"unit": "words"}, {"chunk_size": 0}])
+def test_rejects_invalid_settings(kwargs):
+    with pytest.raises(ValueError):
+        Chunker(**kwargs)
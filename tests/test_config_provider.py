@@ -0,0 +1,48 @@
+import json
+import os
+from config.twilio_config_handler import ConfigProvider
+
+
+def test_missing_file_reads_as_empty(tmp_path):
+    provider = ConfigProvider(tmp_path / "config.json")
+    assert provider.get() == {}
+    assert provider.version == 1
+
+
+def test_save_is_visible_immediately_and_on_disk(tmp_path):
+    path = tmp_path / "config.json"
+    provider = ConfigProvider(path)
+    provider.save({"webhook_url": "https://bot.example.com"})
+    assert provider.get()["webhook_url"] == "https://bot.example.com"
+    assert json.loads(path.read_text()) == {"webhook_url": "https://bot.example.com"}
+    assert [name for name in os.listdir(tmp_path) if name.endswith(".tmp")] == []
+
+
+def test_reads_are_copies(tmp_path):
+    provider = ConfigProvider(tmp_path / "config.json")
+    provider.save({"a": 1})
+    provider.get()["a"] = 2
+    assert provider.get() == {"a": 1}
+
+
+def test_external_edits_are_reloaded_after_the_check_interval(tmp_path):
+    path = tmp_path / "config.json"
+    path.write_text(json.dumps({"a": 1}))
+    provider = ConfigProvider(path, check_interval=0)
+    assert provider.get() == {"a": 1}
+    version = provider.version
+    assert provider.get() == {"a": 1}
+    assert provider.version == version  # unchanged file, no reload
+
+    path.write_text(json.dumps({"a": 22}))
+    assert provider.get() == {"a": 22}
+    assert provider.version == version + 1
+
+
+def test_edits_within_the_check_interval_are_not_seen_yet(tmp_path):
+    path = tmp_path / "config.json"
+    path.write_text(json.dumps({"a": 1}))
+    provider = ConfigProvider(path, check_interval=3600)
+    assert provider.get() == {"a": 1}
+    path.write_text(json.dumps({"a": 22}))
+    assert provider.get() == {"a": 1}
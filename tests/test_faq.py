@@ -0,0 +1,104 @@
+import asyncio
+from types import SimpleNamespace
+import pytest
+from services import faq
+from services.cache import TTLCache
+from vectordb_files import pre_pocess
+
+
+def _embedding(text):
+    # Questions about opening times land on one axis, everything else on another
+    return [1.0, 0.0, 0.0] if "open" in text else [0.0, 1.0, 0.0]
+
+
+async def _embed_documents(texts):
+    return [_embedding(text) for text in texts]
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    embeddings = SimpleNamespace(model="m", aembed_documents=_embed_documents, calls=0)
+
+    async def embed_query(text):
+        embeddings.calls += 1
+        return _embedding(text)
+
+    embeddings.aembed_query = embed_query
+    monkeypatch.setattr(pre_pocess, "embedding_model", embeddings)
+    monkeypatch.setattr(faq, "embedding_model", embeddings)
+    monkeypatch.setattr(pre_pocess, "query_embedding_cache", TTLCache(max_size=16, ttl_seconds=60))
+    store = faq.FAQStore(path=str(tmp_path / "faq_store.json"))
+    store.embeddings = embeddings
+    return store
+
+
+def test_exact_and_fuzzy_matches_need_no_embedding(store):
+    async def run():
+        await store.add("acme", "What are your opening hours?", answer="9 to 5", variants=["When do you close"])
+        return (await store.lookup("acme", "what are your OPENING hours"),
+                await store.lookup("acme", "What are your openin hours?"),
+                await store.lookup("acme", "when do you close?"))
+
+    exact, fuzzy, variant = asyncio.run(run())
+    assert exact["answer"] == fuzzy["answer"] == variant["answer"] == "9 to 5"
+    assert (exact["match"], fuzzy["match"], variant["match"]) == ("exact", "fuzzy", "exact")
+    assert store.embeddings.calls == 0
+
+
+def test_embedding_match_records_embedding_time_once(store):
+    async def run():
+        await store.add("acme", "What are your opening hours?", answer="9 to 5")
+        await store.rebuild("acme")
+        faq_timings, rag_timings = {}, {}
+        match = await store.lookup("acme", "Is the shop open on Sunday", timings=faq_timings)
+        # RAG reuses the embedding the FAQ lookup computed
+        await pre_pocess.embed_query_cached("Is the shop open on Sunday", rag_timings)
+        return match, faq_timings, rag_timings
+
+    match, faq_timings, rag_timings = asyncio.run(run())
+    assert match["match"] == "embedding"
+    assert faq_timings["faq_match"] == "embedding"
+    assert "faq_seconds" in faq_timings and "embedding_seconds" in faq_timings
+    assert "embedding_seconds" not in rag_timings
+    assert store.embeddings.calls == 1
+
+
+def test_generated_answers_go_stale_when_documents_change(store, monkeypatch):
+    async def rag(user_query, username):
+        return {"status": "success", "answer": f"generated for {username}", "confidence": "high"}
+
+    monkeypatch.setattr(faq, "rag_qna_chatbot", rag)
+
+    async def run():
+        entry = await store.add("acme", "Do you deliver?")
+        assert await store.lookup("acme", "do you deliver") is None
+        await store.rebuild("acme")
+        served = await store.lookup("acme", "do you deliver")
+        await store.documents_changed("acme")
+        stale = await store.lookup("acme", "do you deliver")
+        await asyncio.gather(*store._tasks)
+        return entry, served, stale, await store.lookup("acme", "do you deliver")
+
+    entry, served, stale, refreshed = asyncio.run(run())
+    assert served["answer"] == "generated for acme"
+    assert stale is None
+    assert refreshed["id"] == entry["id"]
+
+
+def test_mining_saves_all_entries_at_once(store, monkeypatch):
+    async def rag(user_query, username):
+        return {"status": "success", "answer": f"answer to {user_query}", "confidence": "high"}
+
+    monkeypatch.setattr(faq, "rag_qna_chatbot", rag)
+    for query in ["Do you deliver?", "Do you take cards?", "Where are you located?"]:
+        store.log_query("acme", query)
+        store.log_query("acme", query)
+    saves = []
+    save = store._provider.save
+    monkeypatch.setattr(store._provider, "save", lambda config: saves.append(config) or save(config))
+
+    result = asyncio.run(store.mine("acme", min_count=2))
+    assert len(result["added"]) == 3
+    assert len(saves) == 1
+    assert {entry["question"] for entry in store.list_entries("acme")} == {
+        "Do you deliver?", "Do you take cards?", "Where are you located?"}
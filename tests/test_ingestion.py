@@ -0,0 +1,38 @@
+import asyncio
+import pytest
+from benchmarks.fixtures import synthetic_pdf
+from vectordb_files import ingestion
+
+
+@pytest.fixture
+def pdf_path(tmp_path):
+    path = tmp_path / "doc.pdf"
+    path.write_bytes(synthetic_pdf(12, chars_per_page=1500))
+    return str(path)
+
+
+@pytest.fixture(params=[0, 2], ids=["thread", "pool"])
+def workers(request, monkeypatch):
+    monkeypatch.setattr(ingestion, "PDF_PROCESS_WORKERS", request.param)
+    monkeypatch.setattr(ingestion, "PDF_PAGES_PER_TASK", 5)
+    yield request.param
+    ingestion.shutdown_process_pool()
+
+
+async def _collect(chunks):
+    return [chunk async for chunk in chunks]
+
+
+def test_streaming_and_batch_chunking_agree(pdf_path, workers):
+    stats = {}
+    streamed = asyncio.run(_collect(ingestion.stream_pdf_chunks(pdf_path, chunk_size=400, overlap=50, stats=stats)))
+
+    async def batch():
+        pages = await ingestion.extract_pages_in_pool(pdf_path)
+        return await ingestion.chunk_pages_in_thread(pages, chunk_size=400, overlap=50)
+    batched = asyncio.run(batch())
+
+    assert streamed == batched
+    assert stats["pages"] == 12
+    # Chunks span page ranges handed to different workers
+    assert {chunk.page_start for chunk in streamed} == set(range(1, 13))
@@ -0,0 +1,88 @@
+import asyncio
+import pytest
+from qdrant_client.models import PointStruct
+from vectordb_files.vector_store import LocalVectorStore
+
+DIM = 4
+
+
+def _point(point_id, vector, username="alice", filename="doc.pdf", chunk_index=0):
+    return PointStruct(id=point_id, vector=vector,
+                       payload={"username": username, "filename": filename, "chunk_index": chunk_index, "text": point_id})
+
+
+@pytest.fixture
+def workers(tmp_path):
+    # Two stores on one directory behave like two uvicorn workers
+    return LocalVectorStore(path=str(tmp_path), dim=DIM), LocalVectorStore(path=str(tmp_path), dim=DIM)
+
+
+def test_search_ranks_by_cosine_and_filters_by_tenant(tmp_path):
+    store = LocalVectorStore(path=str(tmp_path), dim=DIM)
+
+    async def run():
+        await store.upsert([
+            _point("a", [1, 0, 0, 0]),
+            _point("b", [1, 1, 0, 0]),
+            _point("c", [1, 0, 0, 0], username="bob"),
+        ])
+        return (await store.search([2, 0, 0, 0], "alice", 5, None),
+                await store.search([1, 0, 0, 0], "alice", 5, 0.9),
+                await store.search([1, 0, 0, 0], "carol", 5, None))
+
+    ranked, above_threshold, unknown = asyncio.run(run())
+    assert [hit.id for hit in ranked] == ["a", "b"]
+    assert ranked[0].score == pytest.approx(1.0)
+    assert [hit.id for hit in above_threshold] == ["a"]
+    assert unknown == []
+
+
+def test_writes_from_another_worker_are_visible(workers):
+    first, second = workers
+
+    async def run():
+        await first.upsert([_point("a", [1, 0, 0, 0])])
+        assert [hit.id for hit in await second.search([1, 0, 0, 0], None, 5, None)] == ["a"]
+        await second.upsert([_point("b", [0, 1, 0, 0])])
+        await first.set_chunk_positions("alice", [("b", {"chunk_index": 7})])
+        await second.delete("alice", ["a"])
+        return await first.document_points("alice", "doc.pdf"), await second.document_points("alice", "doc.pdf")
+
+    seen_by_first, seen_by_second = asyncio.run(run())
+    assert seen_by_first == seen_by_second == {"b": {"chunk_index": 7}}
+
+
+def test_compaction_by_another_worker(workers):
+    first, second = workers
+
+    async def run():
+        await first.upsert([_point(str(i), [1, i, 0, 0], chunk_index=i) for i in range(6)])
+        await second.search([1, 0, 0, 0], None, 1, None)
+        await first.delete("alice", ["0", "1", "2"])
+        assert await first.compact() == 3
+        await first.upsert([_point("6", [0, 0, 1, 0], chunk_index=6)])
+        return await second.search([0, 0, 1, 0], None, 1, None), await second.health()
+
+    hits, health = asyncio.run(run())
+    assert hits[0].id == "6"
+    assert hits[0].score == pytest.approx(1.0)
+    assert health["live_points"] == health["stored_rows"] == 4
+
+
+def test_torn_log_tail_is_ignored_and_overwritten(tmp_path):
+    async def run():
+        store = LocalVectorStore(path=str(tmp_path), dim=DIM)
+        await store.upsert([_point("a", [1, 0, 0, 0])])
+        # A writer died mid-append: a vector without a record and half a log line
+        with open(store.vectors_path, "ab") as vectors:
+            vectors.write(b"\0" * 4 * DIM)
+        with open(store.log_path, "a") as log:
+            log.write('{"op": "add", "row": 1, "id": "tor')
+        reopened = LocalVectorStore(path=str(tmp_path), dim=DIM)
+        assert (await reopened.health())["live_points"] == 1
+        await reopened.upsert([_point("b", [0, 1, 0, 0])])
+        return await LocalVectorStore(path=str(tmp_path), dim=DIM).search([0, 1, 0, 0], None, 5, None)
+
+    hits = asyncio.run(run())
+    assert [hit.id for hit in hits][0] == "b"
+    assert {hit.id for hit in hits} == {"a", "b"}
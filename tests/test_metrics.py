@@ -0,0 +1,58 @@
+import pytest
+from services.metrics import Counter, Histogram, MetricsRegistry, _Metric
+
+
+def test_counter_render():
+    counter = Counter("calls_total", "Calls", ["tenant"])
+    counter.inc(tenant="acme")
+    counter.inc(2, tenant='say "hi"\n')
+    assert counter.render() == "\n".join([
+        "# HELP calls_total Calls",
+        "# TYPE calls_total counter",
+        'calls_total{tenant="acme"} 1',
+        'calls_total{tenant="say \\"hi\\"\\n"} 2',
+    ])
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram("stage_seconds", "Stage time", ["stage"], buckets=[0.1, 1])
+    for value in [0.05, 0.5, 0.7, 3]:
+        histogram.observe(value, stage="stt")
+    assert histogram.render().splitlines()[2:] == [
+        'stage_seconds_bucket{stage="stt",le="0.1"} 1',
+        'stage_seconds_bucket{stage="stt",le="1"} 3',
+        'stage_seconds_bucket{stage="stt",le="+Inf"} 4',
+        'stage_seconds_sum{stage="stt"} 4.25',
+        'stage_seconds_count{stage="stt"} 4',
+    ]
+
+
+def test_histogram_time_observes_on_error():
+    histogram = Histogram("work_seconds", "Work")
+    with pytest.raises(RuntimeError):
+        with histogram.time():
+            raise RuntimeError
+    assert histogram.render().splitlines()[-1] == "work_seconds_count 1"
+
+
+def test_labels_must_match():
+    counter = Counter("errors_total", "Errors", ["stage"])
+    with pytest.raises(ValueError):
+        counter.inc(tenant="acme")
+
+
+def test_registry_renders_every_metric_once():
+    registry = MetricsRegistry()
+    registry.register(Counter("a_total", "A")).inc()
+    registry.register(Counter("b_total", "B"))
+    with pytest.raises(ValueError):
+        registry.register(Counter("a_total", "A again"))
+    text = registry.render()
+    assert text.endswith("\n")
+    assert text.count("# TYPE") == 2
+    assert "a_total 1" in text
+
+
+def test_metric_base_class_is_abstract():
+    with pytest.raises(TypeError):
+        _Metric("x", "X")
@@ -0,0 +1,113 @@
+import asyncio
+import hashlib
+from types import SimpleNamespace
+import pytest
+from fastapi import HTTPException
+from vectordb_files import pre_pocess
+from vectordb_files.vector_store import LocalVectorStore
+
+DIM = 8
+
+
+def _embedding(text):
+    digest = hashlib.sha256(text.encode("utf-8")).digest()
+    return [byte / 255 + 0.01 for byte in digest[:DIM]]
+
+
+async def _embed_documents(texts):
+    return [_embedding(text) for text in texts]
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = LocalVectorStore(path=str(tmp_path), dim=DIM)
+    monkeypatch.setattr(pre_pocess, "vector_store", store)
+    monkeypatch.setattr(pre_pocess, "embedding_model", SimpleNamespace(aembed_documents=_embed_documents, model="m"))
+    return store
+
+
+def _store(chunks):
+    return pre_pocess.store_chunks_in_qdrant(chunks, "alice", "doc.pdf", batch_size=1, max_concurrency=1,
+                                             upsert_batch_size=1)
+
+
+async def _failing_stream(error):
+    # Reorders two stored chunks and adds new ones before the upload breaks off
+    for text in ["chunk d", "chunk c", "chunk e", "chunk f", "chunk g"]:
+        yield text
+        await asyncio.sleep(0)
+    raise error
+
+
+@pytest.mark.parametrize("error", [ValueError("bad page"), asyncio.CancelledError()], ids=["parse_error", "cancelled"])
+def test_failed_streaming_upload_keeps_previous_version(store, error):
+    async def run():
+        await _store(["chunk a", "chunk b", "chunk c", "chunk d"])
+        before = await store.document_points("alice", "doc.pdf")
+        with pytest.raises((HTTPException, asyncio.CancelledError)) as raised:
+            await _store(_failing_stream(error))
+        return before, raised.value, await store.document_points("alice", "doc.pdf")
+
+    before, raised, after = asyncio.run(run())
+    assert len(before) == 4
+    assert after == before
+    if isinstance(error, asyncio.CancelledError):
+        assert isinstance(raised, asyncio.CancelledError)
+    else:
+        assert raised.status_code == 500
+
+
+def test_completed_reupload_replaces_previous_version(store):
+    async def run():
+        await _store(["chunk a", "chunk b", "chunk c"])
+        result = await _store(["chunk c", "chunk d"])
+        return result, await store.document_points("alice", "doc.pdf")
+
+    result, after = asyncio.run(run())
+    assert len(after) == 2
+    assert sorted(positions["chunk_index"] for positions in after.values()) == [0, 1]
+
+
+def test_identical_reupload_embeds_nothing(store):
+    async def run():
+        await _store(["chunk a", "chunk b"])
+        return await _store(["chunk a", "chunk b"])
+
+    result = asyncio.run(run())
+    assert (result["reused_chunks"], result["embedded_chunks"], result["deleted_chunks"]) == (2, 0, 0)
+
+
+def test_reupload_embeds_only_changed_chunks_and_refreshes_positions(store):
+    async def run():
+        await _store(["chunk a", "chunk b", "chunk c"])
+        before = await store.document_points("alice", "doc.pdf")
+        result = await _store(["chunk c", "chunk a", "chunk new"])
+        return before, result, await store.document_points("alice", "doc.pdf")
+
+    before, result, after = asyncio.run(run())
+    assert (result["reused_chunks"], result["embedded_chunks"], result["deleted_chunks"]) == (2, 1, 1)
+    kept = set(before) & set(after)
+    assert len(kept) == 2
+    assert sorted(after[point_id]["chunk_index"] for point_id in kept) == [0, 1]
+    assert sorted(positions["chunk_index"] for positions in after.values()) == [0, 1, 2]
+
+
+def test_repeated_text_gets_one_point_per_occurrence(store):
+    async def run():
+        await _store(["same", "same", "other"])
+        return await store.document_points("alice", "doc.pdf")
+
+    assert len(asyncio.run(run())) == 3
+
+
+def test_documents_are_separate_per_user_and_file(store):
+    async def run():
+        await _store(["chunk a"])
+        await pre_pocess.store_chunks_in_qdrant(["chunk a"], "bob", "doc.pdf")
+        await pre_pocess.store_chunks_in_qdrant(["chunk a"], "alice", "other.pdf")
+        return [await store.document_points(user, name)
+                for user, name in [("alice", "doc.pdf"), ("bob", "doc.pdf"), ("alice", "other.pdf")]]
+
+    documents = asyncio.run(run())
+    assert all(len(points) == 1 for points in documents)
+    assert len({point_id for points in documents for point_id in points}) == 3
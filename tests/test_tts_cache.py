@@ -0,0 +1,58 @@
+import os
+import time
+from services.tts_service import TTSAudioCache, TTS_AUDIO_FORMAT, tts_cache_key
+
+
+def _cache_file(cache, text, size, age):
+    filename = f"{tts_cache_key(text, 'alloy', 'tts-1')}.{TTS_AUDIO_FORMAT}"
+    cache._write_file(filename, b"x" * size)
+    mtime = time.time() - age
+    os.utime(cache.directory / filename, (mtime, mtime))
+    return filename
+
+
+def test_directory_is_created_on_first_write(tmp_path):
+    cache = TTSAudioCache(directory=str(tmp_path / "tts"), max_bytes=1000)
+    assert not cache.directory.exists()
+    assert cache.lookup("hello", "alloy", "tts-1") is None
+    assert cache.stats()["files"] == 0
+    _cache_file(cache, "hello", 10, age=0)
+    assert cache.lookup("hello", "alloy", "tts-1") is not None
+
+
+def test_files_written_by_another_worker_are_hits(tmp_path):
+    writer = TTSAudioCache(directory=str(tmp_path), max_bytes=1000)
+    reader = TTSAudioCache(directory=str(tmp_path), max_bytes=1000)
+    filename = _cache_file(writer, "hello", 10, age=0)
+    assert reader.lookup("hello", "alloy", "tts-1") == filename
+    assert reader.path_for(filename) == tmp_path / filename
+
+
+def test_evicts_least_recently_used_outside_grace_period(tmp_path):
+    cache = TTSAudioCache(directory=str(tmp_path), max_bytes=250, grace_seconds=60)
+    oldest = _cache_file(cache, "a", 100, age=600)
+    older = _cache_file(cache, "b", 100, age=500)
+    recent = _cache_file(cache, "c", 100, age=10)
+    # A hit moves "a" to the front of the LRU order
+    cache.lookup("a", "alloy", "tts-1")
+
+    assert cache._evict() == 1
+    assert cache.path_for(older) is None
+    assert cache.path_for(oldest) is not None
+    assert cache.path_for(recent) is not None
+
+
+def test_never_evicts_files_in_grace_period(tmp_path):
+    cache = TTSAudioCache(directory=str(tmp_path), max_bytes=50, grace_seconds=60)
+    first = _cache_file(cache, "a", 100, age=30)
+    second = _cache_file(cache, "b", 100, age=0)
+    assert cache._evict() == 0
+    assert cache.path_for(first) is not None and cache.path_for(second) is not None
+    assert cache.stats()["bytes"] == 200
+
+
+def test_path_for_rejects_names_outside_the_cache(tmp_path):
+    cache = TTSAudioCache(directory=str(tmp_path))
+    (tmp_path / "notes.txt").write_text("x")
+    assert cache.path_for("notes.txt") is None
+    assert cache.path_for("../" + "0" * 64 + ".mp3") is None
@@ -0,0 +1,239 @@
+"""Streaming text chunker with sentence-aware cuts, overlap and source positions
+
+Pages are pushed in order and chunks come out as soon as no later text can
+change them. Each chunk carries its character offsets in the normalized
+document (pages whitespace-collapsed and joined with a single space) and the
+pages it spans, so stored chunks can cite their source page.
+
+The work is linear in the input: every page is scanned once for sentence
+and word boundaries, boundaries are consumed from the front as chunks are
+cut, and the buffer is compacted only once its consumed prefix outweighs
+the rest. Every cut moves the chunk start forward, whatever the text.
+"""
+import re
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass
+from typing import Iterable, Iterator, List, Optional
+from services.tokens import TOKEN_ESTIMATE_CHARS, get_encoding
+
+CHUNK_UNITS = ("chars", "tokens")
+
+# Sentence end: terminal punctuation, optional closing quotes/brackets, then whitespace or end of page
+_SENTENCE_END = re.compile(r'[.!?]+["\')\]]*(?=\s|$)')
+_WHITESPACE = re.compile(r'\s+')
+
+
+@dataclass(slots=True)
+class Chunk:
+    text: str
+    index: int
+    # Character offsets [char_start, char_end) in the normalized document text
+    char_start: int
+    char_end: int
+    # 1-based page numbers of the first and last character
+    page_start: int
+    page_end: int
+
+
+class _Positions:
+    """Sorted absolute offsets, appended in order and consumed from the front"""
+
+    def __init__(self):
+        self.items: List[int] = []
+        self.head = 0
+
+    def extend(self, offsets: Iterable[int]):
+        self.items.extend(offsets)
+
+    def last_in(self, low: int, high: int) -> Optional[int]:
+        """Largest offset in (low, high], if any"""
+        i = bisect_right(self.items, high, self.head) - 1
+        if i >= self.head and self.items[i] > low:
+            return self.items[i]
+        return None
+
+    def index_at(self, offset: int) -> int:
+        """Index of the first offset >= `offset`"""
+        return bisect_left(self.items, offset, self.head)
+
+    def drop_before(self, offset: int):
+        self.head = self.index_at(offset)
+        if self.head > 1024 and self.head * 2 > len(self.items):
+            del self.items[:self.head]
+            self.head = 0
+
+
+class Chunker:
+    """Push pages in order, get finished chunks back
+
+    `chunk_size` and `overlap` are counted in `unit`: characters, or tokens
+    of the LLM tokenizer (estimated from characters when it is unavailable).
+    A chunk ends at the last sentence end in its window, else the last word
+    break, else the window end; breaks in the first half of the window are
+    not used, so chunks do not shrink to a sentence fragment. The next chunk
+    starts `overlap` units before the previous end, at a word start, but
+    always after the previous chunk's start. Pages are tokenized separately,
+    so a chunk spanning a page break may be a token over its size.
+    """
+
+    def __init__(self, chunk_size: int = 1000, overlap: int = 200, unit: str = "chars"):
+        if unit not in CHUNK_UNITS:
+            raise ValueError(f"unit must be one of {CHUNK_UNITS}")
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be positive")
+        self.encoding = get_encoding() if unit == "tokens" else None
+        if unit == "tokens" and self.encoding is None:
+            # No tokenizer: size in estimated characters per token instead
+            chunk_size *= TOKEN_ESTIMATE_CHARS
+            overlap *= TOKEN_ESTIMATE_CHARS
+        self.chunk_size = chunk_size
+        self.overlap = max(0, min(overlap, chunk_size - 1))
+        self.unit = unit
+
+        self._buffer = ""
+        self._base = 0          # absolute offset of _buffer[0]
+        self._length = 0        # absolute offset of the end of the text pushed so far
+        self._start = 0         # absolute offset where the next chunk starts
+        self._index = 0
+        self._pages = 0
+        self._sentence_ends = _Positions()
+        self._word_breaks = _Positions()
+        self._page_starts = _Positions()
+        self._page_numbers: List[int] = []
+        self._token_starts = _Positions() if self.encoding is not None else None
+
+    def push(self, page: str, page_number: Optional[int] = None) -> List[Chunk]:
+        """Add the next page of text and return the chunks it completes"""
+        self._pages += 1
+        page_number = page_number if page_number is not None else self._pages
+        page = _WHITESPACE.sub(" ", page).strip()
+        if not page:
+            return []
+        if self._length:
+            # Pages are joined with a space, which is also a word break
+            self._word_breaks.extend([self._length])
+            self._buffer += " "
+            self._length += 1
+        offset = self._length
+        self._buffer += page
+        self._length += len(page)
+
+        self._page_starts.extend([offset])
+        self._page_numbers.append(page_number)
+        self._sentence_ends.extend(offset + m.end() for m in _SENTENCE_END.finditer(page))
+        self._word_breaks.extend(offset + m.start() for m in re.finditer(" ", page))
+        if self._token_starts is not None:
+            _, token_offsets = self.encoding.decode_with_offsets(self.encoding.encode(page, disallowed_special=()))
+            self._token_starts.extend(offset + t for t in token_offsets)
+
+        chunks = []
+        while True:
+            limit = self._advance(self._start, self.chunk_size)
+            # A cut is final only once text beyond the window has arrived
+            if limit is None or limit >= self._length:
+                break
+            chunk = self._cut(limit)
+            if chunk:
+                chunks.append(chunk)
+        return chunks
+
+    def flush(self) -> List[Chunk]:
+        """Return the remaining chunks once all pages have been pushed"""
+        chunks = []
+        while self._start < self._length:
+            limit = self._advance(self._start, self.chunk_size)
+            if limit is None or limit >= self._length:
+                chunk = self._make_chunk(self._start, self._length)
+                if chunk:
+                    chunks.append(chunk)
+                self._start = self._length
+                break
+            chunk = self._cut(limit)
+            if chunk:
+                chunks.append(chunk)
+        return chunks
+
+    def _advance(self, offset: int, units: int) -> Optional[int]:
+        """Absolute offset `units` units after `offset`, or None past the known text"""
+        if self._token_starts is None:
+            return offset + units
+        i = self._token_starts.index_at(offset) + units
+        items = self._token_starts.items
+        return items[i] if i < len(items) else None
+
+    def _retreat(self, offset: int, units: int) -> int:
+        """Absolute offset `units` units before `offset`"""
+        if self._token_starts is None:
+            return offset - units
+        i = max(self._token_starts.index_at(offset) - units, self._token_starts.head)
+        items = self._token_starts.items
+        return items[i] if i < len(items) else offset
+
+    def _cut(self, limit: int) -> Optional[Chunk]:
+        start = self._start
+        # Do not cut in the first half of the window (and never at or before start)
+        low = start + (limit - start) // 2
+        end = self._sentence_ends.last_in(low, limit)
+        if end is None:
+            end = self._word_breaks.last_in(low, limit)
+        if end is None:
+            end = limit
+        chunk = self._make_chunk(start, end)
+
+        next_start = max(self._retreat(end, self.overlap), start + 1) if self.overlap else end
+        # Begin the overlap at a word start rather than mid-word
+        if next_start < end and self._buffer[next_start - 1 - self._base] != " ":
+            i = self._word_breaks.index_at(next_start)
+            breaks = self._word_breaks.items
+            next_start = breaks[i] + 1 if i < len(breaks) and breaks[i] + 1 < end else end
+        # Whitespace is collapsed, so at most one space to step over
+        if next_start < self._length and self._buffer[next_start - self._base] == " ":
+            next_start += 1
+        self._start = next_start
+        self._release(next_start)
+        return chunk
+
+    def _make_chunk(self, start: int, end: int) -> Optional[Chunk]:
+        raw = self._buffer[start - self._base:end - self._base]
+        text = raw.strip()
+        if not text:
+            return None
+        char_start = start + (len(raw) - len(raw.lstrip()))
+        char_end = char_start + len(text)
+        chunk = Chunk(
+            text=text,
+            index=self._index,
+            char_start=char_start,
+            char_end=char_end,
+            page_start=self._page_at(char_start),
+            page_end=self._page_at(char_end - 1)
+        )
+        self._index += 1
+        return chunk
+
+    def _page_at(self, offset: int) -> int:
+        i = bisect_right(self._page_starts.items, offset, self._page_starts.head) - 1
+        return self._page_numbers[max(i, self._page_starts.head)]
+
+    def _release(self, offset: int):
+        """Forget text and boundaries before `offset`; no later chunk can reach them"""
+        self._sentence_ends.drop_before(offset)
+        self._word_breaks.drop_before(offset)
+        if self._token_starts is not None:
+            self._token_starts.drop_before(offset)
+        # Keep the page containing `offset`
+        keep = max(bisect_right(self._page_starts.items, offset, self._page_starts.head) - 1, 0)
+        if keep > self._page_starts.head:
+            self._page_starts.head = keep
+        consumed = offset - self._base
+        if consumed > 4096 and consumed * 2 > len(self._buffer):
+            self._buffer = self._buffer[consumed:]
+            self._base = offset
+
+
+def iter_chunks(pages: Iterable[str], chunk_size: int = 1000, overlap: int = 200, unit: str = "chars") -> Iterator[Chunk]:
+    """Lazily split a stream of page texts into overlapping chunks"""
+    chunker = Chunker(chunk_size=chunk_size, overlap=overlap, unit=unit)
+    for page in pages:
+        yield from chunker.push(page)
+    yield from chunker.flush()
@@ -0,0 +1,174 @@
+import os
+import asyncio
+import logging
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from fastapi import HTTPException, UploadFile
+from vectordb_files.chunker import Chunk, Chunker
+from vectordb_files.pre_pocess import (
+    chunk_pages, count_pdf_pages, extract_pdf_page_range, iter_pdf_pages, iter_text_chunks
+)
+
+logger = logging.getLogger(__name__)
+
+# Size of each read when spooling an upload to disk
+UPLOAD_READ_SIZE = int(os.getenv("UPLOAD_READ_SIZE", str(1024 * 1024)))
+
+# PDF parsing/chunking worker processes (0 keeps the work on a thread in this process)
+PDF_PROCESS_WORKERS = int(os.getenv("PDF_PROCESS_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Pages handed to a worker per task when a document is split by page range
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "16"))
+
+_process_pool: Optional[ProcessPoolExecutor] = None
+
+
+def get_process_pool() -> Optional[ProcessPoolExecutor]:
+    """Return the shared PDF worker pool, creating it on first use"""
+    global _process_pool
+    if PDF_PROCESS_WORKERS <= 0:
+        return None
+    if _process_pool is None:
+        _process_pool = ProcessPoolExecutor(max_workers=PDF_PROCESS_WORKERS)
+        logger.info(f"Started PDF process pool with {PDF_PROCESS_WORKERS} workers")
+    return _process_pool
+
+
+def shutdown_process_pool():
+    """Stop the PDF worker pool, if it was started"""
+    global _process_pool
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=False, cancel_futures=True)
+        _process_pool = None
+
+
+async def _run_in_pool(func, *args):
+    """Run a CPU-bound function in the worker pool, or a thread if the pool is disabled"""
+    pool = get_process_pool()
+    if pool is None:
+        return await asyncio.to_thread(func, *args)
+    return await asyncio.get_running_loop().run_in_executor(pool, func, *args)
+
+
+def _page_ranges(page_count: int) -> List[Tuple[int, int]]:
+    step = max(1, PDF_PAGES_PER_TASK)
+    return [(start, min(start + step, page_count)) for start in range(0, page_count, step)]
+
+
+async def _count_pages(pdf_path: str) -> int:
+    try:
+        return await _run_in_pool(count_pdf_pages, pdf_path)
+    except Exception as e:
+        logger.error(f"Error reading PDF: {e}")
+        raise HTTPException(status_code=400, detail=f"Failed to extract text from PDF: {str(e)}")
+
+
+async def spool_upload_to_tempfile(file: UploadFile) -> Tuple[str, int]:
+    """Copy an upload to a temp file in fixed-size reads, returning its path and size"""
+    spool = tempfile.NamedTemporaryFile(prefix="upload_", suffix=".pdf", delete=False)
+    size = 0
+    try:
+        with spool:
+            while True:
+                block = await file.read(UPLOAD_READ_SIZE)
+                if not block:
+                    break
+                spool.write(block)
+                size += len(block)
+    except Exception:
+        os.remove(spool.name)
+        raise
+    return spool.name, size
+
+
+async def extract_pages_in_pool(pdf_path: str, stats: Optional[Dict[str, int]] = None) -> List[str]:
+    """Extract a PDF's page texts by page range across the worker pool, in page order"""
+    page_count = await _count_pages(pdf_path)
+    try:
+        results = await asyncio.gather(*(
+            _run_in_pool(extract_pdf_page_range, pdf_path, start, end)
+            for start, end in _page_ranges(page_count)
+        ))
+    except Exception as e:
+        logger.error(f"Error extracting text from PDF: {e}")
+        raise HTTPException(status_code=400, detail=f"Failed to extract text from PDF: {str(e)}")
+    pages = [page for pages in results for page in pages]
+    if stats is not None:
+        stats["pages"] = page_count
+        stats["characters"] = sum(len(page) for page in pages)
+    return pages
+
+
+async def extract_text_in_pool(pdf_path: str, stats: Optional[Dict[str, int]] = None) -> str:
+    """Extract a PDF's text by page range across the worker pool, merged in page order"""
+    return "\n".join(await extract_pages_in_pool(pdf_path, stats)).strip()
+
+
+async def chunk_pages_in_thread(pages: List[str], chunk_size: int = 1000, overlap: int = 200, unit: str = "chars") -> List[Chunk]:
+    """Run chunk_pages on a thread, with this process's tokenizer like stream_pdf_chunks"""
+    return await asyncio.to_thread(chunk_pages, pages, chunk_size, overlap, unit)
+
+
+def _push_pages(chunker: Chunker, pages: List[str]) -> List[Chunk]:
+    return [chunk for page in pages for chunk in chunker.push(page)]
+
+
+async def stream_pdf_chunks(
+    pdf_path: str,
+    chunk_size: int = 1000,
+    overlap: int = 200,
+    stats: Optional[Dict[str, int]] = None,
+    unit: str = "chars"
+) -> AsyncIterator[Chunk]:
+    """Yield chunks of a PDF on disk while later pages are still being parsed
+
+    Page ranges are extracted by the worker pool, a bounded window ahead of
+    the consumer, and handed in page order to one Chunker on a thread, so
+    overlap carries across range boundaries and tokenizing stays off the
+    event loop. Without a pool, pages are read and chunked lazily on a thread.
+    """
+    if get_process_pool() is None:
+        chunks = iter_text_chunks(iter_pdf_pages(pdf_path, stats), chunk_size=chunk_size, overlap=overlap, unit=unit)
+        try:
+            while True:
+                chunk = await asyncio.to_thread(next, chunks, None)
+                if chunk is None:
+                    break
+                yield chunk
+        finally:
+            chunks.close()
+        return
+
+    page_count = await _count_pages(pdf_path)
+    ranges = iter(_page_ranges(page_count))
+    window = []
+    chunker = Chunker(chunk_size=chunk_size, overlap=overlap, unit=unit)
+    try:
+        # Keep every worker busy, but never parse more than two ranges per worker ahead
+        for start, end in ranges:
+            window.append(asyncio.ensure_future(_run_in_pool(extract_pdf_page_range, pdf_path, start, end)))
+            if len(window) >= 2 * PDF_PROCESS_WORKERS:
+                break
+
+        while window:
+            try:
+                pages = await window.pop(0)
+            except Exception as e:
+                logger.error(f"Error extracting text from PDF: {e}")
+                raise HTTPException(status_code=400, detail=f"Failed to extract text from PDF: {str(e)}")
+            next_range = next(ranges, None)
+            if next_range is not None:
+                window.append(asyncio.ensure_future(_run_in_pool(extract_pdf_page_range, pdf_path, *next_range)))
+
+            if stats is not None:
+                stats["pages"] = stats.get("pages", 0) + len(pages)
+                stats["characters"] = stats.get("characters", 0) + sum(len(page) for page in pages)
+            # One batch at a time, so the chunker is never used by two threads at once
+            for chunk in await asyncio.to_thread(_push_pages, chunker, pages):
+                yield chunk
+
+        for chunk in await asyncio.to_thread(chunker.flush):
+            yield chunk
+    finally:
+        for future in window:
+            future.cancel()
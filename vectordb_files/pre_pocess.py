@@ -1,14 +1,16 @@
 from fastapi import FastAPI, Request, HTTPException, File, UploadFile, Form
 import httpx
 import os
-from typing import Dict, Any, List
+import time
+import asyncio
+from typing import Dict, Any, List, Iterable, Iterator, AsyncIterable, AsyncIterator, Union
 import logging
 import PyPDF2
 import io
-from qdrant_client import QdrantClient
-from qdrant_client.models import Distance, VectorParams, PointStruct
+from qdrant_client.models import PointStruct
 from langchain_openai.embeddings import OpenAIEmbeddings
 import uuid
+import hashlib
 from datetime import datetime
 import re 
 from typing import Optional, Dict, Any
@@ -16,6 +18,12 @@ import logging
 from openai import OpenAI
 from dotenv import load_dotenv
 from pathlib import Path
+from services.llm_service import generate_text, stream_llm_tokens, stream_sentences
+from services.cache import TTLCache
+from services.answer_cache import answer_cache
+from services.tokens import count_tokens, count_message_tokens, truncate_to_tokens
+from vectordb_files.vector_store import create_vector_store, COLLECTION_NAME
+from vectordb_files.chunker import Chunk, iter_chunks
 load_dotenv()  # Load variables from .env
 openai_api_key = os.getenv("OPENAI_API_KEY")
 
@@ -26,168 +34,372 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
-QDRANT_HOST = os.getenv("QDRANT_HOST", "localhost")
-QDRANT_PORT = int(os.getenv("QDRANT_PORT", "6333"))
-COLLECTION_NAME = "task_pdf_documents"
-
-# Initialize Qdrant client
-qdrant_client = QdrantClient(host=QDRANT_HOST, port=QDRANT_PORT)
+# Vector index (Qdrant or the in-process local store, see VECTOR_STORE_BACKEND)
+vector_store = create_vector_store()
 
 # Initialize sentence transformer for embeddings
 embedding_model = OpenAIEmbeddings(model= 'text-embedding-ada-002',api_key=openai_api_key)
 
+# Query embeddings keyed on (model, normalized query); callers repeat the same questions
+QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "2048"))
+QUERY_EMBEDDING_CACHE_TTL = float(os.getenv("QUERY_EMBEDDING_CACHE_TTL", "86400"))
+query_embedding_cache = TTLCache(max_size=QUERY_EMBEDDING_CACHE_SIZE, ttl_seconds=QUERY_EMBEDDING_CACHE_TTL)
+
+# Ingestion tuning: chunks per embedding request, embedding requests in flight, points per upsert
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+EMBEDDING_MAX_CONCURRENCY = int(os.getenv("EMBEDDING_MAX_CONCURRENCY", "4"))
+QDRANT_UPSERT_BATCH_SIZE = int(os.getenv("QDRANT_UPSERT_BATCH_SIZE", "256"))
+
+# Context assembly: token budget, most chunks used, candidates fetched per used chunk,
+# relevance floor, and the drop-off (relative to the best score, or between
+# neighbouring scores) past which retrieved chunks are not used
+RAG_CONTEXT_MAX_TOKENS = int(os.getenv("RAG_CONTEXT_MAX_TOKENS", "1200"))
+RAG_MAX_CHUNKS = int(os.getenv("RAG_MAX_CHUNKS", "5"))
+RAG_CANDIDATE_MULTIPLIER = int(os.getenv("RAG_CANDIDATE_MULTIPLIER", "2"))
+RAG_SCORE_THRESHOLD = float(os.getenv("RAG_SCORE_THRESHOLD", "0.2"))
+RAG_RELATIVE_SCORE_CUTOFF = float(os.getenv("RAG_RELATIVE_SCORE_CUTOFF", "0.85"))
+RAG_SCORE_GAP = float(os.getenv("RAG_SCORE_GAP", "0.08"))
+# Share of word 5-grams two chunks of one document may have in common before the lower-ranked one is dropped
+RAG_DUPLICATE_OVERLAP = float(os.getenv("RAG_DUPLICATE_OVERLAP", "0.6"))
+
+# Chunks arrive as plain strings or as Chunk objects carrying source positions
+ChunkLike = Union[str, Chunk]
+
 # Initialize FastAPI app
 
 
 
 async def initialize_qdrant():
-    """Initialize Qdrant collection if it doesn't exist"""
+    """Initialize the vector store collection if it doesn't exist"""
     try:
-        # Check if collection exists
-        collections = qdrant_client.get_collections()
-        collection_exists = any(col.name == COLLECTION_NAME for col in collections.collections)
-        
-        if not collection_exists:
-            # Create collection with vector configuration for OpenAI ada-002 (1536 dimensions)
-            qdrant_client.create_collection(
-                collection_name=COLLECTION_NAME,
-                vectors_config=VectorParams(size=1536, distance=Distance.COSINE),
-            )
-            logger.info(f"Created Qdrant collection: {COLLECTION_NAME}")
-        else:
-            logger.info(f"Qdrant collection {COLLECTION_NAME} already exists")
-            
+        await vector_store.ensure_collection()
     except Exception as e:
-        logger.error(f"Error initializing Qdrant: {e}")
+        logger.error(f"Error initializing vector store: {e}")
         raise e
 
+async def vector_store_health() -> Dict[str, Any]:
+    """Report vector store reachability and backend/transport details"""
+    return await vector_store.health()
+
 def extract_text_from_pdf(pdf_file: bytes) -> str:
     """Extract text from PDF file"""
     try:
         pdf_reader = PyPDF2.PdfReader(io.BytesIO(pdf_file))
-        text = ""
-        
-        for page in pdf_reader.pages:
-            text += page.extract_text() + "\n"
-            
+        text = "\n".join(page.extract_text() for page in pdf_reader.pages)
         return text.strip()
     except Exception as e:
         logger.error(f"Error extracting text from PDF: {e}")
         raise HTTPException(status_code=400, detail=f"Failed to extract text from PDF: {str(e)}")
 
-def chunk_text(text: str, chunk_size: int = 1000, overlap: int = 200) -> List[str]:
+def iter_pdf_pages(pdf_path: str, stats: Optional[Dict[str, int]] = None) -> Iterator[str]:
+    """Lazily extract text from a PDF file on disk, one page at a time"""
+    try:
+        with open(pdf_path, "rb") as pdf_file:
+            pdf_reader = PyPDF2.PdfReader(pdf_file)
+            for page in pdf_reader.pages:
+                page_text = page.extract_text() or ""
+                if stats is not None:
+                    stats["pages"] = stats.get("pages", 0) + 1
+                    stats["characters"] = stats.get("characters", 0) + len(page_text)
+                yield page_text
+    except Exception as e:
+        logger.error(f"Error extracting text from PDF: {e}")
+        raise HTTPException(status_code=400, detail=f"Failed to extract text from PDF: {str(e)}")
+
+def chunk_text(text: str, chunk_size: int = 1000, overlap: int = 200, unit: str = "chars") -> List[str]:
     """Split text into overlapping chunks"""
-    if not text:
-        return []
-    
-    # Clean and normalize text
-    text = re.sub(r'\s+', ' ', text).strip()
-    
-    chunks = []
-    start = 0
-    
-    while start < len(text):
-        end = start + chunk_size
-        
-        # If we're not at the end, try to break at a sentence or word boundary
-        if end < len(text):
-            # Look for sentence boundary (. ! ?)
-            sentence_end = text.rfind('.', start, end)
-            if sentence_end == -1:
-                sentence_end = text.rfind('!', start, end)
-            if sentence_end == -1:
-                sentence_end = text.rfind('?', start, end)
-            
-            # If no sentence boundary, look for word boundary
-            if sentence_end == -1:
-                word_end = text.rfind(' ', start, end)
-                if word_end != -1:
-                    end = word_end
-            else:
-                end = sentence_end + 1
-        
-        chunk = text[start:end].strip()
-        if chunk:
-            chunks.append(chunk)
-        
-        # Move start position with overlap
-        start = end - overlap
-        if start < 0:
-            start = end
-            
-    return chunks
-
-async def store_chunks_in_qdrant(chunks: List[str], username: str, filename: str) -> Dict[str, Any]:
-    """Store text chunks in Qdrant with metadata"""
+    return [chunk.text for chunk in iter_chunks([text], chunk_size=chunk_size, overlap=overlap, unit=unit)]
+
+def chunk_pages(pages: List[str], chunk_size: int = 1000, overlap: int = 200, unit: str = "chars") -> List[Chunk]:
+    """Split a document's page texts into overlapping chunks with offsets and page numbers
+
+    Module-level so it can be shipped to a process pool worker.
+    """
+    return list(iter_chunks(pages, chunk_size=chunk_size, overlap=overlap, unit=unit))
+
+def iter_text_chunks(pages: Iterable[str], chunk_size: int = 1000, overlap: int = 200, unit: str = "chars") -> Iterator[Chunk]:
+    """Incrementally split a stream of page texts into overlapping chunks"""
+    return iter_chunks(pages, chunk_size=chunk_size, overlap=overlap, unit=unit)
+
+def count_pdf_pages(pdf_path: str) -> int:
+    """Return the number of pages in a PDF file on disk"""
+    with open(pdf_path, "rb") as pdf_file:
+        return len(PyPDF2.PdfReader(pdf_file).pages)
+
+def extract_pdf_page_range(pdf_path: str, start: int, end: int) -> List[str]:
+    """Extract the text of pages [start, end) from a PDF file on disk
+
+    Module-level so it can be shipped to a process pool worker.
+    """
+    with open(pdf_path, "rb") as pdf_file:
+        pdf_reader = PyPDF2.PdfReader(pdf_file)
+        return [(pdf_reader.pages[i].extract_text() or "") for i in range(start, end)]
+
+async def _aiter_chunks(chunks: Union[Iterable[ChunkLike], AsyncIterable[ChunkLike]]) -> AsyncIterator[ChunkLike]:
+    """Iterate a list or an async stream of chunks uniformly"""
+    if hasattr(chunks, "__aiter__"):
+        async for chunk in chunks:
+            yield chunk
+    else:
+        for chunk in chunks:
+            yield chunk
+
+def document_id_for(username: str, filename: str) -> str:
+    """Stable document ID, so re-uploads of the same file map to the same document"""
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"{username}/{filename}"))
+
+
+def _chunk_point_id(document_id: str, content_hash: str, occurrence: int) -> str:
+    """Point ID derived from chunk content, so unchanged chunks keep their ID"""
+    return str(uuid.uuid5(uuid.UUID(document_id), f"{content_hash}:{occurrence}"))
+
+
+def _chunk_positions(chunk: ChunkLike, i: int) -> Dict[str, Any]:
+    """Payload fields that locate a chunk in its document"""
+    if isinstance(chunk, str):
+        return {"chunk_index": i}
+    return {
+        "chunk_index": i,
+        "char_start": chunk.char_start,
+        "char_end": chunk.char_end,
+        "page_start": chunk.page_start,
+        "page_end": chunk.page_end
+    }
+
+
+async def store_chunks_in_qdrant(
+    chunks: Union[List[ChunkLike], AsyncIterable[ChunkLike]],
+    username: str,
+    filename: str,
+    batch_size: int = None,
+    max_concurrency: int = None,
+    upsert_batch_size: int = None
+) -> Dict[str, Any]:
+    """Store text chunks in the vector store with metadata
+
+    Re-uploads of the same username+filename update the existing document in
+    place: chunks whose content hash is already stored are kept (only their
+    position is refreshed), new or changed chunks are embedded, and chunks
+    no longer present are deleted. Chunks given as `Chunk` objects also store
+    their character offsets and page numbers for citations.
+
+    New chunks are embedded in batches with a bounded number of embedding
+    requests in flight, and points are upserted in fixed-size batches as
+    embeddings return. `chunks` may be a list or an async stream; a stream is
+    only pulled from when an embedding slot is free, so memory stays bounded.
+
+    If storing fails (or is cancelled) before every chunk is written, the
+    points written by this call are deleted and moved positions restored,
+    so the previously stored version stays intact.
+    """
+    batch_size = max(1, batch_size or EMBEDDING_BATCH_SIZE)
+    max_concurrency = max(1, max_concurrency or EMBEDDING_MAX_CONCURRENCY)
+    upsert_batch_size = max(1, upsert_batch_size or QDRANT_UPSERT_BATCH_SIZE)
+    pending = set()
+    # Undo log for a failed run: new point IDs, and (ID, old positions) of reused points
+    written_ids: List[str] = []
+    moved: List[tuple] = []
+    complete = False
     try:
+        document_id = document_id_for(username, filename)
+        created_at = datetime.now().isoformat()
+        started = time.perf_counter()
+        existing = await vector_store.document_points(username, filename)
+        seen_ids = set()
+        occurrences = {}
+        new_chunks = []
+        reindexed = []
         points = []
-        document_id = str(uuid.uuid4())
-        
-        for i, chunk in enumerate(chunks):
-            # Generate embedding using OpenAI
-            embedding = await embedding_model.aembed_query(chunk)
-            
-            # Create point with metadata
-            point = PointStruct(
-                id=str(uuid.uuid4()),
-                vector=embedding,
-                payload={
-                    "text": chunk,
-                    "username": username,
-                    "filename": filename,
-                    "document_id": document_id,
-                    "chunk_index": i,
-                    "created_at": datetime.now().isoformat(),
-                    "chunk_length": len(chunk)
-                }
-            )
-            points.append(point)
-        
-        # Upload points to Qdrant
-        qdrant_client.upsert(
-            collection_name=COLLECTION_NAME,
-            points=points
-        )
-        
+        batch_timings = []
+        counts = {"chunks": 0, "embedded": 0, "reused": 0, "batches": 0, "upserts": 0}
+
+        async def embed_batch(batch_number: int, batch: List[tuple]):
+            batch_started = time.perf_counter()
+            embeddings = await embedding_model.aembed_documents([text for _, _, _, text in batch])
+            return batch_number, batch, embeddings, time.perf_counter() - batch_started
+
+        async def store_batch(batch_number: int, batch: List[tuple], embeddings, embed_seconds: float):
+            for (positions, point_id, content_hash, text), embedding in zip(batch, embeddings):
+                # Create point with metadata
+                points.append(PointStruct(
+                    id=point_id,
+                    vector=embedding,
+                    payload={
+                        "text": text,
+                        "username": username,
+                        "filename": filename,
+                        "document_id": document_id,
+                        **positions,
+                        "content_hash": content_hash,
+                        "created_at": created_at,
+                        "chunk_length": len(text)
+                    }
+                ))
+            counts["embedded"] += len(batch)
+
+            # Upload full batches to the vector store as soon as they are ready
+            upsert_started = time.perf_counter()
+            while len(points) >= upsert_batch_size:
+                written_ids.extend(point.id for point in points[:upsert_batch_size])
+                await vector_store.upsert(points[:upsert_batch_size])
+                del points[:upsert_batch_size]
+                counts["upserts"] += 1
+
+            timing = {
+                "batch": batch_number,
+                "chunks": len(batch),
+                "embed_seconds": round(embed_seconds, 3),
+                "upsert_seconds": round(time.perf_counter() - upsert_started, 3)
+            }
+            batch_timings.append(timing)
+            logger.info(f"Embedding batch {batch_number} for {filename}: {timing['chunks']} chunks, "
+                        f"embed {timing['embed_seconds']}s, upsert {timing['upsert_seconds']}s")
+
+        async def store_finished_batches():
+            nonlocal pending
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                await store_batch(*task.result())
+
+        async def schedule_new_chunks():
+            if len(pending) >= max_concurrency:
+                await store_finished_batches()
+            pending.add(asyncio.create_task(embed_batch(counts["batches"], list(new_chunks))))
+            counts["batches"] += 1
+            new_chunks.clear()
+
+        async def flush_reindexed():
+            if reindexed:
+                moved.extend((point_id, existing[point_id]) for point_id, _ in reindexed)
+                await vector_store.set_chunk_positions(username, list(reindexed))
+                reindexed.clear()
+
+        async for chunk in _aiter_chunks(chunks):
+            i = counts["chunks"]
+            counts["chunks"] += 1
+            text = chunk if isinstance(chunk, str) else chunk.text
+            positions = _chunk_positions(chunk, i)
+            content_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+            occurrence = occurrences.get(content_hash, 0)
+            occurrences[content_hash] = occurrence + 1
+            point_id = _chunk_point_id(document_id, content_hash, occurrence)
+            seen_ids.add(point_id)
+
+            if point_id in existing:
+                # Unchanged chunk: keep its vector, only refresh its position
+                counts["reused"] += 1
+                if existing[point_id] != positions:
+                    reindexed.append((point_id, positions))
+                    if len(reindexed) >= upsert_batch_size:
+                        await flush_reindexed()
+                continue
+
+            new_chunks.append((positions, point_id, content_hash, text))
+            if len(new_chunks) >= batch_size:
+                await schedule_new_chunks()
+
+        if new_chunks:
+            await schedule_new_chunks()
+        while pending:
+            await store_finished_batches()
+
+        if points:
+            written_ids.extend(point.id for point in points)
+            await vector_store.upsert(points)
+            counts["upserts"] += 1
+        await flush_reindexed()
+        # The new version is fully written; from here a failure only leaves stale points behind
+        complete = True
+
+        # Chunks that disappeared from the new version of the document (an
+        # unreadable re-upload leaves the stored version alone)
+        stale_ids = [point_id for point_id in existing if point_id not in seen_ids] if counts["chunks"] else []
+        for offset in range(0, len(stale_ids), upsert_batch_size):
+            await vector_store.delete(username, stale_ids[offset:offset + upsert_batch_size])
+
+        if existing:
+            logger.info(f"Re-indexed {filename} for {username}: {counts['reused']} reused, "
+                        f"{counts['embedded']} re-embedded, {len(stale_ids)} deleted")
+
+        batch_timings.sort(key=lambda timing: timing["batch"])
         return {
             "document_id": document_id,
-            "chunks_stored": len(chunks),
-            "total_points": len(points)
+            "chunks_stored": counts["chunks"],
+            "total_points": counts["chunks"],
+            "reused_chunks": counts["reused"],
+            "embedded_chunks": counts["embedded"],
+            "deleted_chunks": len(stale_ids),
+            "embedding_batches": len(batch_timings),
+            "upsert_batches": counts["upserts"],
+            "batch_size": batch_size,
+            "max_concurrency": max_concurrency,
+            "total_seconds": round(time.perf_counter() - started, 3),
+            "batch_timings": batch_timings
         }
-        
-    except Exception as e:
-        logger.error(f"Error storing chunks in Qdrant: {e}")
+
+    except BaseException as e:
+        # Includes cancellation, e.g. when the uploading client disconnects
+        for task in pending:
+            task.cancel()
+        if not complete:
+            await _discard_partial_store(username, filename, written_ids, moved, upsert_batch_size)
+        if isinstance(e, HTTPException) or not isinstance(e, Exception):
+            raise
+        logger.error(f"Error storing chunks in vector store: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to store chunks: {str(e)}")
 
 
-async def search_document_vector_db(query,username,limit,score_threshold):
-    """Search documents in Qdrant with optional username filtering"""
+async def _discard_partial_store(username: str, filename: str, written_ids: List[str], moved: List[tuple],
+                                 batch_size: int):
+    """Delete points written by an unfinished store_chunks_in_qdrant run and restore moved positions"""
+    try:
+        for offset in range(0, len(written_ids), batch_size):
+            await vector_store.delete(username, written_ids[offset:offset + batch_size])
+        if moved:
+            await vector_store.set_chunk_positions(username, moved)
+        if written_ids or moved:
+            logger.warning(f"Rolled back partial upload of {filename} for {username}: "
+                           f"{len(written_ids)} new points deleted, {len(moved)} positions restored")
+    except Exception as e:
+        logger.error(f"Failed to roll back partial upload of {filename} for {username}: {e}")
+
+
+def normalize_query(query: str) -> str:
+    """Lowercase and collapse whitespace so equivalent questions share cache entries"""
+    return " ".join(query.lower().split())
+
+
+async def embed_query_cached(query: str, timings: Optional[Dict[str, Any]] = None) -> List[float]:
+    """Embed a search query, reusing a cached vector for repeated questions
+
+    If `timings` is given it receives "embedding_seconds" only when the query
+    is actually embedded, so a turn records the embedding cost once.
+    """
+    key = (embedding_model.model, normalize_query(query))
+    embedding = query_embedding_cache.get(key)
+    if embedding is None:
+        started = time.perf_counter()
+        embedding = await embedding_model.aembed_query(key[1])
+        query_embedding_cache.set(key, embedding)
+        if timings is not None:
+            timings["embedding_seconds"] = round(time.perf_counter() - started, 3)
+    return embedding
+
+
+async def search_document_vector_db(query,username,limit,score_threshold,query_embedding=None):
+    """Search documents in the vector store with optional username filtering"""
     try:
         if not query or query.strip() == "":
             raise HTTPException(status_code=400, detail="Query is required")
         
-        # Generate query embedding using OpenAI
-        query_embedding = await embedding_model.aembed_query(query) #.strip()
-        
-        # Prepare search filter
-        search_filter = None
-        if username:
-            from qdrant_client.models import Filter, FieldCondition, MatchValue
-            search_filter = Filter(
-                must=[
-                    FieldCondition(
-                        key="username",
-                        match=MatchValue(value=username)
-                    )
-                ]
-            )
+        # Generate query embedding using OpenAI, unless the caller already has it
+        if query_embedding is None:
+            query_embedding = await embed_query_cached(query)
         
-        # Search in Qdrant  
-            # query_filter=search_filter,
-        search_results = qdrant_client.search(
-            collection_name=COLLECTION_NAME,
-            query_vector=query_embedding,
-            query_filter=search_filter,
+        # Search the vector store, filtered to the user's documents
+        search_results = await vector_store.search(
+            query_embedding,
+            username=username,
             limit=limit,
             score_threshold=score_threshold
         )
@@ -203,6 +415,8 @@ async def search_document_vector_db(query,username,limit,score_threshold):
                 "filename": result.payload.get("filename", ""),
                 "document_id": result.payload.get("document_id", ""),
                 "chunk_index": result.payload.get("chunk_index", 0),
+                "page_start": result.payload.get("page_start"),
+                "page_end": result.payload.get("page_end"),
                 "created_at": result.payload.get("created_at", "")
             })
         
@@ -219,12 +433,188 @@ async def search_document_vector_db(query,username,limit,score_threshold):
         raise HTTPException(status_code=500, detail=f"Search failed: {str(e)}")
     
 
+NO_RESULTS_ANSWER = "I apologize, but I couldn't find relevant information to answer your question. Could you please rephrase your question or provide more details? Our team is here to help you!"
+RAG_ERROR_ANSWER = "I apologize, but I'm experiencing technical difficulties at the moment. Please try again in a few moments, or feel free to contact our support team directly for immediate assistance."
+
+RAG_SYSTEM_PROMPT = """You are a confident, helpful assistant designed to answer customer questions clearly and concisely. 
+
+Your tone should be:
+- Friendly but direct
+- Human, not robotic
+- Focused on giving short, useful answers
+
+Rules:
+- DO NOT start answers with phrases like "Based on the context" or "According to the information provided"
+- Avoid unnecessary wrapping like "I'm happy to help" unless context demands it
+- If you don't have the info, say so briefly and clearly
+- If asked about a person, product, or feature, give the most relevant fact straight away
+- Assume you're chatting with a human—sound like one
+"""
+
+
+def _overlap_length(before: str, after: str, max_overlap: int) -> int:
+    """Length of the longest suffix of `before` that `after` starts with"""
+    for length in range(min(len(before), len(after), max_overlap), 0, -1):
+        if before.endswith(after[:length]):
+            return length
+    return 0
+
+
+def _shingles(text: str, size: int = 5) -> set:
+    words = text.lower().split()
+    return {" ".join(words[i:i + size]) for i in range(max(1, len(words) - size + 1))}
+
+
+def select_context_chunks(results: List[Dict[str, Any]], max_k: int) -> List[Dict[str, Any]]:
+    """Pick how many retrieved chunks to use from the score distribution
+
+    Results are taken best-first and the cut is made where relevance drops
+    off: at the first score below RAG_RELATIVE_SCORE_CUTOFF of the best
+    score, or after a gap of more than RAG_SCORE_GAP between neighbours.
+    Chunks that repeat text already selected from the same document are
+    skipped rather than counted.
+    """
+    selected = []
+    previous_score = None
+    for result in sorted(results, key=lambda r: r["score"], reverse=True):
+        if len(selected) >= max_k:
+            break
+        if selected and (
+            result["score"] < selected[0]["score"] * RAG_RELATIVE_SCORE_CUTOFF
+            or previous_score - result["score"] > RAG_SCORE_GAP
+        ):
+            break
+        previous_score = result["score"]
+        shingles = _shingles(result["text"])
+        if any(
+            chosen["document_id"] == result["document_id"]
+            and len(shingles & chosen["_shingles"]) >= RAG_DUPLICATE_OVERLAP * min(len(shingles), len(chosen["_shingles"]))
+            for chosen in selected
+        ):
+            continue
+        selected.append({**result, "_shingles": shingles})
+    for chosen in selected:
+        del chosen["_shingles"]
+    return selected
+
+
+def pack_context_chunks(selected: List[Dict[str, Any]], max_tokens: int, max_overlap: int = 400) -> List[Dict[str, Any]]:
+    """Fit selected chunks into a token budget, best-first
+
+    Adjacent chunks of the same document share their chunking overlap; it is
+    trimmed from the later chunk so that text is not paid for twice. Chunks
+    that do not fit are skipped so a smaller, lower-ranked one may still fit;
+    the best chunk is truncated rather than dropped.
+    """
+    packed = []
+    by_position = {}
+    remaining = max_tokens
+    for result in selected:
+        text = result["text"]
+        key = (result["document_id"], result["chunk_index"])
+        before = by_position.get((key[0], key[1] - 1))
+        if before is not None:
+            text = text[_overlap_length(before["text"], text, max_overlap):].strip()
+        after = by_position.get((key[0], key[1] + 1))
+        if after is not None:
+            overlap = _overlap_length(text, after["text"], max_overlap)
+            text = text[:len(text) - overlap].strip()
+        if not text:
+            continue
+        tokens = count_tokens(text)
+        if tokens > remaining:
+            if packed:
+                continue
+            text = truncate_to_tokens(text, remaining)
+            if text is None:
+                break
+            tokens = count_tokens(text)
+        packed.append({**result, "text": text, "tokens": tokens})
+        by_position[key] = result
+        remaining -= tokens
+    return packed
+
+
+async def _prepare_rag_context(
+    user_query: str,
+    username: str,
+    search_limit: int,
+    score_threshold: float,
+    max_context_tokens: int,
+    query_embedding: List[float] = None
+) -> Dict[str, Any]:
+    """Retrieve documents for a query and pack them into a token-budgeted context block"""
+    # Step 1: Retrieve candidates; extra ones leave room for dropped duplicates
+    search_started = time.perf_counter()
+    search_response = await search_document_vector_db(
+        query=user_query,
+        username=username,
+        limit=search_limit * RAG_CANDIDATE_MULTIPLIER,
+        score_threshold=score_threshold,
+        query_embedding=query_embedding
+    )
+    search_seconds = round(time.perf_counter() - search_started, 3)
+
+    # Step 2: Keep the chunks above the relevance drop-off and fit them in the budget
+    selected = select_context_chunks(search_response["results"], search_limit)
+    packed = pack_context_chunks(selected, max_context_tokens)
+
+    sources = [
+        {
+            "filename": result["filename"],
+            "document_id": result["document_id"],
+            "chunk_index": result["chunk_index"],
+            "page_start": result.get("page_start"),
+            "page_end": result.get("page_end"),
+            "score": round(result["score"], 3),
+            "created_at": result["created_at"]
+        }
+        for result in packed
+    ]
+    context_tokens = sum(result["tokens"] for result in packed)
+    logger.info(
+        f"RAG context for {username}: {len(packed)} of {len(search_response['results'])} retrieved chunks, "
+        f"{context_tokens}/{max_context_tokens} tokens"
+    )
+
+    return {
+        "results": search_response["results"],
+        "used_results": packed,
+        "context_chunks": [result["text"] for result in packed],
+        "sources": sources,
+        "context": "\n\n".join(result["text"] for result in packed),
+        "context_tokens": context_tokens,
+        "search_seconds": search_seconds
+    }
+
+
+def _log_prompt_tokens(messages: List[Dict[str, str]], username: str, rag_context: Dict[str, Any]) -> int:
+    prompt_tokens = count_message_tokens(messages)
+    logger.info(f"RAG prompt for {username}: {prompt_tokens} tokens ({rag_context['context_tokens']} context)")
+    return prompt_tokens
+
+
+def _build_rag_messages(context: str, user_query: str) -> List[Dict[str, str]]:
+    """Create the prompt for the LLM"""
+    user_prompt = f"""Context Information:
+{context}
+
+Customer Question: {user_query}
+
+Please provide a helpful and accurate answer based on the context above. If the context doesn't contain enough information to fully answer the question, please let the customer know politely and offer alternative assistance."""
+
+    return [
+        {"role": "system", "content": RAG_SYSTEM_PROMPT},
+        {"role": "user", "content": user_prompt}
+    ]
+
+
 async def rag_qna_chatbot(
     user_query: str,
     username: str = None,
-    search_limit: int = 5,
-    score_threshold: float = 0.2,
-    max_context_length: int = 4000,
+    search_limit: int = None,
+    score_threshold: float = None,
+    max_context_tokens: int = None,
     temperature: float = 0.3
 ) -> Dict[str, Any]:
     """
@@ -233,95 +623,52 @@ async def rag_qna_chatbot(
     Args:
         user_query: User's question
         username: Optional username for filtering documents
-        search_limit: Number of documents to retrieve
+        search_limit: Maximum number of chunks to use; fewer are used past a relevance drop-off
         score_threshold: Minimum similarity score for retrieved documents
-        max_context_length: Maximum characters for context
+        max_context_tokens: Token budget for the retrieved context
         temperature: OpenAI temperature setting
     
     Returns:
         Dict containing the answer, sources, and metadata
     """
+    search_limit = search_limit or RAG_MAX_CHUNKS
+    score_threshold = RAG_SCORE_THRESHOLD if score_threshold is None else score_threshold
+    max_context_tokens = max_context_tokens or RAG_CONTEXT_MAX_TOKENS
     try:
-        # Step 1: Retrieve relevant documents using your search function
-        search_response = await search_document_vector_db(
-            query=user_query,
-            username=username,
-            limit=search_limit,
-            score_threshold=score_threshold
+        started = time.perf_counter()
+        # Taken before retrieval: if the tenant's documents change meanwhile, this answer is not cached
+        cache_generation = answer_cache.generation(username)
+
+        # Near-identical questions from the same tenant reuse a cached answer
+        stage_timings = {}
+        query_embedding = await embed_query_cached(user_query, stage_timings)
+        cached = answer_cache.lookup(username, query_embedding)
+        if cached is not None:
+            return {**cached, "query": user_query, "timings": {**stage_timings, "answer_cache_hit": True}}
+
+        rag_context = await _prepare_rag_context(
+            user_query, username, search_limit, score_threshold, max_context_tokens,
+            query_embedding=query_embedding
         )
-        print('search_response',search_response)
-        if not search_response["results"]:
+        stage_timings["search_seconds"] = rag_context["search_seconds"]
+        results = rag_context["used_results"]
+        if not results:
             return {
                 "status": "success",
-                "answer": "I apologize, but I couldn't find relevant information to answer your question. Could you please rephrase your question or provide more details? Our team is here to help you!",
+                "answer": NO_RESULTS_ANSWER,
                 "sources": [],
                 "confidence": "low",
-                "query": user_query
+                "query": user_query,
+                "timings": {**stage_timings, "fallback": "no_results"}
             }
-        
-        # Step 2: Prepare context from retrieved documents
-        context_chunks = []
-        sources = []
-        total_context_length = 0
-        
-        for result in search_response["results"]:
-            chunk_text = result["text"]
-            
-            # Check if adding this chunk would exceed context limit
-            if total_context_length + len(chunk_text) > max_context_length:
-                break
-                
-            context_chunks.append(chunk_text)
-            total_context_length += len(chunk_text)
-            
-            # Track sources
-            source_info = {
-                "filename": result["filename"],
-                "document_id": result["document_id"],
-                "chunk_index": result["chunk_index"],
-                "score": round(result["score"], 3),
-                "created_at": result["created_at"]
-            }
-            sources.append(source_info)
-        
-        context = "\n\n".join(context_chunks)
-        
-        # Step 3: Create the prompt for the LLM
-        system_prompt = """You are a confident, helpful assistant designed to answer customer questions clearly and concisely. 
-
-Your tone should be:
-- Friendly but direct
-- Human, not robotic
-- Focused on giving short, useful answers
-
-Rules:
-- DO NOT start answers with phrases like "Based on the context" or "According to the information provided"
-- Avoid unnecessary wrapping like "I'm happy to help" unless context demands it
-- If you don't have the info, say so briefly and clearly
-- If asked about a person, product, or feature, give the most relevant fact straight away
-- Assume you're chatting with a human—sound like one
-"""
-
-        user_prompt = f"""Context Information:
-{context}
-
-Customer Question: {user_query}
 
-Please provide a helpful and accurate answer based on the context above. If the context doesn't contain enough information to fully answer the question, please let the customer know politely and offer alternative assistance."""
-
-
-        response = client.responses.create(
-            model="gpt-4.1",
-            input=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ]
-        )
-
-        answer = response.output_text
+        # Step 3: Generate the answer over the streaming API
+        messages = _build_rag_messages(rag_context["context"], user_query)
+        prompt_tokens = _log_prompt_tokens(messages, username, rag_context)
+        answer, timings = await generate_text(messages, temperature=temperature)
         
         # Step 5: Determine confidence based on search results
-        avg_score = sum(result["score"] for result in search_response["results"]) / len(search_response["results"])
+        avg_score = sum(result["score"] for result in results) / len(results)
         
         if avg_score >= 0.85:
             confidence = "high"
@@ -330,36 +677,102 @@ Please provide a helpful and accurate answer based on the context above. If the
         else:
             confidence = "low"
         
-        return {
+        result = {
             "status": "success",
             "answer": answer,
-            "sources": sources,
+            "sources": rag_context["sources"],
             "confidence": confidence,
             "query": user_query,
-            "total_sources_found": len(search_response["results"]),
-            "context_used": len(context_chunks),
-            "average_similarity_score": round(avg_score, 3)
+            "total_sources_found": len(rag_context["results"]),
+            "context_used": len(rag_context["context_chunks"]),
+            "context_tokens": rag_context["context_tokens"],
+            "prompt_tokens": prompt_tokens,
+            "average_similarity_score": round(avg_score, 3),
+            "timings": {**stage_timings, **timings}
         }
+        answer_cache.store(username, normalize_query(user_query), query_embedding, result,
+                           time.perf_counter() - started, generation=cache_generation)
+        return result
         
     except Exception as e:
         logger.error(f"Error in RAG Q&A: {e}")
         return {
             "status": "error",
-            "answer": "I apologize, but I'm experiencing technical difficulties at the moment. Please try again in a few moments, or feel free to contact our support team directly for immediate assistance.",
+            "answer": RAG_ERROR_ANSWER,
             "sources": [],
             "confidence": "error",
             "query": user_query,
-            "error": str(e)
+            "error": str(e),
+            "timings": {"fallback": "rag_error"}
         }
 
 
+async def rag_qna_stream(
+    user_query: str,
+    username: str = None,
+    search_limit: int = None,
+    score_threshold: float = None,
+    max_context_tokens: int = None,
+    temperature: float = 0.3,
+    timings: Optional[Dict[str, Any]] = None
+) -> AsyncIterator[str]:
+    """
+    Streaming variant of rag_qna_chatbot for the voice layer
+
+    Yields the answer as sentence-sized segments as soon as each one is
+    generated, so speech can start before the full answer is ready. If
+    `timings` is given it receives retrieval and generation stage times, the
+    prompt token count, and a "fallback" reason when no answer was generated.
+    """
+    if timings is None:
+        timings = {}
+    search_limit = search_limit or RAG_MAX_CHUNKS
+    score_threshold = RAG_SCORE_THRESHOLD if score_threshold is None else score_threshold
+    max_context_tokens = max_context_tokens or RAG_CONTEXT_MAX_TOKENS
+    try:
+        query_embedding = await embed_query_cached(user_query, timings)
+        cached = answer_cache.lookup(username, query_embedding)
+        if cached is None:
+            rag_context = await _prepare_rag_context(
+                user_query, username, search_limit, score_threshold, max_context_tokens,
+                query_embedding=query_embedding
+            )
+            timings["search_seconds"] = rag_context["search_seconds"]
+    except Exception as e:
+        logger.error(f"Error in RAG Q&A: {e}")
+        timings["fallback"] = "rag_error"
+        yield RAG_ERROR_ANSWER
+        return
+
+    if cached is not None:
+        timings["answer_cache_hit"] = True
+        yield cached["answer"]
+        return
+
+    if not rag_context["used_results"]:
+        timings["fallback"] = "no_results"
+        yield NO_RESULTS_ANSWER
+        return
+
+    messages = _build_rag_messages(rag_context["context"], user_query)
+    timings["prompt_tokens"] = _log_prompt_tokens(messages, username, rag_context)
+    tokens = stream_llm_tokens(messages, temperature=temperature, timings=timings)
+    try:
+        async for segment in stream_sentences(tokens):
+            yield segment
+    except Exception as e:
+        logger.error(f"Error streaming RAG answer: {e}")
+        timings["fallback"] = "rag_error"
+        yield RAG_ERROR_ANSWER
+
+
 # Alternative version with synchronous OpenAI (if you prefer sync)
 def rag_qna_chatbot_sync(
     user_query: str,
     username: str = None,
-    search_limit: int = 5,
+    search_limit: int = None,
     score_threshold: float = 0.7,
-    max_context_length: int = 4000,
+    max_context_tokens: int = None,
     temperature: float = 0.3
 ) -> Dict[str, Any]:
     """
@@ -374,7 +787,7 @@ def rag_qna_chatbot_sync(
         username=username,
         search_limit=search_limit,
         score_threshold=score_threshold,
-        max_context_length=max_context_length,
+        max_context_tokens=max_context_tokens,
         temperature=temperature
     ))
 
@@ -1,5 +1,11 @@
 from vectordb_files.pre_pocess import rag_qna_chatbot
+from services.tenant import DEFAULT_TENANT
+from services.tts_service import tts_cache
+from services.faq import faq_store
 import logging ,os 
+import shutil
+import asyncio
+from typing import Any, Dict, Optional
 from openai import OpenAI
 
 from dotenv import load_dotenv
@@ -20,33 +26,41 @@ stt_client = OpenAI(api_key=openai_api_key)
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-async def get_response_for_message(message_text: str) -> str:
-    """Get appropriate response from RAG chatbot"""
+async def get_response_for_message(message_text: str, tenant: str = None, timings: Optional[Dict[str, Any]] = None) -> str:
+    """Get appropriate response from the tenant's FAQ, or else the RAG chatbot over its documents
+
+    If `timings` is given it receives the FAQ and RAG stage timings and fallback reason.
+    """
     try:
+        tenant = tenant or DEFAULT_TENANT
         message_lower = message_text.lower().strip()
+        faq_store.log_query(tenant, message_lower)
+        faq = await faq_store.lookup(tenant, message_lower, timings=timings)
+        if faq is not None:
+            return faq["answer"]
         # Replace this with your actual RAG function
         answer = await rag_qna_chatbot(
         user_query=message_lower,
-        username="string"
+        username=tenant
         )
+        if timings is not None:
+            timings.update(answer.get("timings", {}))
         logger.info(f"\n\n\n>> Rag based Answer: {answer['answer']}\n\n\n")
         return answer['answer']
     except Exception as e:
         logger.error(f"Error getting RAG response: {e}")
+        if timings is not None:
+            timings["fallback"] = "rag_error"
         return "I'm sorry, I'm having trouble processing your request right now. Please try again."
 
-async def text_to_speech(text: str, output_path: str = "response.mp3") -> str:
-    """Convert text to speech using OpenAI TTS"""
+async def text_to_speech(text: str, output_path: str = None) -> str:
+    """Convert text to speech using OpenAI TTS, reusing cached audio for repeated text"""
     try:
-        response = stt_client.audio.speech.create(
-            model="tts-1",
-            voice="alloy",
-            input=text
-        )
-        
-        with open(output_path, "wb") as f:
-            f.write(response.content)
-        
+        filename = await tts_cache.synthesize(text)
+        cached_path = tts_cache.path_for(filename)
+        if output_path is None:
+            return str(cached_path)
+        await asyncio.to_thread(shutil.copyfile, cached_path, output_path)
         return output_path
     except Exception as e:
         logger.error(f"Error in text-to-speech: {e}")
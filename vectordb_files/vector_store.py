@@ -0,0 +1,555 @@
+import os
+import json
+import time
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+try:
+    import fcntl
+except ImportError:  # Windows: single-process development only
+    fcntl = None
+from qdrant_client import AsyncQdrantClient
+from qdrant_client.models import (
+    Distance, VectorParams, PointStruct, Filter, FieldCondition, MatchValue, PointIdsList,
+    SetPayload, SetPayloadOperation, KeywordIndexParams, KeywordIndexType, PayloadSchemaType
+)
+
+logger = logging.getLogger(__name__)
+
+# "qdrant" (networked) or "local" (in-process, memory-mapped)
+VECTOR_STORE_BACKEND = os.getenv("VECTOR_STORE_BACKEND", "qdrant").strip().lower()
+LOCAL_VECTOR_STORE_PATH = os.getenv("LOCAL_VECTOR_STORE_PATH", "vector_index")
+# OpenAI ada-002 embeddings
+VECTOR_SIZE = int(os.getenv("VECTOR_SIZE", "1536"))
+
+QDRANT_HOST = os.getenv("QDRANT_HOST", "localhost")
+QDRANT_PORT = int(os.getenv("QDRANT_PORT", "6333"))
+QDRANT_GRPC_PORT = int(os.getenv("QDRANT_GRPC_PORT", "6334"))
+# "http" (REST on QDRANT_PORT) or "grpc" (QDRANT_GRPC_PORT)
+QDRANT_TRANSPORT = os.getenv("QDRANT_TRANSPORT", "http").strip().lower()
+COLLECTION_NAME = "task_pdf_documents"
+# Tenants large enough to get a collection of their own (comma-separated)
+TENANT_DEDICATED_COLLECTIONS = {
+    tenant.strip() for tenant in os.getenv("TENANT_DEDICATED_COLLECTIONS", "").split(",") if tenant.strip()
+}
+
+
+# Payload fields that place a chunk in its document; refreshed when a re-upload reuses the chunk
+POSITION_FIELDS = ("chunk_index", "char_start", "char_end", "page_start", "page_end")
+
+
+def _positions(payload: Dict[str, Any]) -> Dict[str, Any]:
+    return {field: payload[field] for field in POSITION_FIELDS if field in payload}
+
+
+@dataclass
+class VectorHit:
+    """A search result, shaped like Qdrant's ScoredPoint"""
+    id: str
+    score: float
+    payload: Dict[str, Any]
+
+
+class VectorStore(ABC):
+    """Interface for the chunk index behind ingestion and retrieval
+
+    Points carry a `username` (the tenant) and `filename` in their payload;
+    searches can be restricted to one username. Per-document operations take
+    the username so backends can partition storage by tenant.
+    """
+
+    backend = "base"
+
+    @abstractmethod
+    async def ensure_collection(self):
+        """Create the index if it does not exist yet"""
+        pass
+
+    @abstractmethod
+    async def upsert(self, points: List[PointStruct]):
+        pass
+
+    @abstractmethod
+    async def search(self, vector: List[float], username: Optional[str], limit: int,
+                     score_threshold: Optional[float]) -> List[VectorHit]:
+        """Return the `limit` most cosine-similar points above `score_threshold`"""
+        pass
+
+    @abstractmethod
+    async def document_points(self, username: str, filename: str) -> Dict[str, Dict[str, Any]]:
+        """Map point ID -> position payload (POSITION_FIELDS) for every stored chunk of a user's file"""
+        pass
+
+    @abstractmethod
+    async def set_chunk_positions(self, username: str, updates: List[Tuple[str, Dict[str, Any]]]):
+        """Update the position payload of existing points"""
+        pass
+
+    @abstractmethod
+    async def delete(self, username: str, point_ids: List[str]):
+        pass
+
+    @abstractmethod
+    async def health(self) -> Dict[str, Any]:
+        pass
+
+    async def close(self):
+        pass
+
+
+class QdrantVectorStore(VectorStore):
+    """Vector store backed by a Qdrant server over HTTP or gRPC
+
+    Tenants share one collection with a tenant-aware keyword index on
+    `username`, except those listed in TENANT_DEDICATED_COLLECTIONS, which get
+    their own collection so their search cost does not grow with other tenants.
+    """
+
+    backend = "qdrant"
+
+    def __init__(self, client: AsyncQdrantClient, collection_name: str = COLLECTION_NAME,
+                 transport: str = QDRANT_TRANSPORT, dedicated_tenants=TENANT_DEDICATED_COLLECTIONS):
+        self.client = client
+        self.collection_name = collection_name
+        self.transport = "grpc" if transport == "grpc" else "http"
+        self.dedicated_tenants = set(dedicated_tenants)
+        self._ready = set()
+
+    def collection_for(self, username: Optional[str]) -> str:
+        if username and username in self.dedicated_tenants:
+            return f"{self.collection_name}__{username}"
+        return self.collection_name
+
+    async def _ensure(self, collection_name: str):
+        if collection_name in self._ready:
+            return
+        if not await self.client.collection_exists(collection_name):
+            await self.client.create_collection(
+                collection_name=collection_name,
+                vectors_config=VectorParams(size=VECTOR_SIZE, distance=Distance.COSINE),
+            )
+            logger.info(f"Created Qdrant collection: {collection_name}")
+        else:
+            logger.info(f"Qdrant collection {collection_name} already exists")
+
+        # Keyword indexes so tenant and document filters don't scan payloads
+        await self.client.create_payload_index(
+            collection_name=collection_name,
+            field_name="username",
+            field_schema=KeywordIndexParams(type=KeywordIndexType.KEYWORD, is_tenant=True)
+        )
+        await self.client.create_payload_index(
+            collection_name=collection_name,
+            field_name="filename",
+            field_schema=PayloadSchemaType.KEYWORD
+        )
+        self._ready.add(collection_name)
+
+    async def ensure_collection(self):
+        await self._ensure(self.collection_name)
+        for tenant in sorted(self.dedicated_tenants):
+            await self._ensure(self.collection_for(tenant))
+
+    async def upsert(self, points: List[PointStruct]):
+        by_collection: Dict[str, List[PointStruct]] = {}
+        for point in points:
+            by_collection.setdefault(self.collection_for((point.payload or {}).get("username")), []).append(point)
+        for collection_name, collection_points in by_collection.items():
+            await self._ensure(collection_name)
+            await self.client.upsert(collection_name=collection_name, points=collection_points)
+
+    async def search(self, vector, username, limit, score_threshold):
+        collection_name = self.collection_for(username)
+        search_filter = None
+        if username and collection_name == self.collection_name:
+            search_filter = Filter(must=[FieldCondition(key="username", match=MatchValue(value=username))])
+        response = await self.client.query_points(
+            collection_name=collection_name,
+            query=vector,
+            query_filter=search_filter,
+            limit=limit,
+            score_threshold=score_threshold
+        )
+        return response.points
+
+    async def document_points(self, username, filename):
+        collection_name = self.collection_for(username)
+        await self._ensure(collection_name)
+        existing = {}
+        offset = None
+        document_filter = Filter(must=[
+            FieldCondition(key="username", match=MatchValue(value=username)),
+            FieldCondition(key="filename", match=MatchValue(value=filename))
+        ])
+        while True:
+            records, offset = await self.client.scroll(
+                collection_name=collection_name,
+                scroll_filter=document_filter,
+                limit=256,
+                offset=offset,
+                with_payload=list(POSITION_FIELDS),
+                with_vectors=False
+            )
+            for record in records:
+                existing[str(record.id)] = _positions(record.payload)
+            if offset is None:
+                return existing
+
+    async def set_chunk_positions(self, username, updates):
+        if updates:
+            await self.client.batch_update_points(
+                collection_name=self.collection_for(username),
+                update_operations=[
+                    SetPayloadOperation(set_payload=SetPayload(payload=positions, points=[point_id]))
+                    for point_id, positions in updates
+                ]
+            )
+
+    async def delete(self, username, point_ids):
+        if point_ids:
+            await self.client.delete(
+                collection_name=self.collection_for(username),
+                points_selector=PointIdsList(points=point_ids)
+            )
+
+    async def health(self):
+        health = {
+            "backend": self.backend,
+            "transport": self.transport,
+            "host": QDRANT_HOST,
+            "port": QDRANT_GRPC_PORT if self.transport == "grpc" else QDRANT_PORT,
+            "collection": self.collection_name,
+            "dedicated_collections": [self.collection_for(tenant) for tenant in sorted(self.dedicated_tenants)]
+        }
+        try:
+            started = time.perf_counter()
+            health["collection_exists"] = await self.client.collection_exists(self.collection_name)
+            health["latency_ms"] = round((time.perf_counter() - started) * 1000, 1)
+            health["status"] = "healthy"
+        except Exception as e:
+            logger.error(f"Qdrant health check failed: {e}")
+            health["status"] = "unhealthy"
+            health["error"] = str(e)
+        return health
+
+    async def close(self):
+        await self.client.close()
+
+
+class LocalVectorStore(VectorStore):
+    """In-process vector store for small and medium knowledge bases
+
+    Vectors are unit-normalized float32 rows appended to one contiguous file
+    that is searched through a read-only memory map, so cosine top-k is a
+    single vectorized matrix-vector product; each row also carries a tenant
+    code, so username filtering is one vectorized mask. Point IDs and payloads
+    live in an append-only JSON-lines log. Upserts append new rows and
+    deletions append tombstones; neither rewrites existing data. Call
+    compact() to reclaim space from dead rows.
+
+    Several workers can share one directory: writes append under an exclusive
+    file lock, and each operation first replays whatever the log gained since
+    this process last read it (the whole log if it was compacted).
+    """
+
+    backend = "local"
+
+    def __init__(self, path: str = LOCAL_VECTOR_STORE_PATH, dim: int = VECTOR_SIZE):
+        self.path = path
+        self.dim = dim
+        self.vectors_path = os.path.join(path, "vectors.f32")
+        self.log_path = os.path.join(path, "points.jsonl")
+        self.lock_path = os.path.join(path, ".lock")
+        # Serializes syncing and writing within this process
+        self._lock = asyncio.Lock()
+        self._reset()
+        self._loaded = False
+
+    def _reset(self):
+        self._ids: List[Optional[str]] = []
+        self._payloads: List[Optional[Dict[str, Any]]] = []
+        self._rows: Dict[str, int] = {}
+        self._row_users: List[int] = []
+        self._user_codes: Dict[str, int] = {}
+        self._matrix = None
+        self._mask_cache = None
+        # Bytes of the log replayed so far, and its (inode, size) when last read
+        self._log_offset = 0
+        self._log_signature = None
+
+    def _log_state(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(self.log_path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_size
+
+    @contextmanager
+    def _file_lock(self, exclusive: bool):
+        """Directory-wide lock: shared to read the files, exclusive to change them"""
+        os.makedirs(self.path, exist_ok=True)
+        with open(self.lock_path, "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            yield
+
+    def _read_log(self, reset: bool = False) -> Dict[str, Any]:
+        """Log records not yet replayed by this process; call under the file lock
+
+        Starts over from the beginning when the log was replaced or truncated
+        by another process. Only complete lines are read, and reading stops
+        at a torn line or at a row whose vector never made it to disk.
+        """
+        state = self._log_state()
+        reset = (reset or not self._loaded or state is None or self._log_signature is None
+                 or state[0] != self._log_signature[0] or state[1] < self._log_offset)
+        offset = 0 if reset else self._log_offset
+        rows = 0 if reset else len(self._ids)
+        vector_rows = os.path.getsize(self.vectors_path) // (4 * self.dim) if os.path.exists(self.vectors_path) else 0
+        records = []
+        if state is not None:
+            with open(self.log_path, "rb") as log:
+                log.seek(offset)
+                for line in log:
+                    if not line.endswith(b"\n"):
+                        break
+                    if line.strip():
+                        try:
+                            record = json.loads(line)
+                        except json.JSONDecodeError:
+                            break
+                        if record["op"] == "add":
+                            if record["row"] != rows and not reset:
+                                # Rows are numbered in log order; this is a different log
+                                return self._read_log(reset=True)
+                            if record["row"] >= vector_rows:
+                                break
+                            rows += 1
+                        records.append(record)
+                    offset += len(line)
+        changes = {"reset": reset, "records": records, "offset": offset, "signature": state, "rows": rows}
+        if reset or rows != len(self._ids):
+            changes["matrix"] = self._map_vectors(rows)
+        return changes
+
+    def _map_vectors(self, rows: int):
+        # Mapped under the file lock, so the map always belongs to the log just read
+        return np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(rows, self.dim)) if rows else None
+
+    def _append(self, records: List[Dict[str, Any]], vectors: Optional[np.ndarray] = None) -> Dict[str, Any]:
+        """Replay the log, then append `records` (and the vectors of their add records)"""
+        with self._file_lock(exclusive=True):
+            changes = self._read_log()
+            rows = changes["rows"]
+            for offset, record in enumerate(records if vectors is not None else []):
+                record["row"] = rows + offset
+            # Drop what a crashed writer left past the last complete record
+            with open(self.vectors_path, "ab") as vector_file:
+                vector_file.truncate(rows * 4 * self.dim)
+                if vectors is not None:
+                    vector_file.write(vectors.tobytes())
+            data = "".join(json.dumps(record) + "\n" for record in records).encode("utf-8")
+            with open(self.log_path, "ab") as log:
+                log.truncate(changes["offset"])
+                log.write(data)
+            changes["records"].extend(records)
+            changes["offset"] += len(data)
+            changes["signature"] = self._log_state()
+            if vectors is not None:
+                changes["rows"] = rows + len(vectors)
+                changes["matrix"] = self._map_vectors(changes["rows"])
+            return changes
+
+    def _read_changes(self) -> Dict[str, Any]:
+        with self._file_lock(exclusive=False):
+            return self._read_log()
+
+    def _apply(self, changes: Dict[str, Any]):
+        if changes["reset"]:
+            self._reset()
+        for record in changes["records"]:
+            if record["op"] == "add":
+                self._add_row(record["id"], record["payload"] or {})
+            elif record["op"] == "delete":
+                self._delete_row(record["id"])
+            elif record["op"] == "set" and record["id"] in self._rows:
+                self._payloads[self._rows[record["id"]]].update(record["payload"])
+        if "matrix" in changes:
+            self._matrix = changes["matrix"]
+        self._log_offset = changes["offset"]
+        self._log_signature = changes["signature"]
+        if not self._loaded:
+            logger.info(f"Loaded local vector store {self.path}: {len(self._rows)} live points")
+        self._loaded = True
+
+    async def _sync(self):
+        """Catch up with records appended by any process since the last sync"""
+        if self._loaded and self._log_state() == self._log_signature:
+            return
+        async with self._lock:
+            self._apply(await asyncio.to_thread(self._read_changes))
+
+    async def _write(self, records: List[Dict[str, Any]], vectors: Optional[np.ndarray] = None):
+        async with self._lock:
+            self._apply(await asyncio.to_thread(self._append, records, vectors))
+
+    def _add_row(self, point_id: str, payload: Dict[str, Any]):
+        self._delete_row(point_id)
+        username = payload.get("username") or ""
+        code = self._user_codes.setdefault(username, len(self._user_codes))
+        self._rows[point_id] = len(self._ids)
+        self._ids.append(point_id)
+        self._payloads.append(payload)
+        self._row_users.append(code)
+        self._mask_cache = None
+
+    def _delete_row(self, point_id: str):
+        row = self._rows.pop(point_id, None)
+        if row is not None:
+            self._ids[row] = None
+            self._payloads[row] = None
+            self._mask_cache = None
+
+    def _arrays(self):
+        """Memory map and row masks, rebuilt only after writes"""
+        if self._mask_cache is None:
+            alive = np.fromiter((point_id is not None for point_id in self._ids), dtype=bool, count=len(self._ids))
+            users = np.asarray(self._row_users, dtype=np.int32)
+            self._mask_cache = (alive, users)
+        return self._matrix, self._mask_cache[0], self._mask_cache[1]
+
+    async def ensure_collection(self):
+        await self._sync()
+
+    async def upsert(self, points):
+        vectors = np.asarray([point.vector for point in points], dtype=np.float32).reshape(len(points), self.dim)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms == 0, 1, norms)
+        records = [{"op": "add", "id": str(point.id), "payload": dict(point.payload or {})} for point in points]
+        await self._write(records, vectors)
+
+    async def search(self, vector, username, limit, score_threshold):
+        await self._sync()
+        matrix, alive, users = self._arrays()
+        if matrix is None:
+            return []
+        query = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+        mask = alive
+        if username:
+            code = self._user_codes.get(username)
+            if code is None:
+                return []
+            mask = alive & (users == code)
+
+        def top_k():
+            rows = np.flatnonzero(mask)
+            if rows.size == 0:
+                return rows, rows
+            scores = matrix[rows] @ query if rows.size < matrix.shape[0] else matrix @ query
+            if score_threshold is not None:
+                keep = scores >= score_threshold
+                rows, scores = rows[keep], scores[keep]
+            if rows.size > limit:
+                best = np.argpartition(-scores, limit - 1)[:limit]
+                rows, scores = rows[best], scores[best]
+            order = np.argsort(-scores)
+            return rows[order], scores[order]
+
+        rows, scores = await asyncio.to_thread(top_k)
+        return [
+            VectorHit(id=self._ids[row], score=float(score), payload=self._payloads[row])
+            for row, score in zip(rows.tolist(), scores.tolist())
+            if self._ids[row] is not None
+        ]
+
+    async def document_points(self, username, filename):
+        await self._sync()
+        return {
+            point_id: _positions(self._payloads[row])
+            for point_id, row in self._rows.items()
+            if self._payloads[row].get("username") == username and self._payloads[row].get("filename") == filename
+        }
+
+    async def set_chunk_positions(self, username, updates):
+        await self._sync()
+        records = [{"op": "set", "id": point_id, "payload": positions}
+                   for point_id, positions in updates if point_id in self._rows]
+        if records:
+            await self._write(records)
+
+    async def delete(self, username, point_ids):
+        await self._sync()
+        records = [{"op": "delete", "id": point_id} for point_id in point_ids if point_id in self._rows]
+        if records:
+            await self._write(records)
+
+    def _compact_files(self) -> Optional[int]:
+        """Write the compacted files, or return None if the log changed since the last sync"""
+        with self._file_lock(exclusive=True):
+            if self._log_state() != self._log_signature:
+                return None
+            matrix, alive, _ = self._arrays()
+            dead = len(self._ids) - len(self._rows)
+            if matrix is None or dead == 0:
+                return 0
+            live_rows = np.flatnonzero(alive)
+            with open(self.vectors_path + ".tmp", "wb") as vector_file:
+                vector_file.write(np.ascontiguousarray(matrix[live_rows]).tobytes())
+            with open(self.log_path + ".tmp", "w") as log:
+                for new_row, row in enumerate(live_rows.tolist()):
+                    log.write(json.dumps({"op": "add", "row": new_row, "id": self._ids[row], "payload": self._payloads[row]}) + "\n")
+            os.replace(self.vectors_path + ".tmp", self.vectors_path)
+            os.replace(self.log_path + ".tmp", self.log_path)
+            return dead
+
+    async def compact(self) -> int:
+        """Rewrite the files with live rows only, returning how many dead rows were dropped"""
+        async with self._lock:
+            while True:
+                self._apply(await asyncio.to_thread(self._read_changes))
+                dead = await asyncio.to_thread(self._compact_files)
+                if dead is not None:
+                    break
+            if dead:
+                # The log was replaced, so the next read replays it from the start
+                self._apply(await asyncio.to_thread(self._read_changes))
+            return dead
+
+    async def health(self):
+        try:
+            await self._sync()
+            file_bytes = await asyncio.to_thread(
+                lambda: os.path.getsize(self.vectors_path) if os.path.exists(self.vectors_path) else 0
+            )
+            return {
+                "backend": self.backend,
+                "path": self.path,
+                "dimensions": self.dim,
+                "live_points": len(self._rows),
+                "stored_rows": len(self._ids),
+                "file_bytes": file_bytes,
+                "status": "healthy"
+            }
+        except Exception as e:
+            logger.error(f"Local vector store health check failed: {e}")
+            return {"backend": self.backend, "path": self.path, "status": "unhealthy", "error": str(e)}
+
+
+def create_vector_store() -> VectorStore:
+    """Build the vector store selected by VECTOR_STORE_BACKEND"""
+    if VECTOR_STORE_BACKEND == "local":
+        return LocalVectorStore(LOCAL_VECTOR_STORE_PATH, VECTOR_SIZE)
+    client = AsyncQdrantClient(
+        host=QDRANT_HOST,
+        port=QDRANT_PORT,
+        grpc_port=QDRANT_GRPC_PORT,
+        prefer_grpc=QDRANT_TRANSPORT == "grpc"
+    )
+    return QdrantVectorStore(client, COLLECTION_NAME, QDRANT_TRANSPORT)